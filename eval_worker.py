@@ -0,0 +1,210 @@
+"""
+评测节点
+从数据库评测队列（evaluation_queue）领取学生评测、在独立子进程中执行，并把成绩写回数据库。
+Web服务以 EVAL_EXECUTION_MODE=queue 运行时，评测全部由评测节点执行；
+同一台机器或多台机器上可以同时运行任意数量的评测节点，各节点需要以相同路径访问实验目录（lab*）。
+
+用法:
+    python eval_worker.py --slots 4
+    python eval_worker.py --slots 2 --worker-id gpu-node-1
+"""
+import os
+import time
+import socket
+import argparse
+import threading
+import traceback
+from collections import OrderedDict
+from datetime import datetime
+from app import (app, db, create_tables, Experiment, EvaluationJob, EvaluationJobItem,
+                 prepare_evaluation_context, prepare_job_item, save_evaluation_result, finish_job_item,
+                 get_evaluation_limits, claim_evaluation_entry, renew_evaluation_lease, complete_evaluation_entry,
+                 finish_queued_job_if_done, GradeBuffer)
+from evaluation import init_evaluation_context, warm_up_evaluation_server, run_isolated_evaluation
+
+# 队列为空时再次领取前的等待时间（秒）
+IDLE_POLL_INTERVAL = float(os.environ.get('EVAL_WORKER_POLL_INTERVAL', 2))
+# 最多缓存的评测任务上下文数，评测任务结束时即删除，最后一个学生由其他节点评测时按最近使用淘汰
+CONTEXT_CACHE_SIZE = int(os.environ.get('EVAL_WORKER_CONTEXT_CACHE_SIZE', 4))
+
+class EvaluationWorker:
+    """
+    评测节点，每个评测槽位一个线程，各自循环领取并执行评测
+
+    领取评测后由心跳线程定期续约，心跳时同时检查评测任务是否已被取消；
+    节点崩溃后租约不再续约，过期后评测由其他节点重新领取
+    """
+
+    def __init__(self, worker_id, slots):
+        self.worker_id = worker_id
+        self.slots = max(1, int(slots))
+        self.stop_event = threading.Event()
+        # 评测任务ID -> 评测上下文（真实标签、共享测试数据等），同一任务的学生共用，按最近使用排列
+        self._contexts = OrderedDict()
+        self._contexts_lock = threading.Lock()
+
+    def get_context(self, job):
+        with self._contexts_lock:
+            context = self._contexts.get(job.job_id)
+            if context is not None:
+                self._contexts.move_to_end(job.job_id)
+        if context is None:
+            context = prepare_evaluation_context(job.experiment_id)
+            with self._contexts_lock:
+                self._contexts[job.job_id] = context
+                # 被移出缓存的上下文在正在使用它的评测结束、对象被回收时释放共享测试数据版本的锁
+                while len(self._contexts) > CONTEXT_CACHE_SIZE:
+                    self._contexts.popitem(last=False)
+        return context
+
+    def finish_entry(self, entry, job, worker_id=None):
+        """评测结束：完成队列项，所有学生都结束时结束评测任务，任务已结束时删除缓存的评测上下文"""
+        complete_evaluation_entry(entry.entry_id, worker_id)
+        finish_queued_job_if_done(job)
+        if job.status not in ['queued', 'running']:
+            with self._contexts_lock:
+                self._contexts.pop(job.job_id, None)
+
+    def run(self):
+        print(f"评测节点 {self.worker_id} 启动，评测槽位数: {self.slots}")
+        threads = [
+            threading.Thread(target=self.slot_loop, name=f"evaluation-slot-{i}", daemon=True)
+            for i in range(self.slots)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print(f"评测节点 {self.worker_id} 正在停止，等待正在执行的评测结束（再次按 Ctrl+C 强制退出）")
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+        print(f"评测节点 {self.worker_id} 已停止")
+
+    def slot_loop(self):
+        while not self.stop_event.is_set():
+            with app.app_context():
+                try:
+                    entry = claim_evaluation_entry(self.worker_id)
+                    if entry:
+                        self.process_entry(entry)
+                except Exception as e:
+                    print(f"评测节点 {self.worker_id} 执行评测时发生错误: {e}")
+                    traceback.print_exc()
+                    db.session.rollback()
+                    entry = None
+            if not entry:
+                self.stop_event.wait(IDLE_POLL_INTERVAL)
+
+    def process_entry(self, entry):
+        """执行领取到的一个学生评测"""
+        item = entry.item
+        job = item.job
+        experiment = Experiment.query.get(job.experiment_id)
+
+        if item.status in EvaluationJobItem.FINISHED_STATUSES:
+            self.finish_entry(entry, job)
+            return
+        if job.cancel_requested:
+            finish_job_item(item, 'cancelled', '评测任务已取消')
+            self.finish_entry(entry, job)
+            return
+        if entry.attempts > app.config['EVAL_MAX_ATTEMPTS']:
+            print(f"学生 {item.student_id} 的评测已被领取 {entry.attempts} 次，不再重试")
+            finish_job_item(item, 'error', f'评测节点多次异常中断（已尝试{entry.attempts - 1}次），请检查学生代码')
+            self.finish_entry(entry, job)
+            return
+
+        if job.status == 'queued':
+            job.status = 'running'
+            job.started_at = job.started_at or datetime.utcnow()
+            db.session.commit()
+
+        print(f"评测节点 {self.worker_id} 领取学生 {item.student_id} 的评测（任务{job.job_id}，第{entry.attempts}次）")
+        # 领取后立即开始续约：准备测试数据、计算文件哈希和预检都可能耗时较长，期间租约不能过期
+        cancel_event = threading.Event()
+        lease_lost = threading.Event()
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self.heartbeat_loop,
+            args=(entry.entry_id, job.job_id, cancel_event, lease_lost, heartbeat_stop),
+            daemon=True
+        )
+        heartbeat.start()
+        try:
+            try:
+                context = self.get_context(job)
+            except Exception as e:
+                print(f"准备评测任务 {job.job_id} 的测试数据失败: {e}")
+                db.session.rollback()
+                finish_job_item(item, 'error', str(e))
+                self.finish_entry(entry, job)
+                return
+
+            if lease_lost.is_set():
+                print(f"学生 {item.student_id} 的评测租约已失效，不再评测")
+                return
+            # 评测节点每个学生结束时立即写入成绩（一条upsert语句），节点崩溃不会丢失已完成的成绩
+            grade_buffer = GradeBuffer(flush_size=1)
+            main_file, cache_key = prepare_job_item(item, experiment, context, job.force_rerun, grade_buffer)
+            result = None
+            if main_file and not lease_lost.is_set():
+                result = run_isolated_evaluation(
+                    main_file,
+                    limits=get_evaluation_limits(),
+                    cancel_event=cancel_event,
+                    metrics=context['metrics'],
+                    true_labels=context['true_labels'],
+                    test_images=context['test_images']
+                )
+        finally:
+            heartbeat_stop.set()
+            heartbeat.join()
+
+        if lease_lost.is_set():
+            # 租约已被其他节点重新领取，评测结果由新的节点写入
+            print(f"学生 {item.student_id} 的评测租约已失效，放弃本次评测结果")
+            return
+        if main_file:
+            db.session.refresh(job)
+            if job.cancel_requested:
+                finish_job_item(item, 'cancelled', '评测任务已取消')
+            else:
+                save_evaluation_result(item, experiment, result, cache_key, grade_buffer)
+
+        self.finish_entry(entry, job, self.worker_id)
+
+    def heartbeat_loop(self, entry_id, job_id, cancel_event, lease_lost, heartbeat_stop):
+        """评测执行期间定期续约，租约失效或任务被取消时结束评测子进程"""
+        interval = max(1.0, app.config['EVAL_LEASE_SECONDS'] / 3.0)
+        while not heartbeat_stop.wait(interval):
+            with app.app_context():
+                try:
+                    if not renew_evaluation_lease(entry_id, self.worker_id):
+                        lease_lost.set()
+                        cancel_event.set()
+                        return
+                    if EvaluationJob.query.get(job_id).cancel_requested:
+                        cancel_event.set()
+                except Exception as e:
+                    print(f"评测节点 {self.worker_id} 心跳失败: {e}")
+                    db.session.rollback()
+
+def main():
+    parser = argparse.ArgumentParser(description='深度学习平台评测节点')
+    parser.add_argument('--slots', type=int, default=app.config['EVAL_POOL_SIZE'],
+                        help='同时执行的评测数（默认 EVAL_POOL_SIZE）')
+    parser.add_argument('--worker-id', default=f"{socket.gethostname()}:{os.getpid()}",
+                        help='评测节点名称，默认为 主机名:进程号')
+    args = parser.parse_args()
+
+    with app.app_context():
+        create_tables()
+    init_evaluation_context(app.config['EVAL_START_METHOD'])
+    warm_up_evaluation_server()
+    EvaluationWorker(args.worker_id, args.slots).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,967 @@
+"""
+评测模块
+与Flask/数据库无关的学生代码评测逻辑，每个学生代码在独立的子进程中执行
+"""
+import os
+import sys
+import shutil
+import traceback
+import importlib.util
+import importlib.machinery
+import io
+import time
+import signal
+import hashlib
+import struct
+import gzip
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import redirect_stdout, redirect_stderr
+import numpy as np
+from scoring import (load_label_file, load_prediction_file, describe_count_mismatch, compute_metrics, parse_metrics,
+                     PREDICTION_FILES)
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 添加文件路径查找工具函数
+def find_file_path(file_name, experiment_id=None, sub_dir=None, search_dirs=None):
+    """
+    动态查找文件路径
+    
+    参数:
+        file_name: 要查找的文件名
+        experiment_id: 实验ID，如果提供则会在lab{experiment_id}目录下查找
+        sub_dir: 子目录名称，如testcode、testdata、upload等
+        search_dirs: 自定义搜索目录列表，如果为None则使用默认目录
+        
+    返回:
+        找到的文件路径，如果未找到则返回None
+    """
+    # 获取当前文件所在目录的绝对路径（DLplatform-be目录）
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    # 项目根目录（DLplatform目录）
+    project_dir = os.path.dirname(app_dir)
+    # 当前工作目录
+    current_dir = os.getcwd()
+    
+    # 默认搜索目录
+    if search_dirs is None:
+        search_dirs = [
+            app_dir,  # 后端目录
+            project_dir,  # 项目根目录
+            current_dir,  # 当前工作目录
+        ]
+    
+    # 构建可能的路径
+    possible_paths = []
+    
+    # 如果提供了实验ID，则在lab{experiment_id}目录下查找
+    if experiment_id is not None:
+        lab_folder = f"lab{experiment_id}"
+        
+        # 如果提供了子目录，则在子目录下查找
+        if sub_dir is not None:
+            for dir_path in search_dirs:
+                possible_paths.append(os.path.join(dir_path, lab_folder, sub_dir, file_name))
+        else:
+            for dir_path in search_dirs:
+                possible_paths.append(os.path.join(dir_path, lab_folder, file_name))
+    else:
+        # 如果没有提供实验ID，则直接在搜索目录下查找
+        for dir_path in search_dirs:
+            if sub_dir is not None:
+                possible_paths.append(os.path.join(dir_path, sub_dir, file_name))
+            else:
+                possible_paths.append(os.path.join(dir_path, file_name))
+    
+    # 查找文件
+    for path in possible_paths:
+        if os.path.exists(path):
+            print(f"找到文件: {path}")
+            return path
+    
+    # 如果未找到文件，返回None
+    print(f"未找到文件: {file_name}")
+    return None
+
+# 确保实验目录存在
+def ensure_experiment_dir(experiment_id, sub_dir=None):
+    """
+    确保实验目录存在
+    
+    参数:
+        experiment_id: 实验ID
+        sub_dir: 子目录名称，如testcode、testdata、upload等
+        
+    返回:
+        实验目录的绝对路径
+    """
+    # 获取当前文件所在目录的绝对路径（DLplatform-be目录）
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    
+    # 构建实验目录路径
+    lab_folder = f"lab{experiment_id}"
+    lab_path = os.path.join(app_dir, lab_folder)
+    
+    # 如果提供了子目录，则在子目录下创建
+    if sub_dir is not None:
+        dir_path = os.path.join(lab_path, sub_dir)
+    else:
+        dir_path = lab_path
+    
+    # 确保目录存在
+    os.makedirs(dir_path, exist_ok=True)
+    
+    return dir_path
+
+def find_student_labels_file(absolute_student_code_path):
+    """查找学生代码对应实验的真实标签文件（评测调度方没有传入已解析的标签时使用）"""
+    student_dir = os.path.dirname(absolute_student_code_path)
+    # 首先尝试相对于学生代码目录的路径
+    labels_file = os.path.join(student_dir, '../../testdata/all_labels.csv')
+    if os.path.exists(labels_file):
+        return labels_file
+    
+    # 如果不存在，尝试从路径中提取实验ID
+    # 假设路径格式为 .../DLplatform-be/lab{experiment_id}/testcode/student_{student_id}_{timestamp}/...
+    path_parts = absolute_student_code_path.split(os.sep)
+    lab_index = -1
+    experiment_id = None
+    
+    for i, part in enumerate(path_parts):
+        if part.startswith('lab'):
+            lab_index = i
+            # 尝试提取实验ID
+            try:
+                experiment_id = int(part[3:])  # 提取"lab"后面的数字
+                print(f"从路径提取到实验ID: {experiment_id}")
+            except ValueError:
+                pass
+            break
+    
+    # 如果找到了实验ID，使用find_file_path函数查找标签文件
+    if experiment_id is not None:
+        found_labels_file = find_file_path('all_labels.csv', experiment_id=experiment_id, sub_dir='testdata')
+        if found_labels_file:
+            labels_file = found_labels_file
+    # 如果没有找到实验ID但找到了lab目录，使用原来的方法
+    elif lab_index >= 0:
+        lab_dir = os.path.join(*path_parts[:lab_index+1])
+        labels_file = os.path.join(lab_dir, 'testdata', 'all_labels.csv')
+    return labels_file
+
+def find_prediction_file():
+    """
+    在当前目录和上级目录中查找学生代码写出的预测结果文件（all_preds.npy/.npz/.csv）
+    同一目录下有多种格式时使用最近写出的文件，避免读到之前评测遗留的结果
+    """
+    for search_dir in ['.', '..', '../..']:
+        candidates = [os.path.join(search_dir, name) for name in PREDICTION_FILES
+                      if os.path.exists(os.path.join(search_dir, name))]
+        if candidates:
+            return max(candidates, key=os.path.getmtime)
+    return None
+
+def run_legacy_evaluation(student_module):
+    """
+    兼容旧的评测方式：调用学生的evaluate_model/test/predict函数，由学生代码写出预测结果文件
+
+    返回:
+        (predictions, has_header, probabilities)，未生成预测结果文件时返回 (None, False, None)
+    """
+    # 首先尝试调用evaluate_model函数
+    if hasattr(student_module, 'evaluate_model') and callable(getattr(student_module, 'evaluate_model')):
+        print("调用学生的evaluate_model函数...")
+        student_module.evaluate_model()
+    # 如果没有evaluate_model函数，尝试调用其他可能的函数
+    elif hasattr(student_module, 'test') and callable(getattr(student_module, 'test')):
+        print("调用学生的test函数...")
+        student_module.test()
+    elif hasattr(student_module, 'predict') and callable(getattr(student_module, 'predict')):
+        print("调用学生的predict函数...")
+        student_module.predict()
+    else:
+        print("未找到可调用的函数，尝试直接运行模块...")
+        # 如果没有找到特定函数，模块导入时可能已经执行了主要代码
+    
+    # 检查是否生成了预测结果文件
+    preds_file = find_prediction_file()
+    if not preds_file:
+        print("未生成预测结果文件，评测失败")
+        return None, False, None
+    print(f"在 {preds_file} 找到预测结果文件")
+    return load_prediction_file(preds_file)
+
+# 平台批量推理时每批的样本数，推理在torch.inference_mode下进行，大批量可以充分利用矩阵运算
+INFERENCE_BATCH_SIZE = int(os.environ.get('EVAL_INFERENCE_BATCH_SIZE', '1000'))
+
+def load_mnist_images(image_path):
+    """以内存映射方式打开idx格式的MNIST图像文件，返回 N x 行 x 列 的只读uint8数组，不复制数据"""
+    with open(image_path, 'rb') as f:
+        _, count, rows, cols = struct.unpack('>IIII', f.read(16))
+    return np.memmap(image_path, dtype=np.uint8, mode='r', offset=16, shape=(count, rows, cols))
+
+def find_model_weights(student_dir, module_name):
+    """查找学生的模型权重文件，优先使用与代码同名（学号.pth）的文件"""
+    for extension in CACHE_WEIGHT_EXTENSIONS:
+        weights_path = os.path.join(student_dir, module_name + extension)
+        if os.path.exists(weights_path):
+            return weights_path
+    for file in sorted(os.listdir(student_dir)):
+        if file.lower().endswith(CACHE_WEIGHT_EXTENSIONS):
+            return os.path.join(student_dir, file)
+    return None
+
+def run_platform_inference(student_module, student_dir, module_name, test_images, need_probabilities=False):
+    """
+    平台批量推理评测模式
+
+    学生代码提供 build_model() 返回模型结构，平台加载同目录下的权重文件，
+    在torch.inference_mode下按INFERENCE_BATCH_SIZE批量推理共享测试数据中的图像。
+    学生代码可选提供 preprocess(images)，输入为 N x 28 x 28 的float张量（0~255），
+    返回模型的输入张量；未提供时与实验模板一致，归一化到0~1并增加通道维。
+
+    返回:
+        (predictions, probabilities)，probabilities只在need_probabilities为True时计算
+    """
+    import torch
+    
+    model = student_module.build_model()
+    weights_path = find_model_weights(student_dir, module_name)
+    if weights_path:
+        print(f"加载模型权重: {weights_path}")
+        # 只读取张量等数据，不执行权重文件中的任意代码；直接保存整个模型（torch.save(model)）的文件无法读取
+        try:
+            state = torch.load(weights_path, map_location='cpu', weights_only=True)
+        except Exception as e:
+            raise RuntimeError(f"无法安全读取模型权重文件，请使用 torch.save(model.state_dict(), ...) 保存权重: {e}")
+        model.load_state_dict(state)
+    else:
+        print("未找到模型权重文件，使用build_model返回的模型参数")
+    model.eval()
+    
+    images = load_mnist_images(test_images)
+    preprocess = getattr(student_module, 'preprocess', None)
+    predictions = np.empty(len(images), dtype=np.int64)
+    probabilities = None
+    with torch.inference_mode():
+        for start in range(0, len(images), INFERENCE_BATCH_SIZE):
+            batch = torch.from_numpy(np.asarray(images[start:start + INFERENCE_BATCH_SIZE], dtype=np.float32))
+            if callable(preprocess):
+                batch = preprocess(batch)
+            else:
+                batch = batch.div_(255.0).unsqueeze_(1)
+            outputs = model(batch)
+            end = start + outputs.shape[0]
+            predictions[start:end] = outputs.argmax(dim=1).numpy()
+            if need_probabilities:
+                if probabilities is None:
+                    probabilities = np.empty((len(images), outputs.shape[1]), dtype=np.float32)
+                probabilities[start:end] = torch.softmax(outputs, dim=1).numpy()
+    return predictions, probabilities
+
+# 每个评测保留的学生代码输出字符数（stdout、stderr分别计算），超出时只保留最后的部分
+EVALUATION_LOG_LIMIT = int(os.environ.get('EVAL_LOG_LIMIT', 65536))
+
+class BoundedOutput(io.TextIOBase):
+    """
+    只保留最后limit个字符的输出缓冲（环形缓冲）
+    学生代码在循环中打印时输出可能达到数MB，超出部分从头部丢弃并记录丢弃的字符数
+    """
+
+    def __init__(self, limit=None):
+        self.limit = max(1, int(limit or EVALUATION_LOG_LIMIT))
+        self.chunks = deque()
+        self.size = 0
+        self.dropped = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        length = len(text)
+        if length >= self.limit:
+            self.dropped += self.size + length - self.limit
+            self.chunks.clear()
+            self.chunks.append(text[-self.limit:])
+            self.size = self.limit
+            return length
+        self.chunks.append(text)
+        self.size += length
+        while self.size > self.limit:
+            excess = self.size - self.limit
+            head = self.chunks[0]
+            if len(head) <= excess:
+                self.chunks.popleft()
+                self.size -= len(head)
+                self.dropped += len(head)
+            else:
+                self.chunks[0] = head[excess:]
+                self.size -= excess
+                self.dropped += excess
+        return length
+
+    def getvalue(self):
+        text = ''.join(self.chunks)
+        if self.dropped:
+            return f"...（输出过长，已省略前 {self.dropped} 个字符）\n{text}"
+        return text
+
+def execute_student_code(student_code_path, metrics=None, true_labels=None, test_images=None, telemetry=None):
+    """
+    执行学生提交的Python文件，得到预测结果后与真实标签比对计算准确度
+    学生代码提供build_model函数时由平台批量推理，否则兼容旧的evaluate_model写出CSV的方式
+
+    参数:
+        student_code_path: 学生Python文件路径
+        metrics: 除准确率外需要计算的评测指标，见scoring.AVAILABLE_METRICS
+        true_labels: 评测调度方已解析好的真实标签数组，为None时在学生目录附近查找标签文件
+        test_images: 共享测试数据中未压缩的MNIST图像文件路径，平台推理模式使用
+        telemetry: 可选的字典，写入导入学生模块和推理阶段的耗时
+    """
+    if telemetry is None:
+        telemetry = {}
+    try:
+        # 构建绝对路径
+        absolute_student_code_path = os.path.abspath(student_code_path)
+        print(f"评测文件绝对路径: {absolute_student_code_path}")
+        
+        # 检查文件是否存在
+        if not os.path.exists(absolute_student_code_path):
+            return {
+                "score": 0.0,
+                "message": f"学生代码文件不存在: {absolute_student_code_path}"
+            }
+        
+        # 获取学生代码所在目录和模块名称
+        student_dir = os.path.dirname(absolute_student_code_path)
+        module_name = os.path.basename(absolute_student_code_path).replace('.py', '')
+        print(f"模块名称: {module_name}, 目录: {student_dir}")
+        
+        # 切换到学生代码目录
+        original_cwd = os.getcwd()
+        os.chdir(student_dir)
+        
+        # 捕获输出
+        output = BoundedOutput()
+        error_output = BoundedOutput()
+        
+        try:
+            with redirect_stdout(output), redirect_stderr(error_output):
+                # 动态导入学生的模块
+                print(f"正在导入学生模块: {module_name}")
+                spec = importlib.util.spec_from_file_location(module_name, absolute_student_code_path)
+                if not spec:
+                    return {"score": 0.0, "message": f"无法加载模块规范: {module_name}"}
+                
+                # 测试数据和MNIST数据文件已由评测调度方链接到共享测试数据目录，这里不再复制
+                
+                student_module = importlib.util.module_from_spec(spec)
+                import_start = time.time()
+                spec.loader.exec_module(student_module)
+                telemetry['import_time'] = round(time.time() - import_start, 3)
+                
+                print(f"模块导入成功，可用函数: {dir(student_module)}")
+                
+                probabilities = None
+                inference_start = time.time()
+                if callable(getattr(student_module, 'build_model', None)):
+                    # 学生只提供模型构建函数和权重文件，由平台批量推理，预测结果直接保存在内存中
+                    print("调用学生的build_model函数，由平台执行批量推理...")
+                    if not test_images or not os.path.exists(test_images):
+                        return {"score": 0.0, "message": "该实验没有可用于平台推理的测试图像数据，请在学生代码中提供evaluate_model函数"}
+                    predictions, probabilities = run_platform_inference(
+                        student_module, student_dir, module_name, test_images,
+                        need_probabilities='top_k' in parse_metrics(metrics)
+                    )
+                    preds_has_header = False
+                    print(f"平台推理完成，共 {len(predictions)} 个预测结果")
+                else:
+                    predictions, preds_has_header, probabilities = run_legacy_evaluation(student_module)
+                    if predictions is None:
+                        return {"score": 0.0, "message": "学生代码中未找到evaluate_model函数且未生成预测结果"}
+                
+                # 推理阶段耗时：平台批量推理，或学生evaluate_model写出预测结果并被读取的时间
+                inference_time = time.time() - inference_start
+                telemetry['inference_time'] = round(inference_time, 3)
+                telemetry['predictions_per_second'] = round(len(predictions) / inference_time, 1) if inference_time > 0 else None
+                
+                # 读取真实标签文件
+                if true_labels is None:
+                    labels_file = find_student_labels_file(absolute_student_code_path)
+                    if not os.path.exists(labels_file):
+                        print(f"真实标签文件不存在: {labels_file}")
+                        return {"score": 0.0, "message": f"真实标签文件不存在: {labels_file}"}
+                    # 标签文件由pandas写出，首行固定为表头
+                    true_labels, _ = load_label_file(labels_file, header=True)
+                print(f"读取到 {len(true_labels)} 个真实标签")
+                print(f"读取到 {len(predictions)} 个预测结果" + ("（已跳过表头行）" if preds_has_header else ""))
+                
+                # 计算准确率及实验选择的其他评测指标
+                if len(predictions) == len(true_labels):
+                    metric_values = compute_metrics(predictions, true_labels, metrics, probabilities)
+                    correct = metric_values.pop('correct')
+                    total = metric_values.pop('total')
+                    accuracy = metric_values.pop('accuracy')
+                    
+                    print(f"评测结果: 总数 {total}, 正确 {correct}, 准确率 {accuracy:.2f}%")
+                    
+                    return {
+                        "score": accuracy,
+                        "message": f"评测成功，准确率: {accuracy:.2f}%",
+                        "correct": correct,
+                        "total": total,
+                        "predictions_count": len(predictions),
+                        "labels_count": len(true_labels),
+                        "metrics": metric_values,
+                        "stdout": output.getvalue(),
+                        "stderr": error_output.getvalue()
+                    }
+                else:
+                    mismatch_message = describe_count_mismatch(len(predictions), len(true_labels), preds_has_header)
+                    print(mismatch_message)
+                    return {
+                        "score": 0.0, 
+                        "message": mismatch_message,
+                        "predictions_count": len(predictions),
+                        "labels_count": len(true_labels),
+                        "stdout": output.getvalue(),
+                        "stderr": error_output.getvalue()
+                    }
+                    
+        except Exception as e:
+            error_msg = error_output.getvalue()
+            print(f"执行错误: {str(e)}")
+            print(f"错误输出: {error_msg}")
+            return {
+                "score": 0.0, 
+                "message": f"执行学生代码时发生错误: {str(e)}",
+                "error_output": error_msg,
+                "stdout": output.getvalue()
+            }
+        finally:
+            # 恢复原始工作目录
+            os.chdir(original_cwd)
+            
+    except Exception as e:
+        print(f"执行学生代码时发生错误: {e}")
+        traceback.print_exc()
+        return {"score": 0.0, "message": f"执行学生代码失败: {str(e)}"}
+
+
+# MNIST测试集文件名
+MNIST_FILES = ['t10k-images-idx3-ubyte', 't10k-labels-idx1-ubyte']
+
+# 共享测试数据目录，优先放在内存文件系统/dev/shm中，所有评测子进程只读共享同一份数据
+SHARED_TESTDATA_ROOT = os.environ.get('EVAL_SHARED_TESTDATA_DIR') or (
+    '/dev/shm/dlplatform-testdata' if os.path.isdir('/dev/shm')
+    else os.path.join(tempfile.gettempdir(), 'dlplatform-testdata')
+)
+
+def is_shared_testdata_path(file_path):
+    """判断文件是否是指向共享测试数据目录的链接（由link_testdata_for_student创建）"""
+    shared_root = os.path.realpath(SHARED_TESTDATA_ROOT)
+    return os.path.realpath(file_path).startswith(shared_root + os.sep)
+
+# 共享测试数据版本目录中的锁文件，使用该版本的进程持有共享锁，清理旧版本时需要拿到排他锁
+TESTDATA_LOCK_FILE = '.lock'
+
+class SharedTestdata(dict):
+    """
+    prepare_shared_testdata的返回值：文件名 -> 共享只读文件路径
+
+    持有所用数据版本目录的共享锁（fcntl.flock），release()或对象被回收之前，
+    其他进程清理旧版本时不会删除这些目录。不支持flock的平台（如Windows）不加锁，也不清理旧版本
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock_files = {}
+
+    def hold(self, shared_dir):
+        if fcntl is None or shared_dir in self._lock_files:
+            return
+        lock_file = open(os.path.join(shared_dir, TESTDATA_LOCK_FILE), 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        self._lock_files[shared_dir] = lock_file
+
+    def release(self):
+        for lock_file in self._lock_files.values():
+            lock_file.close()
+        self._lock_files.clear()
+
+    def __del__(self):
+        self.release()
+
+def remove_stale_testdata_versions(source_key, current_dir_name):
+    """
+    删除同一原始文件的旧版本共享数据（教师重新上传测试数据后留下的），
+    仍被评测任务使用（持有共享锁）的版本保留，下次准备数据时再尝试清理
+    """
+    if fcntl is None:
+        return
+    try:
+        names = os.listdir(SHARED_TESTDATA_ROOT)
+    except OSError:
+        return
+    for name in names:
+        if not name.startswith(source_key + '-') or name == current_dir_name:
+            continue
+        stale_dir = os.path.join(SHARED_TESTDATA_ROOT, name)
+        try:
+            with open(os.path.join(stale_dir, TESTDATA_LOCK_FILE), 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    print(f"旧版本共享测试数据仍在使用，暂不删除: {stale_dir}")
+                    continue
+                shutil.rmtree(stale_dir)
+            print(f"已删除旧版本共享测试数据: {stale_dir}")
+        except OSError:
+            # 其他进程已经删除
+            continue
+
+def prepare_shared_testdata(data_files):
+    """
+    把实验的测试数据加载到共享测试数据目录中，每份数据只落地一次
+
+    每个原始文件的每个版本（大小、修改时间）对应一个目录，新版本就绪后删除不再使用的旧版本
+
+    参数:
+        data_files: 文件名 -> 原始路径 的字典，如all_labels.csv和MNIST数据文件
+                    只有.gz压缩文件的MNIST数据会解压成未压缩文件一并提供
+
+    返回:
+        SharedTestdata（文件名 -> 共享只读文件路径），用完后调用release()
+    """
+    shared_files = SharedTestdata()
+    for file_name, source_path in sorted(data_files.items()):
+        stat = os.stat(source_path)
+        # 以原始文件路径区分数据来源，以大小和修改时间区分版本，教师重新上传测试数据后自动生成新的共享文件
+        source_key = hashlib.sha256(os.path.abspath(source_path).encode('utf-8')).hexdigest()[:16]
+        version = hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8')).hexdigest()[:16]
+        shared_dir_name = f"{source_key}-{version}"
+        shared_dir = os.path.join(SHARED_TESTDATA_ROOT, shared_dir_name)
+        shared_path = os.path.join(shared_dir, file_name)
+        os.makedirs(shared_dir, exist_ok=True)
+        # 先持有共享锁再检查和写入文件，清理旧版本的进程不会删除正在准备或使用的目录
+        shared_files.hold(shared_dir)
+        if not os.path.exists(shared_path):
+            # 先写临时文件再原子替换，多个评测任务同时准备数据时不会读到不完整的文件
+            temp_path = f"{shared_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(source_path, temp_path)
+            os.chmod(temp_path, 0o444)
+            os.replace(temp_path, shared_path)
+            print(f"加载测试数据到共享目录: {source_path} -> {shared_path}")
+        shared_files[file_name] = shared_path
+
+        # 只有压缩文件时额外提供解压后的文件，学生代码通常直接读取未压缩的idx文件
+        if file_name.endswith('.gz'):
+            raw_name = file_name[:-3]
+            if raw_name not in data_files:
+                raw_path = os.path.join(shared_dir, raw_name)
+                if not os.path.exists(raw_path):
+                    temp_path = f"{raw_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    with gzip.open(source_path, 'rb') as f_in, open(temp_path, 'wb') as f_out:
+                        shutil.copyfileobj(f_in, f_out)
+                    os.chmod(temp_path, 0o444)
+                    os.replace(temp_path, raw_path)
+                    print(f"解压测试数据到共享目录: {source_path} -> {raw_path}")
+                shared_files[raw_name] = raw_path
+        remove_stale_testdata_versions(source_key, shared_dir_name)
+    return shared_files
+
+def link_shared_file(shared_path, target_path):
+    """在学生目录中创建指向共享测试数据的符号链接，已存在真实文件时保持不变"""
+    if os.path.islink(target_path):
+        if os.readlink(target_path) == shared_path:
+            return
+        # 指向旧版本数据或已失效的链接
+        os.remove(target_path)
+    elif os.path.exists(target_path):
+        return
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    try:
+        os.symlink(shared_path, target_path)
+    except (OSError, NotImplementedError) as e:
+        # Windows等不支持符号链接的环境退化为复制
+        print(f"创建符号链接失败，改为复制文件: {e}")
+        shutil.copy2(shared_path, target_path)
+
+def link_testdata_for_student(student_code_path, shared_files, needs_mnist=True):
+    """
+    让学生代码在原本期望的路径下找到测试数据：
+    学生目录下的all_labels.csv，以及 ../../testdata 下的MNIST数据文件，均为指向共享测试数据的链接
+    """
+    student_dir = os.path.dirname(os.path.abspath(student_code_path))
+    if 'all_labels.csv' in shared_files:
+        link_shared_file(shared_files['all_labels.csv'], os.path.join(student_dir, 'all_labels.csv'))
+
+    if not needs_mnist:
+        return
+    testdata_dir = os.path.normpath(os.path.join(student_dir, '../../testdata'))
+    for file_name, shared_path in shared_files.items():
+        if file_name.split('.')[0] in MNIST_FILES:
+            link_shared_file(shared_path, os.path.join(testdata_dir, file_name))
+
+def code_references_mnist(student_code_path):
+    """检查学生代码中是否引用了MNIST数据文件"""
+    with open(student_code_path, 'r', encoding='utf-8', errors='ignore') as f:
+        code_content = f.read()
+    return any(mnist_file in code_content for mnist_file in MNIST_FILES)
+
+# 评测流程版本号，评测逻辑的改动可能改变评测结果时需要递增，使旧的缓存全部失效
+EVALUATION_HARNESS_VERSION = '4'
+
+# 参与评测结果缓存键计算的学生文件类型：代码和模型权重
+CACHE_CODE_EXTENSIONS = ('.py',)
+CACHE_WEIGHT_EXTENSIONS = ('.pth', '.pt', '.pkl', '.ckpt')
+
+def hash_file(file_path):
+    """计算文件内容的sha256"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def compute_files_digest(file_paths):
+    """计算一组文件内容的整体摘要，只与文件内容和顺序有关，与路径无关"""
+    hasher = hashlib.sha256()
+    for file_path in file_paths:
+        hasher.update(hash_file(file_path).encode('ascii'))
+    return hasher.hexdigest()
+
+def compute_evaluation_cache_key(student_code_path, testdata_digest, metrics=None, file_hashes=None):
+    """
+    计算评测结果缓存键
+
+    缓存键由学生目录中的代码和权重文件（相对路径+内容哈希）、测试数据摘要和评测流程版本共同决定，
+    与提交所在的实验目录无关，因此同一份代码和权重提交到使用相同测试数据的不同实验时也能命中缓存。
+    file_hashes为已计算好的 相对路径 -> sha256（如提交清单中的哈希），提供时不再重新读取文件。
+    """
+    student_dir = os.path.dirname(os.path.abspath(student_code_path))
+    if file_hashes is None:
+        file_hashes = {}
+        for root, dirs, files in os.walk(student_dir):
+            for file in files:
+                file_path = os.path.join(root, file)
+                file_hashes[os.path.relpath(file_path, student_dir).replace(os.sep, '/')] = file_path
+        file_hashes = {path: hash_file(file_path) for path, file_path in file_hashes.items()
+                       if path.lower().endswith(CACHE_CODE_EXTENSIONS + CACHE_WEIGHT_EXTENSIONS)}
+    hasher = hashlib.sha256()
+    hasher.update(f"harness:{EVALUATION_HARNESS_VERSION}\n".encode('utf-8'))
+    hasher.update(f"entry:{os.path.basename(student_code_path)}\n".encode('utf-8'))
+    for relative_path in sorted(file_hashes):
+        if relative_path.lower().endswith(CACHE_CODE_EXTENSIONS + CACHE_WEIGHT_EXTENSIONS):
+            hasher.update(f"{relative_path}:{file_hashes[relative_path]}\n".encode('utf-8'))
+    hasher.update(f"testdata:{testdata_digest}\n".encode('utf-8'))
+    hasher.update(f"metrics:{','.join(parse_metrics(metrics))}\n".encode('utf-8'))
+    return hasher.hexdigest()
+
+# 子进程评测的默认资源限制
+DEFAULT_EVALUATION_LIMITS = {
+    'timeout': 300,        # 墙钟时间限制（秒）
+    'cpu_time': 600,       # CPU时间限制（秒），多线程推理时CPU时间可能超过墙钟时间
+    'memory_mb': 8192,     # 地址空间限制（MB），0表示不限制
+    'torch_threads': 1     # 每个评测子进程的torch线程数
+}
+
+# 评测子进程预先导入的科学计算库，学生代码普遍依赖这些库，导入耗时占评测时间的大头
+EVALUATION_PRELOAD_MODULES = ['numpy', 'torch', 'torchvision', 'pandas', 'matplotlib.pyplot']
+
+_evaluation_context = None
+_evaluation_context_lock = threading.Lock()
+
+def init_evaluation_context(start_method='forkserver', preload_modules=None):
+    """
+    初始化评测子进程的启动方式
+
+    forkserver模式下先启动一个预先导入了numpy、torch、torchvision、pandas和matplotlib的服务进程，
+    之后每个评测子进程都从该服务进程fork得到，无需重复导入科学计算库，
+    且服务进程从不执行学生代码，每次评测得到的都是干净的解释器状态。
+    不支持forkserver的平台（如Windows）退化为spawn方式。
+
+    参数:
+        start_method: 'forkserver' 或 'spawn'
+        preload_modules: 预先导入的模块列表，默认EVALUATION_PRELOAD_MODULES
+
+    返回:
+        multiprocessing上下文
+    """
+    global _evaluation_context
+    with _evaluation_context_lock:
+        if _evaluation_context is not None:
+            return _evaluation_context
+
+        if start_method == 'forkserver' and 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            preload_modules = installed_modules(EVALUATION_PRELOAD_MODULES if preload_modules is None else preload_modules)
+            # 服务进程中没有显示设备，使用非交互式的matplotlib后端
+            os.environ.setdefault('MPLBACKEND', 'Agg')
+            # 只预先导入评测、评分模块和科学计算库，不导入主模块（app.py），服务进程中没有Flask应用和数据库连接
+            context.set_forkserver_preload([__name__, 'scoring'] + list(preload_modules))
+            print(f"评测子进程使用forkserver启动，预加载模块: {preload_modules}")
+        else:
+            context = multiprocessing.get_context('spawn')
+            print("评测子进程使用spawn启动")
+        skip_main_in_children()
+
+        _evaluation_context = context
+        return context
+
+def installed_modules(module_names):
+    """
+    过滤出已安装的模块，评测服务器上没有安装的库（如matplotlib）不预先导入
+
+    只查找顶层包而不导入，Web服务进程不会因此导入这些库
+    """
+    installed = []
+    for name in module_names:
+        try:
+            if importlib.util.find_spec(name.split('.')[0]) is not None:
+                installed.append(name)
+        except ImportError:
+            continue
+    return installed
+
+def skip_main_in_children():
+    """
+    子进程启动时不再执行以脚本方式运行的主模块
+
+    multiprocessing默认在spawn/forkserver子进程中重新执行主模块（python app.py 时即app.py），
+    评测子进程的入口都在本模块中，不需要主模块；把主模块标记为名为__main__的模块后，
+    multiprocessing不会在子进程中导入它。
+    """
+    main_module = sys.modules.get('__main__')
+    if main_module is not None and getattr(main_module, '__spec__', None) is None:
+        main_module.__spec__ = importlib.machinery.ModuleSpec('__main__', None)
+
+def get_evaluation_context():
+    """获取评测子进程的multiprocessing上下文，未初始化时使用默认配置初始化"""
+    if _evaluation_context is None:
+        return init_evaluation_context()
+    return _evaluation_context
+
+def warm_up_evaluation_server():
+    """预先启动forkserver服务进程并完成科学计算库的导入，避免第一次评测时等待"""
+    context = get_evaluation_context()
+    if context.get_start_method() != 'forkserver':
+        return
+    start_time = time.time()
+    from multiprocessing import forkserver
+    forkserver.ensure_running()
+    # 启动一个空子进程，等待服务进程完成预加载
+    process = context.Process(target=time.sleep, args=(0,), daemon=True)
+    process.start()
+    process.join()
+    print(f"评测forkserver已就绪，耗时 {time.time() - start_time:.2f}秒")
+
+def limit_torch_threads(torch_threads):
+    """限制当前进程的torch/BLAS线程数，避免多个评测进程争抢CPU核心"""
+    threads = str(max(1, int(torch_threads)))
+    for env_name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[env_name] = threads
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(int(threads))
+
+def apply_resource_limits(cpu_time, memory_mb):
+    """为当前进程设置CPU时间和地址空间的rlimit"""
+    if resource is None:
+        print("警告：当前平台不支持resource模块，评测子进程不设置资源限制")
+        return
+    if cpu_time:
+        # 超过软限制时收到SIGXCPU，再超过5秒被强制结束
+        resource.setrlimit(resource.RLIMIT_CPU, (int(cpu_time), int(cpu_time) + 5))
+    if memory_mb:
+        memory_bytes = int(memory_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+def normalize_evaluation_result(result):
+    """统一评测结果的结构: {score, message, correct, total, stdout, stderr, ...}"""
+    result = dict(result)
+    if 'error_output' in result:
+        result['stderr'] = result.pop('error_output')
+    result.setdefault('score', 0.0)
+    result.setdefault('message', '评测完成')
+    result.setdefault('correct', 0)
+    result.setdefault('total', 0)
+    result.setdefault('stdout', '')
+    result.setdefault('stderr', '')
+    return result
+
+def isolated_evaluation_main(conn, student_code_path, limits, metrics=None, true_labels=None, test_images=None):
+    """
+    评测子进程入口
+    设置资源限制后执行学生代码，通过管道把结构化的评测结果发回父进程
+    """
+    telemetry = {}
+    usage_start = resource.getrusage(resource.RUSAGE_SELF) if resource else None
+    try:
+        apply_resource_limits(limits.get('cpu_time'), limits.get('memory_mb'))
+        limit_torch_threads(limits.get('torch_threads', 1))
+        # 每个子进程在学生代码所在目录中运行，互不影响
+        os.chdir(os.path.dirname(os.path.abspath(student_code_path)))
+        result = execute_student_code(student_code_path, metrics, true_labels, test_images, telemetry)
+    except BaseException as e:
+        result = {"score": 0.0, "message": f"评测子进程异常: {str(e)}", "stderr": traceback.format_exc()}
+    if usage_start:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        telemetry['cpu_user'] = round(usage.ru_utime - usage_start.ru_utime, 3)
+        telemetry['cpu_sys'] = round(usage.ru_stime - usage_start.ru_stime, 3)
+        # Linux下ru_maxrss的单位是KB，macOS下是字节
+        telemetry['peak_rss_mb'] = round(usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    result = dict(result, telemetry=telemetry)
+    try:
+        conn.send(normalize_evaluation_result(result))
+    finally:
+        conn.close()
+
+def describe_exit_code(exitcode):
+    """根据子进程退出码生成错误说明"""
+    if exitcode is None:
+        return "评测子进程未正常结束"
+    if exitcode < 0:
+        signal_number = -exitcode
+        if signal_number == getattr(signal, 'SIGXCPU', None):
+            return "评测超出CPU时间限制，已被终止"
+        if signal_number == signal.SIGKILL:
+            return "评测子进程被强制结束（可能超出内存限制）"
+        if signal_number == signal.SIGSEGV:
+            return "评测子进程发生段错误"
+        return f"评测子进程被信号 {signal_number} 终止"
+    return f"评测子进程异常退出，退出码: {exitcode}"
+
+def run_isolated_evaluation(student_code_path, limits=None, cancel_event=None, metrics=None, true_labels=None,
+                            test_images=None):
+    """
+    在独立子进程中评测学生代码
+
+    参数:
+        student_code_path: 学生Python文件路径
+        limits: 资源限制，见DEFAULT_EVALUATION_LIMITS
+        cancel_event: threading.Event，被设置时立即结束评测子进程
+        metrics: 除准确率外需要计算的评测指标
+        true_labels: 已解析的真实标签数组，随进程参数传给子进程，子进程不再重复解析标签文件
+        test_images: 共享测试数据中的MNIST图像文件路径，供build_model平台推理模式使用
+
+    返回:
+        结构化评测结果 {score, message, correct, total, stdout, stderr, ...}
+    """
+    limits = dict(DEFAULT_EVALUATION_LIMITS, **(limits or {}))
+    context = get_evaluation_context()
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(
+        target=isolated_evaluation_main,
+        args=(child_conn, student_code_path, limits, metrics, true_labels, test_images),
+        daemon=True
+    )
+    start_time = time.time()
+    process.start()
+    # 父进程不再使用子进程端的管道，保证子进程退出后能读到EOF
+    child_conn.close()
+
+    result = None
+    try:
+        while True:
+            elapsed = time.time() - start_time
+            if limits['timeout'] and elapsed >= limits['timeout']:
+                result = normalize_evaluation_result({
+                    "score": 0.0,
+                    "message": f"评测超时（超过{limits['timeout']}秒），已终止"
+                })
+                break
+            if cancel_event is not None and cancel_event.is_set():
+                result = normalize_evaluation_result({"score": 0.0, "message": "评测任务已取消"})
+                break
+            if parent_conn.poll(0.5):
+                try:
+                    result = parent_conn.recv()
+                except EOFError:
+                    # 子进程没有发送结果就退出了
+                    process.join(5)
+                    result = normalize_evaluation_result({
+                        "score": 0.0,
+                        "message": describe_exit_code(process.exitcode)
+                    })
+                break
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        parent_conn.close()
+
+    result['duration'] = round(time.time() - start_time, 2)
+    # 被超时/取消结束的子进程没有发回资源统计，只记录墙钟时间
+    result['telemetry'] = dict(result.get('telemetry') or {}, wall_time=result['duration'])
+    print(f"评测子进程结束: {student_code_path}, 耗时 {result['duration']:.2f}秒, 结果: {result.get('message')}")
+    return result
+
+def run_student_evaluations(main_files, pool_size=1, limits=None, on_result=None, should_cancel=None, metrics=None,
+                            true_labels=None, test_images=None, executor=None):
+    """
+    批量评测学生代码，每个学生代码在独立的子进程中执行
+
+    参数:
+        main_files: 待评测的学生Python文件路径列表
+        pool_size: 同时运行的评测子进程数量上限
+        limits: 评测子进程的资源限制，见DEFAULT_EVALUATION_LIMITS
+        on_result: 每个学生评测结束时的回调 on_result(index, result)，在调用线程中执行
+        should_cancel: 返回True时结束正在执行的评测子进程，并停止分发剩余评测
+        metrics: 除准确率外需要计算的评测指标
+        true_labels: 已解析的真实标签数组，所有学生共用
+        test_images: 共享测试数据中的MNIST图像文件路径，所有学生共用
+        executor: 提交评测的执行器（如scheduler.EvaluationQueue），为None时创建大小为pool_size的线程池
+
+    返回:
+        与main_files顺序一致的评测结果列表，被取消的评测对应None
+    """
+    results = [None] * len(main_files)
+    pool_size = max(1, min(int(pool_size), len(main_files)))
+    cancel_event = threading.Event()
+    if executor is None:
+        # 每个线程只负责等待一个评测子进程，真正的计算都在子进程中
+        executor = ThreadPoolExecutor(max_workers=pool_size)
+    try:
+        # 没有需要评测的学生（全部命中缓存或预检未通过）时也要关闭执行器，调度器中的队列随之关闭
+        if not main_files:
+            return results
+        print(f"评测并发数: {pool_size}, 资源限制: {dict(DEFAULT_EVALUATION_LIMITS, **(limits or {}))}")
+        pending = {
+            executor.submit(run_isolated_evaluation, main_file, limits, cancel_event, metrics, true_labels,
+                            test_images): index
+            for index, main_file in enumerate(main_files)
+        }
+        while pending:
+            done, _ = wait(list(pending), timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                if future.cancelled():
+                    continue
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"评测子进程执行失败: {main_files[index]}, 错误: {e}")
+                    result = normalize_evaluation_result({"score": 0.0, "message": f"评测进程异常: {str(e)}"})
+                if cancel_event.is_set():
+                    continue
+                results[index] = result
+                if on_result:
+                    on_result(index, result)
+            if pending and not cancel_event.is_set() and should_cancel and should_cancel():
+                print("评测已取消，结束正在执行的评测子进程")
+                cancel_event.set()
+                for future in pending:
+                    future.cancel()
+    finally:
+        executor.shutdown(wait=True)
+    return results
@@ -0,0 +1,232 @@
+"""
+离线批量评测工具
+不依赖Flask和MySQL，直接对 lab7/ 这样的实验目录（testcode/ 下每个学生一个文件夹，testdata/ 下为测试数据）
+执行与评测服务相同的预检、评测和评分流程，输出每个学生的成绩、耗时和失败原因。
+
+用法:
+    python grader_cli.py lab7 --workers 4 --output lab7_scores.csv
+    python grader_cli.py lab7 lab8 lab9 --metrics accuracy,per_class --output scores.json
+    python grader_cli.py lab7 --students 2021064040401,2022074080114 --timeout 120
+"""
+import os
+import csv
+import json
+import time
+import argparse
+from evaluation import (init_evaluation_context, warm_up_evaluation_server, run_student_evaluations,
+                        prepare_shared_testdata, link_testdata_for_student, code_references_mnist,
+                        is_shared_testdata_path, DEFAULT_EVALUATION_LIMITS, MNIST_FILES)
+from scoring import load_cached_labels, parse_metrics
+from preflight import locate_entry_file, check_entry_file, format_preflight_errors
+
+# 输出文件的列，JSON输出中每条记录另外包含完整的评测指标
+OUTPUT_FIELDS = ['experiment', 'student', 'status', 'score', 'message', 'correct', 'total', 'duration',
+                 'import_time', 'inference_time', 'cpu_user', 'cpu_sys', 'peak_rss_mb', 'entry_file']
+
+def find_experiment_testdata(experiment_dir, labels_file=None):
+    """
+    查找实验目录中的真实标签和MNIST数据文件
+
+    返回:
+        (labels_file, data_files)，data_files为 文件名 -> 路径 的字典，可直接传给prepare_shared_testdata
+    """
+    testdata_dir = os.path.join(experiment_dir, 'testdata')
+    labels_file = labels_file or os.path.join(testdata_dir, 'all_labels.csv')
+    if not os.path.isfile(labels_file):
+        raise FileNotFoundError(f"找不到真实标签文件: {labels_file}")
+
+    data_files = {'all_labels.csv': os.path.abspath(labels_file)}
+    for mnist_file in MNIST_FILES:
+        for file_name in [mnist_file, f"{mnist_file}.gz"]:
+            file_path = os.path.join(testdata_dir, file_name)
+            # 跳过评测时创建的指向共享测试数据的链接，只使用原始数据
+            if os.path.isfile(file_path) and not is_shared_testdata_path(file_path):
+                data_files[file_name] = os.path.abspath(file_path)
+    return labels_file, data_files
+
+def find_submissions(experiment_dir, students=None):
+    """
+    列出testcode目录中的学生提交，每个学生一个文件夹（或testcode下与学号同名的Python文件）
+
+    返回:
+        [(学生, Python文件列表)]，按学生排序
+    """
+    testcode_dir = os.path.join(experiment_dir, 'testcode')
+    if not os.path.isdir(testcode_dir):
+        raise FileNotFoundError(f"实验目录中没有testcode目录: {experiment_dir}")
+
+    submissions = []
+    for name in sorted(os.listdir(testcode_dir)):
+        path = os.path.join(testcode_dir, name)
+        if name.startswith(('.', '__')):
+            continue
+        if os.path.isdir(path):
+            python_files = [
+                os.path.join(root, file)
+                for root, dirs, files in os.walk(path) for file in files if file.endswith('.py')
+            ]
+            student = name
+        elif name.endswith('.py'):
+            python_files = [path]
+            student = name[:-3]
+        else:
+            continue
+        if students and student not in students:
+            continue
+        submissions.append((student, python_files))
+    return submissions
+
+def make_record(experiment, student, status, message, entry_file=None, result=None):
+    """生成一条评测结果记录"""
+    result = result or {}
+    telemetry = result.get('telemetry') or {}
+    record = {
+        'experiment': experiment,
+        'student': student,
+        'status': status,
+        'score': result.get('score', 0.0),
+        'message': message,
+        'correct': result.get('correct'),
+        'total': result.get('total'),
+        'duration': result.get('duration'),
+        'entry_file': entry_file
+    }
+    for field in ['import_time', 'inference_time', 'cpu_user', 'cpu_sys', 'peak_rss_mb']:
+        record[field] = telemetry.get(field)
+    record['metrics'] = result.get('metrics') or {}
+    return record
+
+def grade_experiment(experiment_dir, workers=1, limits=None, metrics=None, students=None, labels_file=None,
+                     include_logs=False):
+    """
+    评测一个实验目录中的所有学生提交
+
+    返回:
+        评测结果记录列表
+    """
+    # 评测子进程会切换到学生代码目录，路径统一使用绝对路径
+    experiment_dir = os.path.abspath(experiment_dir)
+    experiment = os.path.basename(os.path.normpath(experiment_dir))
+    labels_file, data_files = find_experiment_testdata(experiment_dir, labels_file)
+    true_labels = load_cached_labels(labels_file)
+    shared_testdata = prepare_shared_testdata(data_files)
+
+    records = []
+    pending = []  # (学生, 评测文件)
+    for student, python_files in find_submissions(experiment_dir, students):
+        entry_file, error_message = locate_entry_file(python_files, student)
+        if not entry_file:
+            records.append(make_record(experiment, student, 'preflight_failed', error_message))
+            continue
+        report = check_entry_file(entry_file)
+        if not report['passed']:
+            records.append(make_record(experiment, student, 'preflight_failed', format_preflight_errors(report),
+                                       entry_file))
+            continue
+        link_testdata_for_student(entry_file, shared_testdata, code_references_mnist(entry_file))
+        pending.append((student, entry_file))
+
+    print(f"[{experiment}] 共{len(pending) + len(records)}个提交，{len(records)}个预检未通过，"
+          f"{len(pending)}个待评测，并发数: {workers}")
+
+    def on_result(index, result):
+        student, entry_file = pending[index]
+        status = 'success' if result.get('total') else 'failed'
+        record = make_record(experiment, student, status, result.get('message'), entry_file, result)
+        if include_logs:
+            record['stdout'] = result.get('stdout', '')
+            record['stderr'] = result.get('stderr', '')
+        records.append(record)
+        print(f"[{experiment}] {student}: {record['score']} {record['message']}（{record['duration']}秒）")
+
+    try:
+        run_student_evaluations(
+            [entry_file for _, entry_file in pending],
+            pool_size=workers,
+            limits=limits,
+            on_result=on_result,
+            metrics=metrics,
+            true_labels=true_labels,
+            test_images=shared_testdata.get(MNIST_FILES[0])
+        )
+    finally:
+        shared_testdata.release()
+    records.sort(key=lambda record: record['student'])
+    return records
+
+def write_records(records, output_path):
+    """按扩展名写出CSV或JSON格式的评测结果"""
+    if output_path.endswith('.json'):
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+        return
+    # Excel打开UTF-8的CSV需要BOM
+    with open(output_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(records)
+
+def print_summary(records, elapsed):
+    """输出评测汇总：各状态的提交数、平均成绩和评测吞吐量"""
+    evaluated = [record for record in records if record['duration'] is not None]
+    succeeded = [record for record in records if record['status'] == 'success']
+    print("\n评测汇总")
+    print(f"  提交数: {len(records)}，评测成功: {len(succeeded)}，评测失败: {len(evaluated) - len(succeeded)}，"
+          f"预检未通过: {len(records) - len(evaluated)}")
+    if succeeded:
+        print(f"  平均成绩: {sum(record['score'] for record in succeeded) / len(succeeded):.2f}")
+    if evaluated:
+        durations = sorted(record['duration'] for record in evaluated)
+        print(f"  单个评测耗时: 平均 {sum(durations) / len(durations):.2f}秒，最长 {durations[-1]:.2f}秒")
+    print(f"  总耗时: {elapsed:.2f}秒" + (f"，吞吐量: {len(evaluated) / elapsed:.2f}个/秒" if elapsed > 0 else ""))
+    for record in records:
+        if record['status'] != 'success':
+            print(f"  [{record['status']}] {record['experiment']}/{record['student']}: {record['message']}")
+
+def main():
+    parser = argparse.ArgumentParser(description='离线批量评测实验目录中的学生提交')
+    parser.add_argument('experiment_dirs', nargs='+', help='实验目录，如 lab7（包含testcode/和testdata/）')
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('EVAL_POOL_SIZE', min(4, os.cpu_count() or 1))),
+                        help='同时运行的评测子进程数（默认 EVAL_POOL_SIZE）')
+    parser.add_argument('--metrics', default=None, help='逗号分隔的评测指标，如 accuracy,per_class,top_k')
+    parser.add_argument('--students', default=None, help='只评测指定的学生（逗号分隔的文件夹名）')
+    parser.add_argument('--labels', default=None, help='真实标签文件，默认为实验目录下的 testdata/all_labels.csv')
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('EVAL_TIMEOUT', 300)),
+                        help='单个学生代码的墙钟时间限制（秒）')
+    parser.add_argument('--cpu-time', type=int, default=int(os.environ.get('EVAL_CPU_TIME_LIMIT', 600)),
+                        help='单个学生代码的CPU时间限制（秒）')
+    parser.add_argument('--memory-mb', type=int, default=int(os.environ.get('EVAL_MEMORY_LIMIT_MB', 8192)),
+                        help='单个学生代码的地址空间限制（MB），0表示不限制')
+    parser.add_argument('--torch-threads', type=int, default=int(os.environ.get('EVAL_TORCH_THREADS', 1)),
+                        help='每个评测子进程的torch线程数')
+    parser.add_argument('--start-method', default=os.environ.get('EVAL_START_METHOD', 'forkserver'),
+                        choices=['forkserver', 'spawn'], help='评测子进程启动方式')
+    parser.add_argument('--output', default='grades.csv', help='输出文件，扩展名为.json时输出JSON，否则输出CSV')
+    parser.add_argument('--include-logs', action='store_true', help='JSON输出中包含学生代码的stdout/stderr')
+    args = parser.parse_args()
+
+    limits = dict(DEFAULT_EVALUATION_LIMITS, timeout=args.timeout, cpu_time=args.cpu_time,
+                  memory_mb=args.memory_mb, torch_threads=args.torch_threads)
+    metrics = parse_metrics(args.metrics)
+    students = set(args.students.split(',')) if args.students else None
+
+    init_evaluation_context(args.start_method)
+    warm_up_evaluation_server()
+
+    start_time = time.time()
+    records = []
+    for experiment_dir in args.experiment_dirs:
+        try:
+            records.extend(grade_experiment(experiment_dir, args.workers, limits, metrics, students, args.labels,
+                                            args.include_logs))
+        except FileNotFoundError as e:
+            print(f"跳过实验目录 {experiment_dir}: {e}")
+    elapsed = time.time() - start_time
+
+    write_records(records, args.output)
+    print_summary(records, elapsed)
+    print(f"评测结果已写入: {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,833 @@
+"""
+模型权重查重模块
+读取学生提交的pth权重文件（state_dict），按层比较对应的张量：
+每层计算余弦相似度和逐位完全相同的参数比例，再按参数量汇总为整体相似度，并给出逐层明细。
+每个提交的权重和代码另外计算MinHash签名，通过LSH索引找出候选学生对，只对候选对逐层比较。
+
+torch的zip格式权重文件直接用numpy读取，不需要安装torch，也不会执行权重文件中的任意代码；
+张量只在比较时才从文件中读出（按需加载），已加载的权重文件按LRU缓存。
+旧格式（非zip）的权重文件在安装了torch时用 torch.load(weights_only=True) 读取。
+"""
+import io
+import os
+import zlib
+import pickle
+import keyword
+import zipfile
+import builtins
+import tokenize
+import threading
+from collections import OrderedDict
+import numpy as np
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+# torch存储类型 -> numpy数据类型，bfloat16没有对应的numpy类型，按uint16读出后转换为float32
+STORAGE_DTYPES = {
+    'DoubleStorage': np.float64,
+    'FloatStorage': np.float32,
+    'HalfStorage': np.float16,
+    'BFloat16Storage': np.uint16,
+    'LongStorage': np.int64,
+    'IntStorage': np.int32,
+    'ShortStorage': np.int16,
+    'CharStorage': np.int8,
+    'ByteStorage': np.uint8,
+    'BoolStorage': np.bool_
+}
+
+# 完整checkpoint中保存模型参数的常见键名，如 {'model_state_dict': ..., 'optimizer_state_dict': ..., 'epoch': 10}
+STATE_DICT_KEYS = ('state_dict', 'model_state_dict', 'model', 'net', 'model_state')
+
+# 参数量少于该值的层（如BatchNorm的num_batches_tracked、全零偏置）完全相同也不计为复制的层
+MIN_COPIED_LAYER_PARAMS = 64
+# 逐位相同参数比例达到该值的层计为复制的层
+COPIED_LAYER_THRESHOLD = 0.99
+
+# 代码归一化时保留的内置函数名（print、range、len等）
+BUILTIN_NAMES = frozenset(name for name in dir(builtins) if not name.startswith('_'))
+
+# 同时缓存的权重文件数，可通过环境变量 PLAGIARISM_CACHE_SIZE 调整
+STATE_DICT_CACHE_SIZE = int(os.environ.get('PLAGIARISM_CACHE_SIZE', 64))
+
+class StorageRef:
+    """权重文件中的一个存储块，数据在读取张量时才从zip中读出"""
+
+    def __init__(self, key, storage_type, numel):
+        self.key = key
+        self.storage_type = storage_type
+        self.numel = numel
+
+class TensorRef:
+    """张量在存储块中的位置和形状"""
+
+    def __init__(self, storage, offset, shape, stride):
+        self.storage = storage
+        self.offset = offset
+        self.shape = tuple(shape)
+        self.stride = tuple(stride)
+
+class StorageType:
+    def __init__(self, name):
+        self.name = name
+
+def _rebuild_tensor(storage, storage_offset, size, stride, *args):
+    return TensorRef(storage, storage_offset, size, stride)
+
+def _rebuild_parameter(data, *args):
+    return data
+
+class StateDictUnpickler(pickle.Unpickler):
+    """只允许state_dict中会出现的类型，遇到其他类（如直接保存的整个模型）时报错，不执行任何代码"""
+
+    ALLOWED_GLOBALS = {
+        ('collections', 'OrderedDict'): OrderedDict,
+        ('torch._utils', '_rebuild_tensor_v2'): _rebuild_tensor,
+        ('torch._utils', '_rebuild_parameter'): _rebuild_parameter,
+        ('torch._utils', '_rebuild_parameter_with_state'): _rebuild_parameter
+    }
+
+    def find_class(self, module, name):
+        if (module, name) in self.ALLOWED_GLOBALS:
+            return self.ALLOWED_GLOBALS[(module, name)]
+        if module == 'torch' and name in STORAGE_DTYPES:
+            return StorageType(name)
+        raise pickle.UnpicklingError(f"权重文件中包含不支持的对象 {module}.{name}（请只保存 model.state_dict()）")
+
+    def persistent_load(self, pid):
+        # ('storage', 存储类型, 键, 设备, 元素数)
+        if not isinstance(pid, tuple) or not pid or pid[0] != 'storage':
+            raise pickle.UnpicklingError(f"不支持的存储引用: {pid!r}")
+        _, storage_type, key, _, numel = pid
+        if not isinstance(storage_type, StorageType):
+            raise pickle.UnpicklingError(f"不支持的存储类型: {storage_type!r}")
+        return StorageRef(str(key), storage_type.name, numel)
+
+def flatten_state_dict(obj, prefix=''):
+    """把（可能嵌套的）state_dict展开为 参数名 -> 张量 的有序字典，非张量的值（如epoch）忽略"""
+    if isinstance(obj, dict) and not prefix:
+        for key in STATE_DICT_KEYS:
+            if isinstance(obj.get(key), dict):
+                return flatten_state_dict(obj[key], key + '.')
+    tensors = OrderedDict()
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            name = f"{prefix}{key}"
+            if isinstance(value, (TensorRef, np.ndarray)):
+                tensors[name] = value
+            elif isinstance(value, dict):
+                tensors.update(flatten_state_dict(value, name + '.'))
+    return tensors
+
+class StateDict:
+    """
+    一个权重文件的state_dict
+
+    打开时只解析参数名、形状和数据类型，张量在第一次调用array()时才从文件中读出
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._arrays = {}
+        self._norms = {}
+        if zipfile.is_zipfile(path):
+            self._refs = self._load_zip(path)
+        else:
+            self._refs = self._load_with_torch(path)
+        if not self._refs:
+            raise ValueError("权重文件中没有找到模型参数")
+
+    def _load_zip(self, path):
+        with zipfile.ZipFile(path) as archive:
+            pickle_name = next((name for name in archive.namelist() if name.endswith('/data.pkl')), None)
+            if pickle_name is None:
+                raise ValueError("不是有效的torch权重文件（缺少data.pkl）")
+            self._prefix = pickle_name[:-len('data.pkl')]
+            byteorder_name = self._prefix + 'byteorder'
+            self._byteorder = '<'
+            if byteorder_name in archive.namelist() and archive.read(byteorder_name).strip() == b'big':
+                self._byteorder = '>'
+            with archive.open(pickle_name) as f:
+                return flatten_state_dict(StateDictUnpickler(f).load())
+
+    def _load_with_torch(self, path):
+        if torch is None:
+            raise ValueError("旧格式的权重文件需要安装torch才能读取")
+        try:
+            obj = torch.load(path, map_location='cpu', weights_only=True)
+        except TypeError:
+            # 不支持weights_only的旧版本torch会执行权重文件中的任意代码，不读取
+            raise ValueError("当前torch版本不支持安全读取旧格式的权重文件")
+
+        def to_numpy(value):
+            if isinstance(value, torch.Tensor):
+                value = value.detach()
+                if value.dtype == torch.bfloat16:
+                    value = value.float()
+                return value.numpy()
+            if isinstance(value, dict):
+                return OrderedDict((key, to_numpy(item)) for key, item in value.items())
+            return value
+
+        return flatten_state_dict(to_numpy(obj))
+
+    def names(self):
+        return list(self._refs.keys())
+
+    def shape(self, name):
+        return tuple(self._refs[name].shape)
+
+    def numel(self, name):
+        return int(np.prod(self.shape(name), dtype=np.int64))
+
+    def array(self, name):
+        """读取一个张量，返回numpy数组"""
+        with self._lock:
+            array = self._arrays.get(name)
+            if array is None:
+                ref = self._refs[name]
+                array = ref if isinstance(ref, np.ndarray) else self._read_tensor(ref)
+                self._arrays[name] = array
+            return array
+
+    def norm(self, name):
+        with self._lock:
+            norm = self._norms.get(name)
+        if norm is None:
+            norm = float(np.linalg.norm(self.array(name).ravel().astype(np.float64)))
+            with self._lock:
+                self._norms[name] = norm
+        return norm
+
+    def _read_tensor(self, ref):
+        storage = ref.storage
+        dtype = np.dtype(STORAGE_DTYPES[storage.storage_type])
+        if dtype.itemsize > 1:
+            dtype = dtype.newbyteorder(self._byteorder)
+        with zipfile.ZipFile(self.path) as archive:
+            data = archive.read(f"{self._prefix}data/{storage.key}")
+        values = np.frombuffer(data, dtype=dtype)
+        if not ref.shape:
+            array = np.array(values[ref.offset])
+        elif 0 in ref.shape:
+            array = np.zeros(ref.shape, dtype=dtype)
+        else:
+            array = np.lib.stride_tricks.as_strided(
+                values[ref.offset:],
+                shape=ref.shape,
+                strides=[step * dtype.itemsize for step in ref.stride]
+            ).copy()
+        array = array.astype(array.dtype.newbyteorder('='), copy=False)
+        if storage.storage_type == 'BFloat16Storage':
+            array = (array.astype(np.uint32) << 16).view(np.float32)
+        return array
+
+_state_dict_cache = OrderedDict()
+_state_dict_cache_lock = threading.Lock()
+
+def load_state_dict(path):
+    """
+    打开权重文件，返回StateDict（按文件路径、修改时间和大小缓存）
+
+    文件无法读取或不是state_dict时抛出ValueError
+    """
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        raise ValueError(f"无法读取权重文件: {e}")
+    cache_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _state_dict_cache_lock:
+        state_dict = _state_dict_cache.get(cache_key)
+        if state_dict is not None:
+            _state_dict_cache.move_to_end(cache_key)
+            return state_dict
+
+    try:
+        state_dict = StateDict(path)
+    except (pickle.UnpicklingError, zipfile.BadZipFile, KeyError, EOFError, OSError) as e:
+        raise ValueError(f"无法解析权重文件 {os.path.basename(path)}: {e}")
+    except ValueError as e:
+        raise ValueError(f"无法解析权重文件 {os.path.basename(path)}: {e}")
+
+    with _state_dict_cache_lock:
+        _state_dict_cache[cache_key] = state_dict
+        while len(_state_dict_cache) > STATE_DICT_CACHE_SIZE:
+            _state_dict_cache.popitem(last=False)
+    return state_dict
+
+def match_layers(state_dict1, state_dict2):
+    """
+    配对两个state_dict中对应的层
+
+    先按参数名配对形状相同的层；剩余的层按在state_dict中的顺序配对形状相同的层，
+    这样只改了模块名（如把复制的模型包进另一个模块）的权重也能配对上
+
+    返回:
+        (配对列表 [(名称1, 名称2)], 未配对的层名列表)
+    """
+    names1 = state_dict1.names()
+    names2 = state_dict2.names()
+    names2_set = set(names2)
+    pairs = []
+    for name in names1:
+        if name in names2_set and state_dict1.shape(name) == state_dict2.shape(name):
+            pairs.append((name, name))
+    paired1 = {name for name, _ in pairs}
+    paired2 = set(paired1)
+
+    remaining2 = [name for name in names2 if name not in paired2]
+    position = 0
+    for name in names1:
+        if name in paired1:
+            continue
+        shape = state_dict1.shape(name)
+        for index in range(position, len(remaining2)):
+            if state_dict2.shape(remaining2[index]) == shape:
+                pairs.append((name, remaining2[index]))
+                paired1.add(name)
+                paired2.add(remaining2[index])
+                position = index + 1
+                break
+
+    unmatched = [name for name in names1 if name not in paired1] + \
+                [name for name in names2 if name not in paired2]
+    return pairs, unmatched
+
+def count_identical(array1, array2):
+    """逐位完全相同的元素个数（-0.0与0.0、NaN的不同编码都按位比较）"""
+    if array1.dtype == array2.dtype and array1.dtype.itemsize in (1, 2, 4, 8):
+        view_type = np.dtype(f"u{array1.dtype.itemsize}")
+        return int(np.count_nonzero(
+            np.ascontiguousarray(array1).view(view_type) == np.ascontiguousarray(array2).view(view_type)
+        ))
+    return int(np.count_nonzero(array1 == array2))
+
+def compare_state_dicts(state_dict1, state_dict2):
+    """
+    逐层比较两个state_dict
+
+    返回:
+        {similarity, cosine, identical_fraction, matched_layers, total_layers, copied_layers,
+         unmatched_layers, layers}
+        similarity为按参数量加权的余弦相似度（百分比），未配对的层按0计入；
+        只有全部参数逐位相同时similarity才为100
+    """
+    pairs, unmatched = match_layers(state_dict1, state_dict2)
+    total_params = max(
+        sum(state_dict1.numel(name) for name in state_dict1.names()),
+        sum(state_dict2.numel(name) for name in state_dict2.names()),
+        1
+    )
+
+    layers = []
+    weighted_cosine = 0.0
+    identical_params = 0
+    copied_layers = 0
+    for name1, name2 in pairs:
+        array1 = state_dict1.array(name1)
+        array2 = state_dict2.array(name2)
+        numel = array1.size
+        identical = count_identical(array1, array2)
+        norm1 = state_dict1.norm(name1)
+        norm2 = state_dict2.norm(name2)
+        if norm1 == 0 or norm2 == 0:
+            cosine = 1.0 if identical == numel else 0.0
+        else:
+            dot = float(np.dot(array1.ravel().astype(np.float64), array2.ravel().astype(np.float64)))
+            cosine = min(1.0, max(-1.0, dot / (norm1 * norm2)))
+        identical_fraction = identical / numel if numel else 1.0
+
+        weighted_cosine += max(cosine, 0.0) * numel
+        identical_params += identical
+        if numel >= MIN_COPIED_LAYER_PARAMS and norm1 > 0 and identical_fraction >= COPIED_LAYER_THRESHOLD:
+            copied_layers += 1
+
+        layer = {
+            'name': name1,
+            'shape': list(array1.shape),
+            'params': numel,
+            'cosine': round(cosine, 4),
+            'identical_fraction': round(identical_fraction, 4)
+        }
+        if name2 != name1:
+            layer['other_name'] = name2
+        layers.append(layer)
+
+    cosine = weighted_cosine / total_params
+    identical_fraction = identical_params / total_params
+    similarity = round(cosine * 100, 2)
+    if identical_fraction < 1.0:
+        similarity = min(similarity, 99.99)
+    return {
+        'similarity': similarity,
+        'cosine': round(cosine, 4),
+        'identical_fraction': round(identical_fraction, 4),
+        'matched_layers': len(pairs),
+        'total_layers': len(pairs) + len(unmatched),
+        'copied_layers': copied_layers,
+        'unmatched_layers': unmatched,
+        'layers': layers
+    }
+
+def compare_weight_files(path1, path2):
+    """比较两个权重文件，返回compare_state_dicts的结果"""
+    return compare_state_dicts(load_state_dict(path1), load_state_dict(path2))
+
+def get_risk_level(similarity, copied_layers=0):
+    """
+    查重风险级别
+
+    有非平凡的层逐位完全相同时至少为高风险：独立训练的模型不会出现逐位相同的权重
+    """
+    if similarity == 100:
+        return "完全重复"
+    elif similarity >= 99:
+        return "极高风险"
+    elif similarity >= 95 or copied_layers:
+        return "高风险"
+    elif similarity >= 90:
+        return "中等风险"
+    else:
+        return "低风险"
+
+# ---------------------------------------------------------------------------
+# MinHash签名和LSH索引：查重时只对落入同一LSH桶的候选学生对计算相似度
+# ---------------------------------------------------------------------------
+
+# 指纹算法版本，修改签名参数后需要修改版本号，数据库中旧版本的指纹会重新计算
+FINGERPRINT_VERSION = 'minhash-v2'
+
+MINHASH_PERMUTATIONS = 128
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+# 随机数种子固定，保存在数据库中的签名在不同进程之间可以比较
+_random = np.random.RandomState(20240601)
+_PERMUTATION_A = _random.randint(1, (1 << 61) - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERMUTATION_B = _random.randint(0, (1 << 61) - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_ROW_MULTIPLIERS = _random.randint(1, (1 << 63) - 1, size=64, dtype=np.uint64) | np.uint64(1)
+
+# 权重按层展开后每WEIGHT_CHUNK_SIZE个参数为一块，量化到WEIGHT_QUANTUM后计算哈希；
+# 独立训练的模型几乎不会有相同的量化块，复制的权重（包括少量微调）大部分块相同
+WEIGHT_CHUNK_SIZE = 8
+WEIGHT_QUANTUM = 1e-3
+# 代码按归一化后的词法单元取CODE_KGRAM_SIZE个连续单元为一个k-gram，
+# 每CODE_WINNOW_WINDOW个连续k-gram中选出哈希最小的一个作为代码指纹（winnowing），
+# 长度不少于 CODE_KGRAM_SIZE + CODE_WINNOW_WINDOW - 1 个词法单元的相同代码一定会被检测到
+CODE_KGRAM_SIZE = 10
+CODE_WINNOW_WINDOW = 4
+
+# LSH分段数：权重签名每段2个值（相似度约0.12以上即成为候选），代码签名每段8个值（约0.7以上）
+WEIGHT_LSH_BANDS = 64
+CODE_LSH_BANDS = 16
+# 成员过多的LSH桶对应所有人共有的内容（如实验模板代码），不产生候选对，可通过环境变量调整
+LSH_MAX_BUCKET_SIZE = int(os.environ.get('PLAGIARISM_MAX_BUCKET_SIZE', 100))
+
+def hash_rows(rows):
+    """对整数矩阵的每一行计算32位哈希"""
+    rows = np.ascontiguousarray(rows).astype(np.uint64)
+    hashes = (rows * _ROW_MULTIPLIERS[:rows.shape[1]]).sum(axis=1, dtype=np.uint64)
+    hashes ^= hashes >> np.uint64(29)
+    hashes *= np.uint64(0xbf58476d1ce4e5b9)
+    hashes ^= hashes >> np.uint64(32)
+    return hashes & MAX_HASH
+
+def minhash(hashes, block_size=4096):
+    """
+    计算一组32位哈希值的MinHash签名
+
+    返回:
+        长度为MINHASH_PERMUTATIONS的uint32数组，哈希集合为空时返回None
+    """
+    hashes = np.unique(np.asarray(hashes, dtype=np.uint64))
+    if not hashes.size:
+        return None
+    signature = np.full(MINHASH_PERMUTATIONS, MAX_HASH, dtype=np.uint64)
+    # 分块计算，参数量很大的模型也不会一次占用过多内存
+    for start in range(0, hashes.size, block_size):
+        block = hashes[start:start + block_size, None]
+        values = ((block * _PERMUTATION_A + _PERMUTATION_B) % MERSENNE_PRIME) & MAX_HASH
+        np.minimum(signature, values.min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+def minhash_similarity(signature1, signature2):
+    """由两个MinHash签名估计Jaccard相似度"""
+    return float(np.count_nonzero(signature1 == signature2)) / len(signature1)
+
+def signature_to_bytes(signature):
+    return None if signature is None else signature.astype('<u4').tobytes()
+
+def signature_from_bytes(data):
+    return None if not data else np.frombuffer(data, dtype='<u4').astype(np.uint32)
+
+def weight_chunk_hashes(state_dict):
+    """权重文件中所有浮点张量的量化参数块哈希（全零块不计入）"""
+    hashes = []
+    for name in state_dict.names():
+        array = state_dict.array(name)
+        if array.dtype.kind != 'f' or array.size < WEIGHT_CHUNK_SIZE:
+            continue
+        values = np.nan_to_num(array.ravel().astype(np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+        quantized = np.clip(np.round(values / WEIGHT_QUANTUM), -2 ** 62, 2 ** 62).astype(np.int64)
+        length = quantized.size // WEIGHT_CHUNK_SIZE * WEIGHT_CHUNK_SIZE
+        chunks = quantized[:length].reshape(-1, WEIGHT_CHUNK_SIZE)
+        chunks = chunks[np.any(chunks != 0, axis=1)]
+        if chunks.size:
+            hashes.append(hash_rows(chunks))
+    return np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+
+def weight_minhash(state_dict):
+    """权重文件的MinHash签名"""
+    return minhash(weight_chunk_hashes(state_dict))
+
+def tokenize_code(source):
+    """
+    用Python词法分析器把代码归一化为词法单元序列，忽略注释、空行和缩进
+
+    关键字、内置函数名和运算符保留，其余标识符替换为V，数字替换为N，字符串替换为S，
+    改变量名、改常量不影响结果
+
+    返回:
+        [(归一化的词法单元, 行号)]
+    """
+    if isinstance(source, bytes):
+        source = source.decode('utf-8', errors='replace')
+    tokens = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            if token.type == tokenize.NAME:
+                if keyword.iskeyword(token.string) or token.string in BUILTIN_NAMES:
+                    value = token.string
+                else:
+                    value = 'V'
+            elif token.type == tokenize.NUMBER:
+                value = 'N'
+            elif token.type == tokenize.STRING:
+                value = 'S'
+            elif token.type == tokenize.OP:
+                value = token.string
+            else:
+                continue
+            tokens.append((value, token.start[0]))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        # 有语法错误的代码只使用出错位置之前的部分
+        pass
+    return tokens
+
+def token_kgram_hashes(tokens, k=CODE_KGRAM_SIZE):
+    """词法单元序列中每k个连续单元的哈希，按位置排列"""
+    if len(tokens) < k:
+        return np.zeros(0, dtype=np.uint64)
+    token_ids = np.array([zlib.crc32(value.encode('utf-8')) for value, _ in tokens], dtype=np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(token_ids, k)
+    return hash_rows(windows)
+
+# 代码指纹：k-gram哈希、所在文件（提交中代码文件的序号）、起止行号
+CODE_FINGERPRINT_DTYPE = np.dtype([('hash', '<u4'), ('file', '<u2'), ('start', '<u4'), ('end', '<u4')])
+
+def winnow(hashes, window=CODE_WINNOW_WINDOW):
+    """
+    winnowing：每个窗口中选出哈希最小的k-gram（有多个时取最右边的），相邻窗口选中同一个时只保留一次
+
+    返回:
+        选中的k-gram位置（升序）
+    """
+    if not hashes.size:
+        return np.zeros(0, dtype=np.int64)
+    if hashes.size <= window:
+        return np.array([hashes.size - 1 - int(np.argmin(hashes[::-1]))])
+    windows = np.lib.stride_tricks.sliding_window_view(hashes, window)
+    rightmost = window - 1 - np.argmin(windows[:, ::-1], axis=1)
+    return np.unique(np.arange(windows.shape[0]) + rightmost)
+
+def compute_code_fingerprints(sources):
+    """
+    计算一个提交中所有Python文件的代码MinHash签名和winnowing指纹，每个文件只做一次词法分析
+
+    返回:
+        (MinHash签名, CODE_FINGERPRINT_DTYPE结构化数组)，没有足够长的代码时签名为None
+    """
+    all_hashes = []
+    fingerprints = []
+    for file_index, source in enumerate(sources):
+        tokens = tokenize_code(source)
+        hashes = token_kgram_hashes(tokens)
+        if not hashes.size:
+            continue
+        all_hashes.append(hashes)
+        lines = np.array([line for _, line in tokens], dtype=np.uint32)
+        positions = winnow(hashes)
+        selected = np.zeros(positions.size, dtype=CODE_FINGERPRINT_DTYPE)
+        selected['hash'] = hashes[positions]
+        selected['file'] = file_index
+        selected['start'] = lines[positions]
+        selected['end'] = lines[positions + CODE_KGRAM_SIZE - 1]
+        fingerprints.append(selected)
+    signature = minhash(np.concatenate(all_hashes)) if all_hashes else None
+    fingerprints = np.concatenate(fingerprints) if fingerprints else np.zeros(0, dtype=CODE_FINGERPRINT_DTYPE)
+    return signature, fingerprints
+
+def code_fingerprints_to_bytes(fingerprints):
+    return fingerprints.astype(CODE_FINGERPRINT_DTYPE).tobytes()
+
+def code_fingerprints_from_bytes(data):
+    return np.frombuffer(data or b'', dtype=CODE_FINGERPRINT_DTYPE)
+
+class LSHIndex:
+    """
+    MinHash签名的LSH索引
+
+    签名分为bands段，任意一段完全相同的两个签名落入同一个桶，成为候选对
+    """
+
+    def __init__(self, bands, max_bucket_size=LSH_MAX_BUCKET_SIZE):
+        self.bands = bands
+        self.max_bucket_size = max_bucket_size
+        self.buckets = {}
+
+    def add(self, key, signature):
+        rows = len(signature) // self.bands
+        for band in range(self.bands):
+            bucket = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            self.buckets.setdefault(bucket, []).append(key)
+
+    def candidate_pairs(self):
+        """返回候选对集合 {(key1, key2)}，key1 < key2"""
+        pairs = set()
+        skipped = 0
+        for keys in self.buckets.values():
+            if len(keys) < 2:
+                continue
+            if self.max_bucket_size and len(keys) > self.max_bucket_size:
+                skipped += 1
+                continue
+            keys = sorted(set(keys))
+            for i in range(len(keys)):
+                for j in range(i + 1, len(keys)):
+                    pairs.add((keys[i], keys[j]))
+        if skipped:
+            print(f"LSH索引中有{skipped}个桶的成员超过{self.max_bucket_size}个（多为共有的模板内容），已跳过")
+        return pairs
+
+def academic_term(moment):
+    """
+    时间所属的学期，如 2024春、2024秋
+
+    2~7月为春季学期，8~12月为当年的秋季学期，1月属于上一年的秋季学期
+    """
+    if moment is None:
+        return None
+    if moment.month == 1:
+        return f"{moment.year - 1}秋"
+    return f"{moment.year}{'春' if moment.month <= 7 else '秋'}"
+
+# ---------------------------------------------------------------------------
+# 代码相似度：按winnowing指纹比较，给出对应的相同代码行范围
+# ---------------------------------------------------------------------------
+
+# 两个提交至少有这么多个相同的代码指纹才计算代码相似度
+CODE_MIN_MATCHES = int(os.environ.get('PLAGIARISM_CODE_MIN_MATCHES', 5))
+# 每对提交最多列出的相同代码块数
+CODE_MAX_BLOCKS = 20
+
+def find_code_candidates(fingerprints_by_key, min_matches=CODE_MIN_MATCHES, common_limit=None):
+    """
+    用代码指纹的倒排索引找出有相同代码的提交对
+
+    出现在超过common_limit个提交中的指纹视为共有代码（如实验模板、常见的训练循环），不参与比较，
+    默认为 min(LSH_MAX_BUCKET_SIZE, max(2, 提交数的一半))
+
+    返回:
+        (候选对 {(key1, key2): 相同指纹数}，key1 < key2；共有代码的指纹哈希集合)
+    """
+    keys = sorted(fingerprints_by_key)
+    if common_limit is None:
+        common_limit = min(LSH_MAX_BUCKET_SIZE, max(2, len(keys) // 2))
+    hashes = []
+    owners = []
+    for index, key in enumerate(keys):
+        unique_hashes = np.unique(fingerprints_by_key[key]['hash'])
+        hashes.append(unique_hashes)
+        owners.append(np.full(unique_hashes.size, index, dtype=np.int64))
+    if not hashes:
+        return {}, set()
+    hashes = np.concatenate(hashes)
+    owners = np.concatenate(owners)
+    order = np.argsort(hashes, kind='stable')
+    hashes = hashes[order]
+    owners = owners[order]
+    boundaries = np.flatnonzero(np.diff(hashes)) + 1
+    starts = np.concatenate([[0], boundaries])
+    ends = np.concatenate([boundaries, [hashes.size]])
+    counts = ends - starts
+
+    common_hashes = set(int(value) for value in hashes[starts[counts > common_limit]])
+    shared = {}
+    for start, end in zip(starts[(counts >= 2) & (counts <= common_limit)], ends[(counts >= 2) & (counts <= common_limit)]):
+        group = owners[start:end]
+        for i in range(len(group)):
+            for j in range(i + 1, len(group)):
+                pair = (keys[group[i]], keys[group[j]])
+                shared[pair] = shared.get(pair, 0) + 1
+    candidates = {pair: count for pair, count in shared.items() if count >= min_matches}
+    return candidates, common_hashes
+
+def merge_code_blocks(matches):
+    """把按位置排列的相同指纹 (文件1, 起, 止, 文件2, 起, 止) 合并为连续的代码块"""
+    blocks = []
+    for file1, start1, end1, file2, start2, end2 in matches:
+        if blocks:
+            block = blocks[-1]
+            if block['file1'] == file1 and block['file2'] == file2 \
+                    and start1 <= block['lines1'][1] + 1 and block['lines2'][0] <= start2 <= block['lines2'][1] + 1:
+                block['lines1'][1] = max(block['lines1'][1], end1)
+                block['lines2'][1] = max(block['lines2'][1], end2)
+                block['fingerprints'] += 1
+                continue
+        blocks.append({'file1': file1, 'lines1': [start1, end1], 'file2': file2, 'lines2': [start2, end2],
+                       'fingerprints': 1})
+    return blocks
+
+def compare_code_fingerprints(fingerprints1, fingerprints2, ignored_hashes=None, max_blocks=CODE_MAX_BLOCKS):
+    """
+    比较两个提交的代码指纹
+
+    返回:
+        {similarity, overlap1, overlap2, matched_fingerprints, blocks}
+        overlap1/overlap2 为各自的指纹中在对方出现的比例，similarity取两者中较大的（百分比）；
+        blocks为相同的代码块 {file1, lines1: [起, 止], file2, lines2: [起, 止], fingerprints}，
+        file1/file2为提交中代码文件的序号，按包含的指纹数降序
+    """
+    ignored = np.array(sorted(ignored_hashes or ()), dtype=np.uint32)
+    hashes1 = np.setdiff1d(np.unique(fingerprints1['hash']), ignored, assume_unique=True)
+    hashes2 = np.setdiff1d(np.unique(fingerprints2['hash']), ignored, assume_unique=True)
+    common = np.intersect1d(hashes1, hashes2, assume_unique=True)
+    result = {
+        'similarity': 0.0,
+        'overlap1': 0.0,
+        'overlap2': 0.0,
+        'matched_fingerprints': int(common.size),
+        'blocks': []
+    }
+    if not common.size:
+        return result
+    overlap1 = common.size / hashes1.size
+    overlap2 = common.size / hashes2.size
+    result['overlap1'] = round(overlap1 * 100, 2)
+    result['overlap2'] = round(overlap2 * 100, 2)
+    result['similarity'] = round(max(overlap1, overlap2) * 100, 2)
+
+    # 每个相同的指纹对应到对方第一次出现的位置，再按本方的位置顺序合并为代码块
+    selected1 = fingerprints1[np.isin(fingerprints1['hash'], common)]
+    selected2 = fingerprints2[np.isin(fingerprints2['hash'], common)]
+    first_in2 = {}
+    for fingerprint in selected2:
+        first_in2.setdefault(int(fingerprint['hash']), fingerprint)
+    matches = []
+    for fingerprint in selected1:
+        other = first_in2[int(fingerprint['hash'])]
+        matches.append((int(fingerprint['file']), int(fingerprint['start']), int(fingerprint['end']),
+                        int(other['file']), int(other['start']), int(other['end'])))
+    blocks = merge_code_blocks(matches)
+    blocks.sort(key=lambda block: block['fingerprints'], reverse=True)
+    result['blocks'] = blocks[:max_blocks]
+    return result
+
+# ---------------------------------------------------------------------------
+# 相似度矩阵：全部学生两两之间的相似度，分块计算，可以在进程池中并行
+# ---------------------------------------------------------------------------
+
+# 分块计算相似度矩阵时每块的行数（列数相同）
+SIMILARITY_BLOCK_SIZE = int(os.environ.get('PLAGIARISM_BLOCK_SIZE', 256))
+
+def minhash_similarity_block(rows, columns):
+    """两组MinHash签名两两之间的相似度（百分比），返回 len(rows) x len(columns) 矩阵"""
+    rows = np.stack(rows)
+    columns = np.stack(columns)
+    block = np.empty((len(rows), len(columns)), dtype=np.float32)
+    for i, signature in enumerate(rows):
+        block[i] = (columns == signature).mean(axis=1)
+    return block * 100
+
+def code_similarity_block(rows, columns):
+    """
+    两组代码指纹哈希（有序、去重、已去掉共有代码）两两之间的相似度（百分比），
+    与compare_code_fingerprints的similarity相同：相同指纹占指纹较少一方的比例
+    """
+    block = np.zeros((len(rows), len(columns)), dtype=np.float32)
+    column_sizes = np.array([hashes.size for hashes in columns], dtype=np.int64)
+    if not column_sizes.sum():
+        return block
+    # 块内的指纹哈希统一编号，每行标记自己的指纹后查一遍所有列的指纹，按列计数得到相同指纹数
+    row_sizes = [hashes.size for hashes in rows]
+    vocabulary, ids = np.unique(np.concatenate(list(rows) + list(columns)), return_inverse=True)
+    row_offsets = np.concatenate([[0], np.cumsum(row_sizes)])
+    column_ids = ids[row_offsets[-1]:]
+    owners = np.repeat(np.arange(len(columns)), column_sizes)
+    mask = np.zeros(vocabulary.size, dtype=bool)
+    for i, hashes in enumerate(rows):
+        if not hashes.size:
+            continue
+        row_ids = ids[row_offsets[i]:row_offsets[i + 1]]
+        mask[row_ids] = True
+        common = np.bincount(owners[mask[column_ids]], minlength=len(columns))
+        mask[row_ids] = False
+        smaller = np.minimum(column_sizes, hashes.size)
+        block[i] = np.divide(common, smaller, out=np.zeros(len(columns)), where=smaller > 0)
+    return block * 100
+
+def _similarity_block_task(task):
+    """进程池中计算一块相似度，参数和返回值只有模块级函数、numpy数组和整数，可以序列化传给子进程"""
+    block_function, row_start, column_start, rows, columns = task
+    return row_start, column_start, block_function(rows, columns)
+
+def similarity_matrix(items, block_function, block_size=SIMILARITY_BLOCK_SIZE, executor=None):
+    """
+    所有提交两两之间的相似度矩阵
+
+    只计算上三角的各块，executor为进程池时各块并行计算，否则在当前进程中依次计算。
+
+    参数:
+        items: 每个提交的签名或指纹哈希，没有的为None
+        block_function: 计算一块相似度的模块级函数，如minhash_similarity_block、code_similarity_block
+        block_size: 每块的行数
+        executor: concurrent.futures的进程池，可选
+
+    返回:
+        n x n 的float16矩阵，相似度为百分比，没有签名的行和列为NaN
+    """
+    n = len(items)
+    matrix = np.full((n, n), np.nan, dtype=np.float16)
+    present = [i for i, item in enumerate(items) if item is not None]
+    if not present:
+        return matrix
+    values = [items[i] for i in present]
+    present = np.array(present, dtype=np.int64)
+
+    tasks = []
+    for row_start in range(0, present.size, block_size):
+        for column_start in range(row_start, present.size, block_size):
+            tasks.append((block_function, row_start, column_start,
+                          values[row_start:row_start + block_size], values[column_start:column_start + block_size]))
+    results = executor.map(_similarity_block_task, tasks) if executor is not None else map(_similarity_block_task, tasks)
+    for row_start, column_start, block in results:
+        rows = present[row_start:row_start + block.shape[0]]
+        columns = present[column_start:column_start + block.shape[1]]
+        matrix[np.ix_(rows, columns)] = block
+        matrix[np.ix_(columns, rows)] = block.T
+    return matrix
+
+def top_neighbours(matrix, index, k):
+    """矩阵第index行中相似度最高的k个其他学生，返回 [(列序号, 相似度)]，NaN不计入"""
+    row = np.asarray(matrix[index], dtype=np.float32).copy()
+    row[index] = np.nan
+    valid = np.flatnonzero(~np.isnan(row))
+    if not valid.size:
+        return []
+    k = min(k, valid.size)
+    order = valid[np.argpartition(-row[valid], k - 1)[:k]]
+    order = order[np.argsort(-row[order], kind='stable')]
+    return [(int(column), round(float(row[column]), 2)) for column in order]
@@ -0,0 +1,55 @@
+"""
+查重指纹归档工具
+把实验目录（lab*/testcode/ 下每个学生一个文件夹）中的提交加入查重指纹归档，
+之后查重时可以与这些实验、往届的提交比对，不再读取这些提交文件。
+
+目录名为 lab<实验ID> 且该实验在数据库中时，按提交记录归档并补充没有提交记录的学生文件夹；
+否则（如往届已删除的实验）按学生文件夹归档，文件夹名视为学号。
+
+用法:
+    python plagiarism_archive.py lab7 lab8 lab9
+    python plagiarism_archive.py /data/2023/lab11 --term 2023秋 --name 卷积神经网络实验
+"""
+import os
+import re
+import argparse
+from app import app, create_tables, Experiment, archive_experiment, archive_experiment_directory
+
+def archive_directory(experiment_dir, term=None, experiment_name=None):
+    """归档一个实验目录，返回归档的提交数"""
+    experiment_dir = os.path.abspath(experiment_dir)
+    if not os.path.isdir(os.path.join(experiment_dir, 'testcode')):
+        print(f"跳过 {experiment_dir}: 没有testcode目录")
+        return 0
+
+    match = re.fullmatch(r'lab(\d+)', os.path.basename(experiment_dir))
+    experiment = Experiment.query.get(int(match.group(1))) if match else None
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    if experiment and os.path.dirname(experiment_dir) == app_dir:
+        result = archive_experiment(experiment, term)
+        return result['archived_submissions'] + result['archived_directories']
+
+    # 不在数据库中的实验（或其他位置的目录）不记录实验ID，避免与之后创建的同ID实验混淆
+    count = archive_experiment_directory(
+        experiment_dir,
+        experiment_id=None,
+        experiment_name=experiment_name or os.path.basename(experiment_dir),
+        term=term
+    )
+    print(f"{experiment_dir}: 已归档{count}个学生文件夹")
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description='把实验目录中的提交加入查重指纹归档')
+    parser.add_argument('experiment_dirs', nargs='+', help='实验目录，如 lab7（包含testcode/）')
+    parser.add_argument('--term', default=None, help='学期，如 2023秋；默认按实验发布时间或目录修改时间计算')
+    parser.add_argument('--name', default=None, help='不在数据库中的实验的名称，默认为目录名')
+    args = parser.parse_args()
+
+    with app.app_context():
+        create_tables()
+        total = sum(archive_directory(path, args.term, args.name) for path in args.experiment_dirs)
+    print(f"共归档{total}个提交")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+提交预检模块
+在上传时和评测前用AST静态检查学生代码，不导入、不执行学生代码：
+定位评测入口文件和入口函数，检查引用的权重文件是否存在，标记禁止的导入和写死的绝对数据路径。
+预检不通过的提交直接给出具体原因，不再占用评测槽位。
+"""
+import os
+import re
+import ast
+from evaluation import CACHE_WEIGHT_EXTENSIONS
+from scoring import PREDICTION_FILES
+
+# 评测入口函数，按评测时的调用顺序排列：build_model由平台批量推理，其余由学生代码写出预测结果
+ENTRY_FUNCTIONS = ('build_model', 'evaluate_model', 'test', 'predict')
+
+# 禁止导入的模块（包括其子模块），可通过环境变量 EVAL_DISALLOWED_IMPORTS 以逗号分隔覆盖
+DISALLOWED_IMPORTS = [
+    name.strip() for name in os.environ.get(
+        'EVAL_DISALLOWED_IMPORTS',
+        'subprocess,socket,requests,urllib.request,http.client,ftplib,smtplib,telnetlib,paramiko'
+    ).split(',') if name.strip()
+]
+# 禁止调用的函数
+DISALLOWED_CALLS = ('os.system', 'os.popen')
+
+# Windows盘符路径在Linux评测服务器上一定不存在
+WINDOWS_PATH_PATTERN = re.compile(r'^[A-Za-z]:[\\/]')
+
+def parse_source(file_path):
+    """读取并解析Python文件，返回 (tree, error_message)"""
+    with open(file_path, 'rb') as f:
+        source = f.read()
+    try:
+        return ast.parse(source, filename=file_path), None
+    except SyntaxError as e:
+        return None, f"第{e.lineno}行语法错误: {e.msg}"
+    except ValueError as e:
+        return None, f"无法解析代码: {e}"
+
+def get_call_name(node):
+    """返回调用表达式的点分名称，如 torch.load、os.system，无法确定时返回None"""
+    parts = []
+    func = node.func
+    while isinstance(func, ast.Attribute):
+        parts.append(func.attr)
+        func = func.value
+    if isinstance(func, ast.Name):
+        parts.append(func.id)
+    elif not parts:
+        return None
+    return '.'.join(reversed(parts))
+
+def find_entry_functions(tree):
+    """返回模块顶层定义的评测入口函数"""
+    defined = {node.name for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))}
+    return [name for name in ENTRY_FUNCTIONS if name in defined]
+
+def writes_predictions(tree):
+    """代码中是否出现预测结果文件名（没有入口函数、导入时直接写出预测结果的旧代码）"""
+    prefixes = tuple(os.path.splitext(name)[0] for name in PREDICTION_FILES)
+    return any(
+        isinstance(node, ast.Constant) and isinstance(node.value, str)
+        and any(prefix in node.value for prefix in prefixes)
+        for node in ast.walk(tree)
+    )
+
+def locate_entry_file(python_files, submission_name=None):
+    """
+    在提交的Python文件中定位评测入口文件
+
+    优先使用与提交同名的文件（学号.py），否则选择定义了评测入口函数的文件；
+    有多个候选时优先main.py，其次是目录层级最浅的文件
+
+    返回:
+        (entry_file, error_message)，定位失败时entry_file为None
+    """
+    python_files = [path for path in python_files if '__pycache__' not in path.split(os.sep)]
+    if not python_files:
+        return None, "提交文件夹中没有找到Python文件"
+
+    if submission_name:
+        for path in python_files:
+            if os.path.basename(path).lower() == f"{submission_name.lower()}.py":
+                return path, None
+
+    candidates = []
+    for path in python_files:
+        try:
+            tree, _ = parse_source(path)
+        except OSError:
+            continue
+        if tree is not None and (find_entry_functions(tree) or writes_predictions(tree)):
+            candidates.append(path)
+    if not candidates:
+        if len(python_files) == 1:
+            return python_files[0], None
+        names = ', '.join(sorted(os.path.basename(path) for path in python_files))
+        return None, f"提交的Python文件（{names}）中都没有定义{'/'.join(ENTRY_FUNCTIONS)}函数，无法确定评测入口文件"
+
+    candidates.sort(key=lambda path: (os.path.basename(path).lower() != 'main.py', path.count(os.sep), path))
+    return candidates[0], None
+
+def collect_string_assignments(tree):
+    """收集 名称 = '字符串' 形式的赋值，用于解析 torch.load(model_path) 中的变量"""
+    assignments = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) \
+                and isinstance(node.value.value, str):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    assignments[target.id] = node.value.value
+    return assignments
+
+def collect_docstring_nodes(tree):
+    """模块、类和函数的文档字符串节点，检查路径时跳过"""
+    docstrings = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)) and node.body:
+            first = node.body[0]
+            if isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant):
+                docstrings.add(id(first.value))
+    return docstrings
+
+def is_disallowed_module(module_name):
+    return any(module_name == name or module_name.startswith(name + '.') for name in DISALLOWED_IMPORTS)
+
+def check_absolute_path(value):
+    """检查字符串是否为评测服务器上不存在的绝对路径，返回问题描述或None"""
+    if '\n' in value or len(value) > 260:
+        return None
+    if WINDOWS_PATH_PATTERN.match(value):
+        return f"使用了Windows绝对路径 '{value}'，评测服务器上不存在，请改为相对路径（测试数据固定为 ../../testdata）"
+    if value.startswith('~/'):
+        return f"使用了用户目录路径 '{value}'，请改为相对路径（测试数据固定为 ../../testdata）"
+    if value.startswith('/') and len(value) > 1 and ' ' not in value.strip():
+        if not os.path.exists(value) and not os.path.isdir(os.path.dirname(value.rstrip('/'))):
+            return f"使用了评测服务器上不存在的绝对路径 '{value}'，请改为相对路径（测试数据固定为 ../../testdata）"
+    return None
+
+def check_entry_file(entry_file):
+    """
+    对评测入口文件做静态预检
+
+    返回:
+        预检报告 {passed, entry_file, entry_function, errors, warnings}，
+        errors/warnings 中每项为 {code, line, message}
+    """
+    report = {
+        'passed': False,
+        'entry_file': entry_file,
+        'entry_function': None,
+        'errors': [],
+        'warnings': []
+    }
+
+    def add(level, code, message, line=None):
+        report[level].append({'code': code, 'line': line, 'message': message})
+
+    if not entry_file or not os.path.isfile(entry_file):
+        add('errors', 'missing_entry', f"评测入口文件不存在: {entry_file}")
+        return report
+
+    tree, error_message = parse_source(entry_file)
+    if tree is None:
+        add('errors', 'syntax_error', error_message)
+        return report
+
+    student_dir = os.path.dirname(os.path.abspath(entry_file))
+    entry_functions = find_entry_functions(tree)
+    if entry_functions:
+        report['entry_function'] = entry_functions[0]
+    elif not writes_predictions(tree):
+        add('errors', 'missing_entry_function',
+            f"{os.path.basename(entry_file)}中没有定义{'/'.join(ENTRY_FUNCTIONS)}函数，也没有写出预测结果文件")
+
+    weight_files = sorted(
+        name for name in os.listdir(student_dir) if name.lower().endswith(CACHE_WEIGHT_EXTENSIONS)
+    )
+    if report['entry_function'] == 'build_model' and not weight_files:
+        add('warnings', 'missing_weights',
+            "定义了build_model函数但提交目录中没有权重文件，平台将使用未训练的模型推理")
+
+    assignments = collect_string_assignments(tree)
+    docstrings = collect_docstring_nodes(tree)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if is_disallowed_module(alias.name):
+                    add('errors', 'disallowed_import', f"第{node.lineno}行导入了评测环境禁止使用的模块 {alias.name}",
+                        node.lineno)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module] + [f"{node.module}.{alias.name}" for alias in node.names]
+            disallowed = next((name for name in names if is_disallowed_module(name)), None)
+            if disallowed:
+                add('errors', 'disallowed_import', f"第{node.lineno}行导入了评测环境禁止使用的模块 {disallowed}",
+                    node.lineno)
+        elif isinstance(node, ast.Call):
+            call_name = get_call_name(node)
+            if call_name in DISALLOWED_CALLS:
+                add('errors', 'disallowed_call', f"第{node.lineno}行调用了评测环境禁止使用的 {call_name}",
+                    node.lineno)
+            elif call_name and call_name.split('.')[-1] == 'load' and node.args:
+                # torch.load('学号.pth') 或 torch.load(model_path)，只检查能静态确定的相对路径
+                argument = node.args[0]
+                path = None
+                if isinstance(argument, ast.Constant) and isinstance(argument.value, str):
+                    path = argument.value
+                elif isinstance(argument, ast.Name):
+                    path = assignments.get(argument.id)
+                if path and path.lower().endswith(CACHE_WEIGHT_EXTENSIONS) and not os.path.isabs(path) \
+                        and not WINDOWS_PATH_PATTERN.match(path) \
+                        and not os.path.exists(os.path.join(student_dir, path)):
+                    available = ', '.join(weight_files) if weight_files else '无'
+                    add('errors', 'missing_weights',
+                        f"第{node.lineno}行 {call_name} 加载的权重文件 '{path}' 不存在（提交目录中的权重文件: {available}）",
+                        node.lineno)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str) and id(node) not in docstrings:
+            problem = check_absolute_path(node.value)
+            if problem:
+                add('errors', 'absolute_path', f"第{node.lineno}行{problem}", node.lineno)
+
+    report['errors'].sort(key=lambda issue: issue['line'] or 0)
+    report['passed'] = not report['errors']
+    return report
+
+def format_preflight_errors(report):
+    """把预检错误合并为一条评测消息"""
+    return '预检未通过: ' + '；'.join(issue['message'] for issue in report['errors'])
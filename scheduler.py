@@ -0,0 +1,178 @@
+"""
+评测调度模块
+所有评测任务共享固定数量的评测槽位：按教师、实验公平轮转分配，
+单个学生的重新评测和刚过截止时间的实验优先
+"""
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+# 评测优先级，数值越小越优先
+PRIORITY_SINGLE = 0      # 单个学生的重新评测
+PRIORITY_DEADLINE = 1    # 刚过截止时间的实验
+PRIORITY_NORMAL = 2      # 普通批量评测
+PRIORITY_BACKGROUND = 3  # 学生上传后自动发起的后台评测，只使用空闲槽位
+PRIORITY_NAMES = {
+    PRIORITY_SINGLE: 'single',
+    PRIORITY_DEADLINE: 'deadline',
+    PRIORITY_NORMAL: 'normal',
+    PRIORITY_BACKGROUND: 'background'
+}
+
+class EvaluationQueue:
+    """
+    一个评测任务在调度器中的等待队列
+
+    提供与ThreadPoolExecutor相同的submit/shutdown接口，可以直接传给run_student_evaluations
+    """
+
+    def __init__(self, scheduler, queue_id, owner, priority, max_running, label):
+        self.scheduler = scheduler
+        self.queue_id = queue_id
+        self.owner = owner
+        self.priority = priority
+        self.max_running = max(1, int(max_running))
+        self.label = label or str(queue_id)
+        self.tasks = deque()  # (入队时间, future, fn, args)
+        self.running = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.last_dispatched = 0.0
+        self.created_at = time.time()
+        self.closed = False
+
+    def submit(self, fn, *args):
+        return self.scheduler.submit(self, fn, *args)
+
+    def shutdown(self, wait=True):
+        self.scheduler.close_queue(self, wait)
+
+    def to_dict(self, now):
+        return {
+            'queue_id': self.queue_id,
+            'label': self.label,
+            'owner': self.owner,
+            'priority': PRIORITY_NAMES.get(self.priority, self.priority),
+            'depth': len(self.tasks),
+            'running': self.running,
+            'max_running': self.max_running,
+            'completed': self.completed,
+            'oldest_wait': round(now - self.tasks[0][0], 2) if self.tasks else 0.0,
+            'avg_wait': round(self.total_wait / self.completed, 2) if self.completed else 0.0,
+            'age': round(now - self.created_at, 2)
+        }
+
+class EvaluationScheduler:
+    """
+    公平分配评测槽位的调度器
+
+    每个空闲槽位从所有队列中选出下一个评测：先比较优先级，再优先选择正在运行评测最少的教师，
+    运行数相同的教师之间、同一教师的多个实验之间按上次分到槽位的时间轮转，最后按等待时间先后。
+    这样先发起的大批量评测不会占满所有槽位，后来的教师和实验也能立即分到槽位。
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max(1, int(max_workers))
+        self._condition = threading.Condition()
+        self._queues = {}
+        self._owner_running = {}
+        self._owner_dispatched = {}  # 教师 -> 上次分到槽位的时间，教师数量有限，不做清理
+        self._workers = []
+
+    def open_queue(self, queue_id, owner=None, priority=PRIORITY_NORMAL, max_running=None, label=None):
+        """为一个评测任务创建等待队列"""
+        queue = EvaluationQueue(self, queue_id, owner, priority, max_running or self.max_workers, label)
+        with self._condition:
+            self._queues[queue_id] = queue
+        return queue
+
+    def submit(self, queue, fn, *args):
+        """把一个评测加入队列，返回concurrent.futures.Future"""
+        future = Future()
+        with self._condition:
+            if queue.closed:
+                raise RuntimeError(f"评测队列已关闭: {queue.label}")
+            queue.tasks.append((time.time(), future, fn, args))
+            self._ensure_workers()
+            self._condition.notify_all()
+        return future
+
+    def close_queue(self, queue, wait=True):
+        """关闭队列，取消尚未开始的评测；wait为True时等待正在运行的评测结束"""
+        with self._condition:
+            queue.closed = True
+            while queue.tasks:
+                queue.tasks.popleft()[1].cancel()
+            while wait and queue.running:
+                self._condition.wait()
+            if not queue.running and self._queues.get(queue.queue_id) is queue:
+                del self._queues[queue.queue_id]
+
+    def stats(self):
+        """调度器状态：槽位占用及每个队列的深度、等待时间"""
+        now = time.time()
+        with self._condition:
+            queues = sorted(self._queues.values(), key=lambda q: (q.priority, q.created_at))
+            return {
+                'max_workers': self.max_workers,
+                'running': sum(q.running for q in queues),
+                'queued': sum(len(q.tasks) for q in queues),
+                'queues': [q.to_dict(now) for q in queues]
+            }
+
+    def _ensure_workers(self):
+        """按需启动评测槽位线程（调用方持有锁）"""
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker_loop, daemon=True,
+                                      name=f"evaluation-slot-{len(self._workers)}")
+            worker.start()
+            self._workers.append(worker)
+
+    def _select_queue(self):
+        """选出下一个可以分配槽位的队列（调用方持有锁）"""
+        candidates = [q for q in self._queues.values() if q.tasks and q.running < q.max_running]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda q: (
+            q.priority,
+            self._owner_running.get(q.owner, 0),
+            self._owner_dispatched.get(q.owner, 0.0),
+            q.running,
+            q.last_dispatched,
+            q.tasks[0][0]
+        ))
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                queue = self._select_queue()
+                while queue is None:
+                    self._condition.wait()
+                    queue = self._select_queue()
+                enqueued_at, future, fn, args = queue.tasks.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                now = time.time()
+                queue.running += 1
+                queue.total_wait += now - enqueued_at
+                queue.last_dispatched = now
+                self._owner_running[queue.owner] = self._owner_running.get(queue.owner, 0) + 1
+                self._owner_dispatched[queue.owner] = now
+
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._condition:
+                    queue.running -= 1
+                    queue.completed += 1
+                    self._owner_running[queue.owner] -= 1
+                    if not self._owner_running[queue.owner]:
+                        del self._owner_running[queue.owner]
+                    if queue.closed and not queue.running and not queue.tasks \
+                            and self._queues.get(queue.queue_id) is queue:
+                        del self._queues[queue.queue_id]
+                    self._condition.notify_all()
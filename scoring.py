@@ -0,0 +1,219 @@
+"""
+评分模块
+把学生的预测结果和真实标签直接加载为numpy数组，一次向量化计算准确率、
+各类别精确率/召回率/F1、top-k准确率和混淆矩阵
+"""
+import os
+import threading
+import numpy as np
+
+# 可按实验选择的评测指标，准确率始终计算并作为成绩
+AVAILABLE_METRICS = ['accuracy', 'per_class', 'confusion_matrix', 'top_k']
+DEFAULT_METRICS = ['accuracy']
+DEFAULT_TOP_K = 5
+
+def parse_metrics(metrics):
+    """解析评测指标配置，支持逗号分隔的字符串或列表，忽略未知指标"""
+    if not metrics:
+        return list(DEFAULT_METRICS)
+    if isinstance(metrics, str):
+        metrics = metrics.split(',')
+    selected = [metric.strip() for metric in metrics if metric and metric.strip() in AVAILABLE_METRICS]
+    if 'accuracy' not in selected:
+        selected.insert(0, 'accuracy')
+    return selected
+
+def decode_text(raw):
+    """按BOM识别UTF-8/UTF-16编码的文本文件（Windows下保存的CSV常带BOM）"""
+    if raw.startswith(b'\xff\xfe') or raw.startswith(b'\xfe\xff'):
+        return raw.decode('utf-16')
+    return raw.decode('utf-8-sig', errors='ignore')
+
+def is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+def load_label_file(file_path, header=None):
+    """
+    读取单列的标签/预测CSV文件
+
+    参数:
+        file_path: CSV文件路径
+        header: True表示首行固定为表头（与pandas.read_csv默认行为一致），
+                None表示自动识别：首行不是数字时视为表头（如"label"）。多列时只取第一列。
+
+    返回:
+        (values, has_header)，values为int64数组（存在非整数值时为float64数组）
+    """
+    with open(file_path, 'rb') as f:
+        text = decode_text(f.read())
+    rows = [line.split(',')[0].strip().strip('"') for line in text.splitlines()]
+    rows = [row for row in rows if row]
+    if header is None:
+        header = bool(rows) and not is_number(rows[0])
+    has_header = bool(header) and bool(rows)
+    if has_header:
+        rows = rows[1:]
+    values = np.asarray(rows, dtype=np.float64)
+    if values.size and np.all(values == np.round(values)):
+        values = values.astype(np.int64)
+    return values, has_header
+
+# 学生代码可以写出的预测结果文件，二进制格式读取更快，且可以附带概率矩阵
+PREDICTION_FILES = ['all_preds.npy', 'all_preds.npz', 'all_preds.csv']
+NPZ_PREDICTION_KEYS = ('preds', 'predictions')
+NPZ_PROBABILITY_KEYS = ('probs', 'probabilities')
+
+def load_prediction_file(file_path):
+    """
+    读取学生写出的预测结果文件
+
+    .npy: 一维数组为预测类别；二维 N x C 数组视为概率/得分矩阵，预测类别取每行最大值
+    .npz: preds（或predictions）为预测类别，probs（或probabilities）为可选的概率矩阵
+    .csv: 单列预测类别，与原来的pandas.read_csv一致，首行固定视为表头
+          （学生用 df.to_csv(index=False) 写出时首行为列名"0"，无法按内容识别）
+    .npy文件以内存映射方式打开，不会整体读入内存
+
+    返回:
+        (predictions, has_header, probabilities)
+    """
+    if file_path.endswith('.npy'):
+        values = np.load(file_path, mmap_mode='r', allow_pickle=False)
+        if values.ndim == 2:
+            return np.argmax(values, axis=1), False, values
+        return values.ravel(), False, None
+    
+    if file_path.endswith('.npz'):
+        with np.load(file_path, allow_pickle=False) as archive:
+            probabilities = next((archive[key] for key in NPZ_PROBABILITY_KEYS if key in archive.files), None)
+            predictions = next((archive[key] for key in NPZ_PREDICTION_KEYS if key in archive.files), None)
+        if predictions is None:
+            if probabilities is None:
+                raise ValueError(f"{os.path.basename(file_path)}中缺少preds或probs数组")
+            predictions = np.argmax(probabilities, axis=1)
+        return predictions.ravel(), False, probabilities
+    
+    predictions, has_header = load_label_file(file_path, header=True)
+    return predictions, has_header, None
+
+# 已解析的真实标签缓存: 标签文件绝对路径 -> ((mtime_ns, size), 标签数组)
+_labels_cache = {}
+_labels_cache_lock = threading.Lock()
+
+def load_cached_labels(file_path):
+    """
+    读取真实标签文件（首行固定为表头），解析结果按文件路径缓存在进程内，
+    文件的修改时间或大小变化后自动重新解析。返回的数组为只读，多个评测共享
+    """
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _labels_cache_lock:
+        cached = _labels_cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    
+    labels, _ = load_label_file(path, header=True)
+    labels.setflags(write=False)
+    with _labels_cache_lock:
+        _labels_cache[path] = (signature, labels)
+    print(f"已解析并缓存真实标签: {path}，共{len(labels)}个标签")
+    return labels
+
+def invalidate_labels_cache(file_path=None):
+    """清除指定标签文件的缓存，不指定时清除全部"""
+    with _labels_cache_lock:
+        if file_path is None:
+            _labels_cache.clear()
+        else:
+            _labels_cache.pop(os.path.abspath(file_path), None)
+
+def describe_count_mismatch(prediction_count, label_count, has_header):
+    """
+    生成预测结果数量与真实标签数量不匹配时的提示信息
+    预测结果CSV的首行固定作为表头跳过，没有写出表头的文件会恰好比标签少一行
+    """
+    message = f"预测结果数量({prediction_count})与真实标签数量({label_count})不匹配"
+    if has_header and prediction_count == label_count - 1:
+        message += "，预测结果文件首行作为表头跳过，请使用to_csv(index=False)保存（保留列名）"
+    return message
+
+def compute_metrics(predictions, labels, metrics=None, probabilities=None, top_k=DEFAULT_TOP_K):
+    """
+    向量化计算评测指标
+
+    参数:
+        predictions: 预测类别数组
+        labels: 真实标签数组，长度需与predictions一致
+        metrics: 需要计算的指标，见AVAILABLE_METRICS
+        probabilities: 可选的 N x C 概率/得分矩阵，提供时才计算top-k准确率
+        top_k: top-k准确率中的k
+
+    返回:
+        指标字典，始终包含 accuracy、correct、total
+    """
+    metrics = parse_metrics(metrics)
+    predictions = np.asarray(predictions).ravel()
+    labels = np.asarray(labels).ravel()
+    if predictions.shape != labels.shape:
+        raise ValueError(f"预测结果数量({predictions.size})与真实标签数量({labels.size})不匹配")
+
+    total = int(labels.size)
+    correct = int(np.count_nonzero(predictions == labels))
+    result = {
+        'accuracy': round(correct / total * 100, 2) if total else 0.0,
+        'correct': correct,
+        'total': total
+    }
+
+    if 'per_class' in metrics or 'confusion_matrix' in metrics:
+        # 把预测和标签中出现过的类别统一编号后，用一次bincount得到混淆矩阵
+        classes, inverse = np.unique(np.concatenate([labels, predictions]), return_inverse=True)
+        label_index, pred_index = inverse[:total], inverse[total:]
+        num_classes = classes.size
+        confusion = np.bincount(
+            label_index * num_classes + pred_index, minlength=num_classes * num_classes
+        ).reshape(num_classes, num_classes)
+
+        if 'confusion_matrix' in metrics:
+            result['confusion_matrix'] = {
+                'classes': classes.tolist(),
+                'matrix': confusion.tolist()
+            }
+
+        if 'per_class' in metrics:
+            true_positive = np.diag(confusion).astype(np.float64)
+            support = confusion.sum(axis=1)
+            predicted = confusion.sum(axis=0)
+            precision = np.divide(true_positive, predicted, out=np.zeros_like(true_positive), where=predicted > 0)
+            recall = np.divide(true_positive, support, out=np.zeros_like(true_positive), where=support > 0)
+            denominator = precision + recall
+            f1 = np.divide(2 * precision * recall, denominator, out=np.zeros_like(true_positive), where=denominator > 0)
+            result['per_class'] = [
+                {
+                    'class': classes[i].item(),
+                    'precision': round(float(precision[i]), 4),
+                    'recall': round(float(recall[i]), 4),
+                    'f1': round(float(f1[i]), 4),
+                    'support': int(support[i])
+                }
+                for i in range(num_classes)
+            ]
+            present = support > 0
+            result['macro_f1'] = round(float(f1[present].mean()), 4) if present.any() else 0.0
+
+    if 'top_k' in metrics and probabilities is not None:
+        probabilities = np.asarray(probabilities)
+        if probabilities.ndim == 2 and probabilities.shape[0] == total:
+            k = max(1, min(int(top_k), probabilities.shape[1]))
+            # argpartition只找出前k个类别，不需要完整排序
+            top_classes = np.argpartition(-probabilities, k - 1, axis=1)[:, :k]
+            hits = np.any(top_classes == labels.astype(np.int64)[:, None], axis=1)
+            result['top_k'] = {'k': k, 'accuracy': round(float(hits.mean()) * 100, 2)}
+        else:
+            print(f"概率矩阵形状{probabilities.shape}与预测数量{total}不匹配，跳过top-k准确率")
+
+    return result
@@ -0,0 +1,102 @@
+"""
+测试配置：把仓库根目录加入导入路径即可直接运行 pytest
+依赖Flask应用的测试通过app_module fixture使用临时SQLite数据库，不需要MySQL
+"""
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# 测试实验的ID，评测流程按 lab<实验ID> 查找测试数据和学生代码
+TEST_EXPERIMENT_ID = 9001
+
+@pytest.fixture(scope='session')
+def flask_app(tmp_path_factory):
+    """导入app模块，数据库指向临时SQLite文件；app.py在导入时创建数据库引擎，必须先设置DATABASE_URL"""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + str(tmp_path_factory.mktemp('db') / 'test.db')
+    import app as app_module
+    # 测试中不预热forkserver、不恢复评测任务，评测子进程在第一次评测时按默认配置启动
+    app_module._evaluation_services_started = True
+    return app_module
+
+@pytest.fixture
+def app_module(flask_app, tmp_path, monkeypatch):
+    """每个测试使用空的数据库，共享测试数据写到临时目录"""
+    import evaluation
+    monkeypatch.setattr(evaluation, 'SHARED_TESTDATA_ROOT', str(tmp_path / 'shm'))
+    with flask_app.app.app_context():
+        flask_app.create_tables()
+        yield flask_app
+        flask_app.db.session.remove()
+        # SQLite默认不检查外键，按任意顺序清空所有表
+        for table in flask_app.db.metadata.tables.values():
+            flask_app.db.session.execute(table.delete())
+        flask_app.db.session.commit()
+
+def student_code(predictions, extra=''):
+    """按旧的评测方式写出预测结果的学生代码，首行为pandas写出的表头"""
+    return (f"PREDICTIONS = {list(predictions)!r}\n"
+            "def evaluate_model():\n"
+            "    with open('all_preds.csv', 'w') as f:\n"
+            "        f.write('0\\n' + '\\n'.join(str(p) for p in PREDICTIONS) + '\\n')\n"
+            + extra)
+
+class LabExperiment:
+    """测试实验：教师、班级、实验记录，以及 lab<实验ID>/testdata 下的标签文件和 testcode 下的学生提交"""
+
+    def __init__(self, app_module, labels):
+        self.app_module = app_module
+        self.labels = list(labels)
+        self.lab_dir = os.path.join(REPO_DIR, f"lab{TEST_EXPERIMENT_ID}")
+        # 上次测试异常中断时可能留下实验目录
+        shutil.rmtree(self.lab_dir, ignore_errors=True)
+        os.makedirs(os.path.join(self.lab_dir, 'testdata'))
+        with open(os.path.join(self.lab_dir, 'testdata', 'all_labels.csv'), 'w') as f:
+            f.write('label\n' + '\n'.join(str(label) for label in self.labels) + '\n')
+        A = app_module
+        self.teacher = A.User(username='teacher', password='x', user_type=A.UserType.TEACHER, email='t@example.com')
+        A.db.session.add(self.teacher)
+        A.db.session.flush()
+        school_class = A.Class(class_name='测试班级', teacher_id=self.teacher.user_id)
+        A.db.session.add(school_class)
+        A.db.session.flush()
+        self.experiment = A.Experiment(experiment_id=TEST_EXPERIMENT_ID, experiment_name='测试实验',
+                                       class_id=school_class.class_id, teacher_id=self.teacher.user_id,
+                                       description='测试')
+        A.db.session.add(self.experiment)
+        A.db.session.commit()
+
+    def add_submission(self, username, code, files=None):
+        """新建学生并提交 testcode/<用户名>/<用户名>.py 及其他文件，返回提交记录"""
+        A = self.app_module
+        student = A.User.query.filter_by(username=username).first()
+        if not student:
+            student = A.User(username=username, password='x', user_type=A.UserType.STUDENT,
+                             email=f'{username}@example.com')
+            A.db.session.add(student)
+            A.db.session.flush()
+        student_dir = os.path.join(self.lab_dir, 'testcode', username)
+        os.makedirs(student_dir, exist_ok=True)
+        with open(os.path.join(student_dir, f"{username}.py"), 'w') as f:
+            f.write(code)
+        for name, content in (files or {}).items():
+            with open(os.path.join(student_dir, name), 'wb') as f:
+                f.write(content)
+        submission = A.Submission(experiment_id=TEST_EXPERIMENT_ID, student_id=student.user_id,
+                                  file_name=username, file_path=student_dir)
+        A.db.session.add(submission)
+        A.db.session.commit()
+        return submission
+
+@pytest.fixture
+def experiment(app_module):
+    """带有10个标签的测试实验，测试结束后删除实验目录"""
+    lab_experiment = LabExperiment(app_module, [i % 3 for i in range(10)])
+    try:
+        yield lab_experiment
+    finally:
+        shutil.rmtree(lab_experiment.lab_dir, ignore_errors=True)
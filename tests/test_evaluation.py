@@ -0,0 +1,284 @@
+"""
+评测模块测试：并行评测、评测子进程的资源限制和启动方式、平台批量推理、评测结果缓存键、共享测试数据
+"""
+import gzip
+import os
+import struct
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+import evaluation
+from conftest import student_code
+from evaluation import (BoundedOutput, compute_evaluation_cache_key, find_model_weights, find_prediction_file, get_evaluation_context,
+                        hash_file,
+                        installed_modules, link_testdata_for_student, load_mnist_images, prepare_shared_testdata, run_isolated_evaluation, run_student_evaluations,
+                        skip_main_in_children, EVALUATION_PRELOAD_MODULES)
+
+LABELS = np.array([0, 1, 2, 0])
+
+def write_student(tmp_path, name, code):
+    """在 tmp_path/<name>/<name>.py 写出学生代码，返回代码路径"""
+    student_dir = tmp_path / name
+    student_dir.mkdir()
+    code_path = student_dir / f"{name}.py"
+    code_path.write_text(code)
+    return str(code_path)
+
+def test_run_student_evaluations_keeps_input_order(tmp_path):
+    main_files = [
+        write_student(tmp_path, f"student{index}", student_code([0, 1, 2, 0] if index % 2 else [0, 0, 0, 0]))
+        for index in range(4)
+    ]
+    reported = []
+    results = run_student_evaluations(main_files, pool_size=2, true_labels=LABELS,
+                                      on_result=lambda index, result: reported.append(index))
+    assert [result['score'] for result in results] == [50.0, 100.0, 50.0, 100.0]
+    assert sorted(reported) == [0, 1, 2, 3]
+    assert all(result['total'] == 4 for result in results)
+
+def test_wall_clock_timeout_kills_the_child(tmp_path):
+    code_path = write_student(tmp_path, 'sleeper', "import time\ntime.sleep(60)\n")
+    start = time.time()
+    result = run_isolated_evaluation(code_path, limits={'timeout': 1})
+    assert time.time() - start < 10
+    assert result['score'] == 0.0
+    assert '评测超时' in result['message']
+    assert result['telemetry']['wall_time'] >= 1
+
+def test_cpu_time_limit_kills_busy_loop(tmp_path):
+    code_path = write_student(tmp_path, 'spinner', "while True:\n    pass\n")
+    result = run_isolated_evaluation(code_path, limits={'timeout': 60, 'cpu_time': 1})
+    assert result['message'] == '评测超出CPU时间限制，已被终止'
+
+def test_memory_limit_stops_oversized_allocation(tmp_path):
+    code_path = write_student(tmp_path, 'hog', "try:\n    data = bytearray(4 * 1024 ** 3)\n"
+                                               "except MemoryError:\n    print('MemoryError')\n    raise\n")
+    result = run_isolated_evaluation(code_path, limits={'timeout': 60, 'memory_mb': 2048})
+    assert result['score'] == 0.0
+    assert result['message'].startswith('执行学生代码时发生错误')
+    assert 'MemoryError' in result['stdout']
+
+def test_child_crash_is_reported(tmp_path):
+    code_path = write_student(tmp_path, 'crasher', "import os\nos._exit(3)\n")
+    result = run_isolated_evaluation(code_path, limits={'timeout': 60})
+    assert result['message'] == '评测子进程异常退出，退出码: 3'
+
+def test_cancel_event_stops_the_child(tmp_path):
+    code_path = write_student(tmp_path, 'sleeper', "import time\ntime.sleep(60)\n")
+    cancel_event = threading.Event()
+    threading.Timer(0.5, cancel_event.set).start()
+    result = run_isolated_evaluation(code_path, limits={'timeout': 60}, cancel_event=cancel_event)
+    assert result['message'] == '评测任务已取消'
+    assert result['duration'] < 10
+
+def test_bounded_output_keeps_only_the_tail():
+    output = BoundedOutput(limit=12)
+    for index in range(5):
+        output.write(f"line{index}\n")
+    assert output.size == 12
+    assert output.dropped == 18
+    assert output.getvalue() == "...（输出过长，已省略前 18 个字符）\nline3\nline4\n"
+
+def test_bounded_output_handles_single_oversized_write():
+    output = BoundedOutput(limit=4)
+    output.write('ab')
+    output.write('0123456789')
+    assert output.getvalue().endswith('\n6789')
+    assert output.dropped == 8
+    short = BoundedOutput(limit=4)
+    short.write('abc')
+    assert short.getvalue() == 'abc'
+
+def test_preload_modules_cover_student_imports():
+    for name in ('numpy', 'torch', 'torchvision', 'pandas', 'matplotlib.pyplot'):
+        assert name in EVALUATION_PRELOAD_MODULES
+
+def test_installed_modules_skips_missing_libraries():
+    assert installed_modules(['numpy', 'json.decoder', 'no_such_library', 'no_such_library.sub']) == \
+        ['numpy', 'json.decoder']
+
+def test_children_are_forked_from_preloaded_server(tmp_path):
+    # 学生代码导入时还没有导入任何库，能看到的模块都来自forkserver的预加载
+    probe = "import sys\nprint('loaded', sorted(m for m in ('pandas', 'flask', 'app') if m in sys.modules))\n"
+    code_path = write_student(tmp_path, 'probe', probe + student_code(LABELS.tolist()))
+    assert get_evaluation_context().get_start_method() == 'forkserver'
+    result = run_isolated_evaluation(code_path, limits={'timeout': 60}, true_labels=LABELS)
+    assert result['score'] == 100.0
+    assert "loaded ['pandas']" in result['stdout']
+
+def test_skip_main_in_children_marks_script_main(monkeypatch):
+    script_main = types.ModuleType('__main__')
+    monkeypatch.setitem(sys.modules, '__main__', script_main)
+    skip_main_in_children()
+    assert script_main.__spec__.name == '__main__'
+
+def test_find_prediction_file_uses_the_newest_format(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'all_preds.csv').write_text('0\n1\n')
+    np.save(str(tmp_path / 'all_preds.npy'), np.array([1]))
+    os.utime(str(tmp_path / 'all_preds.npy'), (1, 1))
+    assert find_prediction_file() == os.path.join('.', 'all_preds.csv')
+    os.utime(str(tmp_path / 'all_preds.npy'))
+    os.utime(str(tmp_path / 'all_preds.csv'), (1, 1))
+    assert find_prediction_file() == os.path.join('.', 'all_preds.npy')
+
+def test_npy_predictions_are_scored_without_header(tmp_path):
+    code_path = write_student(tmp_path, 'student', "import numpy as np\n"
+                              "def evaluate_model():\n    np.save('all_preds.npy', np.array([0, 1, 2, 1]))\n")
+    result = run_isolated_evaluation(code_path, limits={'timeout': 60}, true_labels=LABELS)
+    assert (result['correct'], result['total'], result['score']) == (3, 4, 75.0)
+
+def write_mnist_images(path, images):
+    """写出idx格式的MNIST图像文件"""
+    images = np.asarray(images, dtype=np.uint8)
+    path.write_bytes(struct.pack('>IIII', 2051, *images.shape) + images.tobytes())
+    return str(path)
+
+def test_load_mnist_images_maps_idx_file(tmp_path):
+    images = np.arange(2 * 28 * 28, dtype=np.uint8).reshape(2, 28, 28)
+    loaded = load_mnist_images(write_mnist_images(tmp_path / 't10k-images-idx3-ubyte', images))
+    assert loaded.shape == (2, 28, 28)
+    assert not loaded.flags.writeable
+    assert np.array_equal(loaded, images)
+
+def test_find_model_weights_prefers_file_named_after_code(tmp_path):
+    for name in ('a.pth', 'student.pt', 'notes.txt'):
+        (tmp_path / name).write_bytes(b'')
+    assert find_model_weights(str(tmp_path), 'student') == str(tmp_path / 'student.pt')
+    assert find_model_weights(str(tmp_path), 'other') == str(tmp_path / 'a.pth')
+
+# 第一个像素值即类别的模型，平台推理的预测结果应与标签一致
+BUILD_MODEL_CODE = """
+import torch
+class FirstPixel(torch.nn.Module):
+    def forward(self, x):
+        return torch.nn.functional.one_hot((x[:, 0, 0, 0] * 255).round().long(), 3).float()
+def build_model():
+    return FirstPixel()
+"""
+
+def test_build_model_submission_needs_test_images(tmp_path):
+    code_path = write_student(tmp_path, 'student', "def build_model():\n    return None\n")
+    result = run_isolated_evaluation(code_path, limits={'timeout': 60}, true_labels=LABELS)
+    assert result['message'].startswith('该实验没有可用于平台推理的测试图像数据')
+
+def test_platform_inference_scores_build_model_submission(tmp_path):
+    pytest.importorskip('torch')
+    images = np.zeros((len(LABELS), 28, 28), dtype=np.uint8)
+    images[:, 0, 0] = LABELS
+    test_images = write_mnist_images(tmp_path / 't10k-images-idx3-ubyte', images)
+    code_path = write_student(tmp_path, 'student', BUILD_MODEL_CODE)
+    result = run_isolated_evaluation(code_path, limits={'timeout': 120, 'memory_mb': 0}, true_labels=LABELS,
+                                     test_images=test_images, metrics=['top_k'])
+    assert result['score'] == 100.0
+    assert result['metrics']['top_k']['accuracy'] == 100.0
+
+def test_cache_key_depends_only_on_code_weights_testdata_and_metrics(tmp_path):
+    (tmp_path / 'lab1').mkdir()
+    code_path = write_student(tmp_path / 'lab1', 'student', "print(1)\n")
+    weights = tmp_path / 'lab1' / 'student' / 'model.pth'
+    weights.write_bytes(b'weights')
+    key = compute_evaluation_cache_key(code_path, 'data')
+
+    # 同样的代码和权重提交到另一个实验目录
+    (tmp_path / 'lab2').mkdir()
+    copy_path = write_student(tmp_path / 'lab2', 'student', "print(1)\n")
+    (tmp_path / 'lab2' / 'student' / 'model.pth').write_bytes(b'weights')
+    assert compute_evaluation_cache_key(copy_path, 'data') == key
+
+    # 评测产生的其他文件不影响缓存键
+    (tmp_path / 'lab1' / 'student' / 'all_preds.csv').write_text('0\n1\n')
+    assert compute_evaluation_cache_key(code_path, 'data') == key
+    assert compute_evaluation_cache_key(code_path, 'data', file_hashes={
+        'student.py': hash_file(code_path), 'model.pth': hash_file(str(weights))}) == key
+
+    assert compute_evaluation_cache_key(code_path, 'new-data') != key
+    assert compute_evaluation_cache_key(code_path, 'data', metrics=['per_class']) != key
+    weights.write_bytes(b'retrained')
+    assert compute_evaluation_cache_key(code_path, 'data') != key
+    weights.write_bytes(b'weights')
+    (tmp_path / 'lab1' / 'student' / 'student.py').write_text("print(2)\n")
+    assert compute_evaluation_cache_key(code_path, 'data') != key
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def write_source(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+def test_shared_testdata_is_published_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(evaluation, 'SHARED_TESTDATA_ROOT', str(tmp_path / 'shm'))
+    labels = write_source(tmp_path / 'all_labels.csv', b'0\n1\n2\n')
+    images = tmp_path / 't10k-images-idx3-ubyte.gz'
+    with gzip.open(str(images), 'wb') as f:
+        f.write(b'images')
+    first = prepare_shared_testdata({'all_labels.csv': labels, images.name: str(images)})
+    second = prepare_shared_testdata({'all_labels.csv': labels, images.name: str(images)})
+    assert dict(first) == dict(second)
+    assert read_bytes(first['t10k-images-idx3-ubyte']) == b'images'
+    assert read_bytes(first['all_labels.csv']) == b'0\n1\n2\n'
+    first.release()
+    second.release()
+
+def test_old_testdata_versions_are_removed_once_unused(tmp_path, monkeypatch):
+    root = tmp_path / 'shm'
+    monkeypatch.setattr(evaluation, 'SHARED_TESTDATA_ROOT', str(root))
+    labels = tmp_path / 'all_labels.csv'
+    other = write_source(tmp_path / 'other.csv', b'9\n')
+    running_job = prepare_shared_testdata({'all_labels.csv': write_source(labels, b'0\n1\n'),
+                                           'other.csv': other})
+    old_dir = os.path.dirname(running_job['all_labels.csv'])
+
+    # 教师重新上传了标签文件，旧版本仍被运行中的评测任务使用，不能删除
+    write_source(labels, b'0\n1\n2\n')
+    new_job = prepare_shared_testdata({'all_labels.csv': str(labels), 'other.csv': other})
+    assert os.path.dirname(new_job['all_labels.csv']) != old_dir
+    assert os.path.isdir(old_dir)
+    assert read_bytes(running_job['all_labels.csv']) == b'0\n1\n'
+
+    # 任务结束后，下次准备数据时删除旧版本，其他文件的数据不受影响
+    running_job.release()
+    prepare_shared_testdata({'all_labels.csv': str(labels), 'other.csv': other}).release()
+    assert not os.path.exists(old_dir)
+    assert sorted(os.listdir(str(root))) == sorted(
+        os.path.basename(os.path.dirname(path)) for path in new_job.values())
+    new_job.release()
+
+def test_student_directories_link_to_shared_testdata(tmp_path, monkeypatch):
+    monkeypatch.setattr(evaluation, 'SHARED_TESTDATA_ROOT', str(tmp_path / 'shm'))
+    labels = tmp_path / 'all_labels.csv'
+    images = write_source(tmp_path / 't10k-images-idx3-ubyte', b'images')
+    shared = prepare_shared_testdata({'all_labels.csv': write_source(labels, b'0\n1\n'),
+                                      't10k-images-idx3-ubyte': images})
+    lab_dir = tmp_path / 'lab7'
+    (lab_dir / 'testcode').mkdir(parents=True)
+    code_path = write_student(lab_dir / 'testcode', 'student', 'print(1)\n')
+    link_testdata_for_student(code_path, shared)
+    student_labels = lab_dir / 'testcode' / 'student' / 'all_labels.csv'
+    assert os.readlink(str(student_labels)) == shared['all_labels.csv']
+    assert os.readlink(str(lab_dir / 'testdata' / 't10k-images-idx3-ubyte')) == shared['t10k-images-idx3-ubyte']
+
+    # 测试数据更新后链接指向新版本
+    write_source(labels, b'0\n1\n2\n')
+    updated = prepare_shared_testdata({'all_labels.csv': str(labels), 't10k-images-idx3-ubyte': images})
+    link_testdata_for_student(code_path, updated, needs_mnist=False)
+    assert read_bytes(str(student_labels)) == b'0\n1\n2\n'
+    shared.release()
+    updated.release()
+
+def test_student_files_are_not_replaced_by_links(tmp_path, monkeypatch):
+    monkeypatch.setattr(evaluation, 'SHARED_TESTDATA_ROOT', str(tmp_path / 'shm'))
+    shared = prepare_shared_testdata({'all_labels.csv': write_source(tmp_path / 'all_labels.csv', b'0\n')})
+    code_path = write_student(tmp_path, 'student', 'print(1)\n')
+    own_labels = write_source(tmp_path / 'student' / 'all_labels.csv', b'own\n')
+    link_testdata_for_student(code_path, shared, needs_mnist=False)
+    assert not os.path.islink(own_labels)
+    assert read_bytes(own_labels) == b'own\n'
+    shared.release()
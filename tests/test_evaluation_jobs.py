@@ -0,0 +1,225 @@
+"""
+评测任务测试：/test 创建的后台评测任务，使用临时SQLite数据库和 lab<实验ID> 下的测试实验
+"""
+import json
+import time
+
+from conftest import student_code, TEST_EXPERIMENT_ID
+
+def wait_for_job(app_module, job_id, timeout=60):
+    """等待评测任务结束，返回任务记录"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        app_module.db.session.expire_all()
+        job = app_module.EvaluationJob.query.get(job_id)
+        if job.status not in ['queued', 'running']:
+            return job
+        time.sleep(0.2)
+    raise AssertionError(f"评测任务 {job_id} 未在{timeout}秒内结束")
+
+def test_test_endpoint_evaluates_every_student(app_module, experiment):
+    labels = experiment.labels
+    experiment.add_submission('alice', student_code(labels))
+    experiment.add_submission('bob', student_code([0] * len(labels)))
+    client = app_module.app.test_client()
+
+    response = client.get(f'/test?experimentId={TEST_EXPERIMENT_ID}')
+    assert response.get_json()['code'] == 200
+    job = wait_for_job(app_module, response.get_json()['data']['job_id'])
+    assert job.status == 'completed'
+    assert job.evaluated_count == 2
+
+    data = client.get(f'/test/jobs/{job.job_id}/results').get_json()['data']
+    scores = {result['student_id']: result['score'] for result in data['results']}
+    students = {user.username: user.user_id for user in app_module.User.query.all()}
+    assert scores == {students['alice']: 100.0, students['bob']: 40.0}
+
+def test_test_endpoint_requires_submissions(app_module, experiment):
+    response = app_module.app.test_client().get(f'/test?experimentId={TEST_EXPERIMENT_ID}')
+    assert response.status_code == 400
+
+SLOW_CODE = "import time\ndef evaluate_model():\n    time.sleep(60)\n"
+
+def wait_for_item_status(app_module, job_id, status, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        app_module.db.session.expire_all()
+        if app_module.EvaluationJobItem.query.filter_by(job_id=job_id, status=status).count():
+            return
+        time.sleep(0.1)
+    raise AssertionError(f"评测任务 {job_id} 中没有状态为 {status} 的学生")
+
+def test_job_progress_and_results(app_module, experiment):
+    experiment.add_submission('alice', student_code(experiment.labels))
+    job = app_module.create_evaluation_job(experiment.experiment, app_module.Submission.query.all())
+    client = app_module.app.test_client()
+
+    data = client.get(f'/test/jobs/{job.job_id}').get_json()['data']
+    assert (data['status'], data['total'], data['done']) == ('queued', 1, 0)
+    assert [item['status'] for item in data['items']] == ['pending']
+    assert client.get(f'/test/jobs/{job.job_id}/results').status_code == 202
+
+    app_module.run_evaluation_job(job.job_id)
+    # 测试客户端的请求沿用测试中的应用上下文和数据库会话，重新读取评测线程写入的状态
+    app_module.db.session.expire_all()
+    data = client.get(f'/test/jobs/{job.job_id}').get_json()['data']
+    assert (data['status'], data['done'], data['evaluated_count']) == ('completed', 1, 1)
+    assert data['started_at'] and data['finished_at']
+    results = client.get(f'/test/jobs/{job.job_id}/results').get_json()['data']['results']
+    assert [(result['status'], result['score']) for result in results] == [('success', 100.0)]
+
+def test_cancel_kills_running_evaluation(app_module, experiment):
+    experiment.add_submission('slow', SLOW_CODE)
+    experiment.add_submission('waiting', SLOW_CODE)
+    client = app_module.app.test_client()
+    job_id = client.get(f'/test?experimentId={TEST_EXPERIMENT_ID}&parallel=false').get_json()['data']['job_id']
+    wait_for_item_status(app_module, job_id, 'running')
+
+    start = time.time()
+    response = client.post(f'/test/jobs/{job_id}/cancel')
+    assert response.get_json()['data']['cancel_requested']
+    job = wait_for_job(app_module, job_id, timeout=30)
+    # 正在执行的评测子进程被结束，不会等到学生代码运行完
+    assert time.time() - start < 30
+    assert job.status == 'cancelled'
+    assert [item.status for item in job.items] == ['cancelled', 'cancelled']
+    assert client.post(f'/test/jobs/{job_id}/cancel').status_code == 400
+
+def test_job_cancelled_before_start_runs_nothing(app_module, experiment):
+    experiment.add_submission('alice', student_code(experiment.labels))
+    job = app_module.create_evaluation_job(experiment.experiment, app_module.Submission.query.all())
+    job.cancel_requested = True
+    app_module.db.session.commit()
+
+    app_module.run_evaluation_job(job.job_id)
+    app_module.db.session.expire_all()
+    job = app_module.EvaluationJob.query.get(job.job_id)
+    assert job.status == 'cancelled'
+    assert app_module.Grade.query.count() == 0
+
+def test_unknown_job_is_404(app_module):
+    client = app_module.app.test_client()
+    assert client.get('/test/jobs/12345').status_code == 404
+    assert client.post('/test/jobs/12345/cancel').status_code == 404
+
+def run_job(app_module, experiment, force_rerun=False):
+    """创建并在当前线程中执行评测任务，返回唯一学生的评测记录"""
+    Submission = app_module.Submission
+    submissions = Submission.query.order_by(Submission.submission_id.desc()).all()
+    job = app_module.create_evaluation_job(experiment.experiment, submissions, force_rerun=force_rerun)
+    app_module.run_evaluation_job(job.job_id)
+    app_module.db.session.expire_all()
+    return app_module.EvaluationJob.query.get(job.job_id).items[0]
+
+def test_unchanged_submission_reuses_cached_result(app_module, experiment):
+    experiment.add_submission('alice', student_code(experiment.labels))
+    first = run_job(app_module, experiment)
+    assert not json.loads(first.details).get('cached')
+
+    second = run_job(app_module, experiment)
+    assert (second.status, float(second.score)) == ('success', 100.0)
+    assert json.loads(second.details)['cached']
+    assert app_module.EvaluationCache.query.one().hit_count == 1
+
+    # force=true 时忽略缓存
+    assert not json.loads(run_job(app_module, experiment, force_rerun=True).details).get('cached')
+
+def test_changed_code_misses_the_cache(app_module, experiment):
+    experiment.add_submission('alice', student_code(experiment.labels))
+    run_job(app_module, experiment)
+    experiment.add_submission('alice', student_code([0] * len(experiment.labels)))
+    item = run_job(app_module, experiment)
+    assert not json.loads(item.details).get('cached')
+    assert float(item.score) == 40.0
+
+def read_sse_events(response):
+    """解析Server-Sent Events响应，返回 (事件名, 数据) 列表，跳过心跳注释"""
+    events = []
+    for block in response.get_data(as_text=True).split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+def test_stream_pushes_each_result_then_summary(app_module, experiment):
+    experiment.add_submission('alice', student_code(experiment.labels))
+    # bob的代码导入时等待1秒，两个学生的结果分两次推送
+    experiment.add_submission('bob', "import time\ntime.sleep(1)\n" + student_code([0] * len(experiment.labels)))
+    job = app_module.create_evaluation_job(experiment.experiment, app_module.Submission.query.all(), pool_size=2)
+    thread = app_module.start_evaluation_job(job.job_id)
+
+    response = app_module.app.test_client().get(f'/test/jobs/{job.job_id}/stream')
+    assert response.mimetype == 'text/event-stream'
+    events = read_sse_events(response)
+    thread.join(30)
+    assert [name for name, _ in events] == ['result', 'result', 'summary']
+    assert [data['done'] for _, data in events[:2]] == [1, 2]
+    assert all(data['duration'] is not None for _, data in events[:2])
+    assert events[-1][1]['status'] == 'completed'
+
+def test_stream_replays_finished_job(app_module, experiment):
+    experiment.add_submission('alice', student_code(experiment.labels))
+    item = run_job(app_module, experiment)
+    response = app_module.app.test_client().get(f'/test/jobs/{item.job_id}/stream')
+    events = read_sse_events(response)
+    assert [name for name, _ in events] == ['result', 'summary']
+    assert (events[0][1]['student_id'], events[0][1]['score']) == (item.student_id, 100.0)
+
+def test_eager_evaluation_is_off_by_default(app_module, experiment):
+    submission = experiment.add_submission('alice', student_code(experiment.labels))
+    assert app_module.queue_eager_evaluation(experiment.experiment, submission.student_id) is None
+    assert app_module.EvaluationJob.query.count() == 0
+
+def test_eager_evaluation_grades_upload_and_fills_cache(app_module, experiment):
+    response = app_module.app.test_client().post(
+        '/teacher/experiment/evaluation-settings',
+        json={'experiment_id': TEST_EXPERIMENT_ID, 'eager_evaluation': True},
+        headers={'User-ID': str(experiment.teacher.user_id)}
+    )
+    assert response.get_json()['data']['eager_evaluation']
+    submission = experiment.add_submission('alice', student_code(experiment.labels))
+
+    job = app_module.queue_eager_evaluation(experiment.experiment, submission.student_id)
+    assert job.priority == app_module.PRIORITY_BACKGROUND
+    assert wait_for_job(app_module, job.job_id).status == 'completed'
+    assert float(app_module.Grade.query.filter_by(submission_id=submission.submission_id).one().score) == 100.0
+
+    # 教师之后发起的评测直接使用上传后评测的结果
+    assert json.loads(run_job(app_module, experiment).details)['cached']
+
+def test_telemetry_is_recorded_only_when_code_runs(app_module, experiment):
+    experiment.add_submission('alice', "import time\ntime.sleep(0.3)\n" + student_code(experiment.labels))
+    run_job(app_module, experiment)
+    run_job(app_module, experiment)
+    record = app_module.EvaluationTelemetry.query.one()
+    assert record.wall_time >= 0.3
+    assert record.import_time >= 0.3
+    assert record.peak_rss_mb > 0
+    assert record.cpu_user is not None and record.inference_time is not None
+
+    response = app_module.app.test_client().get(
+        f'/teacher/experiment/evaluation-telemetry?experimentId={TEST_EXPERIMENT_ID}&sort=peak_rss_mb',
+        headers={'User-ID': str(experiment.teacher.user_id)}
+    )
+    data = response.get_json()['data']
+    assert data['summary']['count'] == 1
+    assert data['items'][0]['student_name'] == 'alice'
+    assert data['summary']['wall_time']['max'] == record.wall_time
+
+def test_every_run_is_kept_with_compressed_logs(app_module, experiment):
+    submission = experiment.add_submission('alice', "print('hello from alice')\n" + student_code(experiment.labels))
+    run_job(app_module, experiment)
+    run_job(app_module, experiment)
+    client = app_module.app.test_client()
+
+    runs = client.get(f'/test/runs?submissionId={submission.submission_id}').get_json()['data']
+    assert [(run['attempt'], run['cached']) for run in runs] == [(2, True), (1, False)]
+    assert 'stdout' not in runs[0]
+    stored = app_module.EvaluationRun.query.get(runs[1]['run_id'])
+    assert b'hello from alice' not in stored.stdout
+
+    logs = client.get(f"/test/runs/{runs[1]['run_id']}/logs").get_json()['data']
+    assert 'hello from alice' in logs['stdout']
+    assert logs['log_size'] == len(logs['stdout']) + len(logs['stderr'])
+    assert client.get('/test/runs').status_code == 400
+    assert client.get('/test/runs/12345/logs').status_code == 404
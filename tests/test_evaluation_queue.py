@@ -0,0 +1,91 @@
+"""
+数据库评测队列测试：领取、租约过期后重新领取、评测节点执行和取消，使用临时SQLite数据库
+（SQLite不支持 SKIP LOCKED，领取时的条件更新同样保证一个评测只被一个节点领取）
+"""
+from datetime import datetime, timedelta
+
+from conftest import student_code, TEST_EXPERIMENT_ID
+
+def enqueue_job(app_module, experiment, priority=None):
+    """为实验的所有提交创建评测任务并写入评测队列"""
+    job = app_module.create_evaluation_job(experiment.experiment, app_module.Submission.query.all(),
+                                           priority=app_module.PRIORITY_NORMAL if priority is None else priority)
+    app_module.enqueue_evaluation_job(job.job_id)
+    return job
+
+def test_each_entry_is_claimed_by_one_worker(app_module, experiment):
+    experiment.add_submission('alice', student_code(experiment.labels))
+    experiment.add_submission('bob', student_code(experiment.labels))
+    job = enqueue_job(app_module, experiment)
+    # 重复写入队列不会产生重复的评测
+    assert app_module.enqueue_evaluation_job(job.job_id) == 0
+
+    first = app_module.claim_evaluation_entry('worker-1')
+    second = app_module.claim_evaluation_entry('worker-2')
+    assert {first.item_id, second.item_id} == set(item.item_id for item in job.items)
+    assert (first.status, first.worker_id, first.attempts) == ('claimed', 'worker-1', 1)
+    assert app_module.claim_evaluation_entry('worker-3') is None
+
+def test_single_student_reevaluation_is_claimed_first(app_module, experiment):
+    experiment.add_submission('alice', student_code(experiment.labels))
+    enqueue_job(app_module, experiment)
+    urgent = enqueue_job(app_module, experiment, priority=app_module.PRIORITY_SINGLE)
+    assert app_module.claim_evaluation_entry('worker-1').job_id == urgent.job_id
+
+def test_expired_lease_is_reclaimed_by_another_worker(app_module, experiment):
+    experiment.add_submission('alice', student_code(experiment.labels))
+    enqueue_job(app_module, experiment)
+    entry = app_module.claim_evaluation_entry('worker-1')
+    assert app_module.renew_evaluation_lease(entry.entry_id, 'worker-1')
+    assert app_module.claim_evaluation_entry('worker-2') is None
+
+    # worker-1 崩溃，租约过期
+    entry.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+    app_module.db.session.commit()
+    reclaimed = app_module.claim_evaluation_entry('worker-2')
+    assert (reclaimed.entry_id, reclaimed.worker_id, reclaimed.attempts) == (entry.entry_id, 'worker-2', 2)
+
+    # 原节点恢复后不能续约，也不能完成已被重新领取的评测
+    assert not app_module.renew_evaluation_lease(entry.entry_id, 'worker-1')
+    assert not app_module.complete_evaluation_entry(entry.entry_id, 'worker-1')
+    assert app_module.complete_evaluation_entry(entry.entry_id, 'worker-2')
+    assert app_module.EvaluationQueueEntry.query.get(entry.entry_id).status == 'done'
+
+def test_worker_evaluates_claimed_entry_and_finishes_job(app_module, experiment):
+    from eval_worker import EvaluationWorker
+    submission = experiment.add_submission('alice', student_code(experiment.labels))
+    job = enqueue_job(app_module, experiment)
+    worker = EvaluationWorker('worker-1', slots=1)
+
+    worker.process_entry(app_module.claim_evaluation_entry('worker-1'))
+    app_module.db.session.expire_all()
+    job = app_module.EvaluationJob.query.get(job.job_id)
+    assert (job.status, job.evaluated_count) == ('completed', 1)
+    assert float(app_module.Grade.query.filter_by(submission_id=submission.submission_id).one().score) == 100.0
+    assert app_module.EvaluationQueueEntry.query.one().status == 'done'
+    # 任务结束后不再缓存评测上下文
+    assert not worker._contexts
+
+def test_entry_over_max_attempts_is_not_retried(app_module, experiment):
+    from eval_worker import EvaluationWorker
+    experiment.add_submission('alice', student_code(experiment.labels))
+    job = enqueue_job(app_module, experiment)
+    entry = app_module.claim_evaluation_entry('worker-1')
+    entry.attempts = app_module.app.config['EVAL_MAX_ATTEMPTS'] + 1
+    app_module.db.session.commit()
+
+    EvaluationWorker('worker-1', slots=1).process_entry(entry)
+    assert job.items[0].status == 'error'
+    assert app_module.EvaluationJob.query.get(job.job_id).status == 'completed'
+
+def test_cancel_in_queue_mode_drops_pending_entries(app_module, experiment, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'EVAL_EXECUTION_MODE', 'queue')
+    experiment.add_submission('alice', student_code(experiment.labels))
+    client = app_module.app.test_client()
+    job_id = client.get(f'/test?experimentId={TEST_EXPERIMENT_ID}').get_json()['data']['job_id']
+    assert app_module.EvaluationQueueEntry.query.filter_by(job_id=job_id, status='pending').count() == 1
+
+    assert client.post(f'/test/jobs/{job_id}/cancel').status_code == 200
+    app_module.db.session.expire_all()
+    assert app_module.EvaluationJob.query.get(job_id).status == 'cancelled'
+    assert app_module.claim_evaluation_entry('worker-1') is None
@@ -0,0 +1,87 @@
+"""
+成绩批量写入测试：upsert_grades 的新增/更新计数、GradeBuffer 的缓冲、回调和逐条写入的降级
+"""
+import time
+
+from conftest import student_code
+
+def grade_row(app_module, experiment, submission, score):
+    return {'submission_id': submission.submission_id, 'experiment_id': experiment.experiment.experiment_id,
+            'student_id': submission.student_id, 'score': score, 'graded_by': experiment.teacher.user_id,
+            'graded_at': None}
+
+def scores(app_module):
+    return {grade.submission_id: float(grade.score) for grade in app_module.Grade.query.all()}
+
+def test_upsert_grades_inserts_and_updates(app_module, experiment):
+    alice = experiment.add_submission('alice', student_code(experiment.labels))
+    bob = experiment.add_submission('bob', student_code(experiment.labels))
+    assert app_module.upsert_grades([grade_row(app_module, experiment, alice, 50.0)]) == (1, 0)
+    assert app_module.upsert_grades([grade_row(app_module, experiment, alice, 80.0),
+                                     grade_row(app_module, experiment, bob, 60.0)]) == (1, 1)
+    assert scores(app_module) == {alice.submission_id: 80.0, bob.submission_id: 60.0}
+    assert app_module.upsert_grades([]) == (0, 0)
+
+def test_grade_buffer_writes_in_batches_and_keeps_latest_score(app_module, experiment):
+    submissions = [experiment.add_submission(name, student_code(experiment.labels)) for name in ('a', 'b', 'c')]
+    saved = []
+    buffer = app_module.GradeBuffer(flush_size=3, flush_interval=3600)
+
+    def add(submission, score):
+        buffer.add(submission.submission_id, experiment.experiment.experiment_id, submission.student_id, score,
+                   experiment.teacher.user_id, on_saved=lambda: saved.append((submission.submission_id, score)))
+
+    add(submissions[0], 10.0)
+    add(submissions[0], 20.0)
+    add(submissions[1], 30.0)
+    # 同一提交只保留最新的成绩，缓冲未满时不写入，也不记录评测成功
+    assert app_module.Grade.query.count() == 0 and not saved
+    add(submissions[2], 40.0)
+    assert scores(app_module) == {submissions[0].submission_id: 20.0, submissions[1].submission_id: 30.0,
+                                  submissions[2].submission_id: 40.0}
+    assert sorted(saved) == sorted((s.submission_id, score) for s, score in zip(submissions, (20.0, 30.0, 40.0)))
+
+    add(submissions[0], 90.0)
+    assert buffer.flush() == 1
+    assert (buffer.inserted, buffer.updated, buffer.flushes) == (3, 1, 2)
+    assert buffer.summary() == '成绩写入: 新增3条，更新1条'
+
+def test_grade_buffer_flushes_when_interval_passes(app_module, experiment):
+    submission = experiment.add_submission('alice', student_code(experiment.labels))
+    buffer = app_module.GradeBuffer(flush_size=100, flush_interval=3600)
+    buffer.add(submission.submission_id, experiment.experiment.experiment_id, submission.student_id, 70.0,
+               experiment.teacher.user_id)
+    assert buffer.flush_if_due() == 0
+    buffer.last_flush = time.time() - 3600
+    assert buffer.flush_if_due() == 1
+    assert scores(app_module) == {submission.submission_id: 70.0}
+
+def test_grade_buffer_falls_back_to_single_rows(app_module, experiment):
+    good = experiment.add_submission('alice', student_code(experiment.labels))
+    bad = experiment.add_submission('bob', student_code(experiment.labels))
+    events = []
+    buffer = app_module.GradeBuffer(flush_size=10)
+    for submission, score in ((good, 100.0), (bad, None)):
+        buffer.add(submission.submission_id, experiment.experiment.experiment_id, submission.student_id, score,
+                   experiment.teacher.user_id, on_saved=lambda s=submission: events.append(('saved', s.student_id)),
+                   on_failed=lambda s=submission: events.append(('failed', s.student_id)))
+    buffer.flush()
+    # 批量写入因一条无效成绩失败后逐条写入，只有该学生记为保存失败
+    assert sorted(events) == [('failed', bad.student_id), ('saved', good.student_id)]
+    assert scores(app_module) == {good.submission_id: 100.0}
+    assert (buffer.inserted, buffer.failed) == (1, 1)
+
+def test_grade_is_written_as_soon_as_student_finishes(app_module, experiment):
+    fast = experiment.add_submission('fast', student_code(experiment.labels))
+    experiment.add_submission('slow', "import time\ntime.sleep(3)\n" + student_code(experiment.labels))
+    job = app_module.create_evaluation_job(experiment.experiment, app_module.Submission.query.all(), pool_size=2)
+    thread = app_module.start_evaluation_job(job.job_id)
+
+    deadline = time.time() + 30
+    while time.time() < deadline and fast.submission_id not in scores(app_module):
+        app_module.db.session.expire_all()
+        time.sleep(0.1)
+    app_module.db.session.expire_all()
+    assert scores(app_module) == {fast.submission_id: 100.0}
+    assert app_module.EvaluationJob.query.get(job.job_id).status == 'running'
+    thread.join(30)
@@ -0,0 +1,75 @@
+"""
+离线批量评测工具测试：对临时实验目录执行预检、评测和评分，输出CSV/JSON
+"""
+import csv
+import json
+import subprocess
+import sys
+
+import evaluation
+import grader_cli
+from conftest import student_code, REPO_DIR
+from grader_cli import grade_experiment, write_records
+
+LABELS = [0, 1, 2, 0]
+
+def make_experiment(tmp_path):
+    """alice全对、bob对一半、carol预检不通过、dave提交的是testcode下的单个文件"""
+    experiment_dir = tmp_path / 'lab1'
+    (experiment_dir / 'testdata').mkdir(parents=True)
+    (experiment_dir / 'testdata' / 'all_labels.csv').write_text('label\n' + '\n'.join(map(str, LABELS)) + '\n')
+    submissions = {
+        'alice/alice.py': student_code(LABELS),
+        'bob/bob.py': student_code([0, 0, 2, 2]),
+        'carol/carol.py': 'import subprocess\n' + student_code(LABELS),
+        'dave.py': student_code(LABELS),
+    }
+    for path, code in submissions.items():
+        code_path = experiment_dir / 'testcode' / path
+        code_path.parent.mkdir(parents=True, exist_ok=True)
+        code_path.write_text(code)
+    return str(experiment_dir)
+
+def test_grade_experiment(tmp_path, monkeypatch):
+    monkeypatch.setattr(evaluation, 'SHARED_TESTDATA_ROOT', str(tmp_path / 'shm'))
+    records = grade_experiment(make_experiment(tmp_path), workers=2, limits={'timeout': 60})
+    summary = [(record['student'], record['status'], record['score']) for record in records]
+    assert summary == [('alice', 'success', 100.0), ('bob', 'success', 50.0),
+                       ('carol', 'preflight_failed', 0.0), ('dave', 'success', 100.0)]
+    assert 'subprocess' in records[2]['message']
+    assert records[0]['peak_rss_mb'] and records[0]['duration'] is not None
+    assert records[0]['experiment'] == 'lab1'
+
+def test_grade_experiment_only_selected_students(tmp_path, monkeypatch):
+    monkeypatch.setattr(evaluation, 'SHARED_TESTDATA_ROOT', str(tmp_path / 'shm'))
+    records = grade_experiment(make_experiment(tmp_path), students={'bob'}, limits={'timeout': 60})
+    assert [record['student'] for record in records] == ['bob']
+
+def test_write_records_csv_and_json(tmp_path):
+    records = [grader_cli.make_record('lab1', 'alice', 'success', '评测成功', 'alice.py',
+                                      {'score': 100.0, 'total': 4, 'metrics': {'per_class': {}}})]
+    write_records(records, str(tmp_path / 'grades.csv'))
+    with open(str(tmp_path / 'grades.csv'), encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == grader_cli.OUTPUT_FIELDS
+    assert (rows[0]['student'], rows[0]['score'], rows[0]['message']) == ('alice', '100.0', '评测成功')
+
+    write_records(records, str(tmp_path / 'grades.json'))
+    with open(str(tmp_path / 'grades.json'), encoding='utf-8') as f:
+        assert json.load(f)[0]['metrics'] == {'per_class': {}}
+
+def test_main_writes_output(tmp_path, monkeypatch):
+    monkeypatch.setattr(evaluation, 'SHARED_TESTDATA_ROOT', str(tmp_path / 'shm'))
+    output = str(tmp_path / 'scores.json')
+    monkeypatch.setattr(sys, 'argv', ['grader_cli.py', make_experiment(tmp_path), str(tmp_path / 'missing'),
+                                      '--workers', '2', '--timeout', '60', '--output', output, '--include-logs'])
+    grader_cli.main()
+    with open(output, encoding='utf-8') as f:
+        records = json.load(f)
+    assert [record['student'] for record in records] == ['alice', 'bob', 'carol', 'dave']
+    assert 'stdout' in records[0]
+
+def test_grader_does_not_import_flask_or_database_drivers():
+    code = "import sys, grader_cli; print(sorted(m for m in ('flask', 'flask_sqlalchemy', 'pymysql') if m in sys.modules))"
+    output = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == '[]'
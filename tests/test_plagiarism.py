@@ -0,0 +1,309 @@
+"""
+查重模块测试：权重文件解析和逐层比较、MinHash签名和LSH候选对、代码winnowing指纹和相似度矩阵
+"""
+import os
+import pickle
+import shutil
+import zipfile
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pytest
+
+import plagiarism
+from plagiarism import (load_state_dict, match_layers, compare_state_dicts, compare_weight_files, get_risk_level,
+                        minhash, minhash_similarity, signature_to_bytes, signature_from_bytes, weight_minhash,
+                        tokenize_code, LSHIndex, MINHASH_PERMUTATIONS, WEIGHT_LSH_BANDS, winnow,
+                        compute_code_fingerprints, code_fingerprints_to_bytes, code_fingerprints_from_bytes,
+                        compare_code_fingerprints, find_code_candidates, similarity_matrix,
+                        minhash_similarity_block, code_similarity_block, top_neighbours)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAB7_WEIGHTS = [
+    os.path.join(REPO_DIR, 'lab7', 'testcode', student, student + '.pth')
+    for student in ('2021064040401', '2022074080114')
+]
+
+TRAIN_SOURCE = """import torch
+
+def train(model, loader, optimizer, epochs=5):
+    model.train()
+    for epoch in range(epochs):
+        total = 0
+        for images, labels in loader:
+            optimizer.zero_grad()
+            outputs = model(images)
+            loss = torch.nn.functional.cross_entropy(outputs, labels)
+            loss.backward()
+            optimizer.step()
+            total += loss.item()
+        print(epoch, total / len(loader))
+    return model
+"""
+
+# 改了变量名、前面多了一个函数（3行）的抄袭代码
+COPIED_SOURCE = """def helper(a, b):
+    return [a[i] * b for i in range(len(a)) if a[i] > 0]
+
+""" + TRAIN_SOURCE.replace('model', 'net').replace('loader', 'data').replace('total', 'acc')
+
+OTHER_SOURCE = """import numpy as np
+
+def evaluate(weights, inputs):
+    scores = np.dot(inputs, weights)
+    best = np.argmax(scores, axis=1)
+    with open('all_preds.csv', 'w') as f:
+        for value in best:
+            f.write(str(value) + '\\n')
+    return best
+"""
+
+class ArrayStateDict:
+    """与plagiarism.StateDict接口相同、直接由numpy数组构成的state_dict"""
+
+    def __init__(self, arrays):
+        self.arrays = OrderedDict(arrays)
+
+    def names(self):
+        return list(self.arrays)
+
+    def shape(self, name):
+        return self.arrays[name].shape
+
+    def numel(self, name):
+        return self.arrays[name].size
+
+    def array(self, name):
+        return self.arrays[name]
+
+    def norm(self, name):
+        return float(np.linalg.norm(self.arrays[name].ravel().astype(np.float64)))
+
+def make_layers(seed=0):
+    random = np.random.RandomState(seed)
+    return OrderedDict([
+        ('conv.weight', random.randn(8, 1, 3, 3).astype(np.float32)),
+        ('conv.bias', random.randn(8).astype(np.float32)),
+        ('fc.weight', random.randn(10, 32).astype(np.float32)),
+        ('fc.bias', np.zeros(10, dtype=np.float32)),
+    ])
+
+def test_identical_state_dicts_are_complete_copies():
+    result = compare_state_dicts(ArrayStateDict(make_layers()), ArrayStateDict(make_layers()))
+    assert result['similarity'] == 100
+    assert result['identical_fraction'] == 1.0
+    assert result['matched_layers'] == result['total_layers'] == 4
+    # 参数量不足MIN_COPIED_LAYER_PARAMS的偏置和全零层不计为复制的层
+    assert result['copied_layers'] == 2
+    assert get_risk_level(result['similarity'], result['copied_layers']) == "完全重复"
+
+def test_fine_tuned_copy_is_below_100_but_keeps_copied_layers():
+    copied = make_layers()
+    copied['fc.weight'] = copied['fc.weight'] + np.float32(1e-3)
+    result = compare_state_dicts(ArrayStateDict(make_layers()), ArrayStateDict(copied))
+    assert 99 <= result['similarity'] < 100
+    assert result['copied_layers'] == 1
+    assert get_risk_level(result['similarity'], result['copied_layers']) == "极高风险"
+
+def test_independent_weights_are_low_risk():
+    result = compare_state_dicts(ArrayStateDict(make_layers(0)), ArrayStateDict(make_layers(1)))
+    assert result['similarity'] < 50
+    assert result['copied_layers'] == 0
+    assert get_risk_level(result['similarity'], result['copied_layers']) == "低风险"
+
+def test_renamed_modules_are_matched_by_order():
+    layers = make_layers()
+    renamed = OrderedDict((f"wrapper.{name}", array) for name, array in layers.items())
+    pairs, unmatched = match_layers(ArrayStateDict(layers), ArrayStateDict(renamed))
+    assert pairs == [(name, f"wrapper.{name}") for name in layers]
+    assert unmatched == []
+    assert compare_state_dicts(ArrayStateDict(layers), ArrayStateDict(renamed))['similarity'] == 100
+
+def test_unmatched_layers_count_as_dissimilar():
+    layers = make_layers()
+    extra = OrderedDict(layers)
+    extra['head.weight'] = np.ones((100, 10), dtype=np.float32)
+    result = compare_state_dicts(ArrayStateDict(layers), ArrayStateDict(extra))
+    assert result['unmatched_layers'] == ['head.weight']
+    assert result['similarity'] < 100
+
+def test_risk_level_thresholds():
+    assert get_risk_level(99.5) == "极高风险"
+    assert get_risk_level(96) == "高风险"
+    assert get_risk_level(50, copied_layers=1) == "高风险"
+    assert get_risk_level(92) == "中等风险"
+    assert get_risk_level(80) == "低风险"
+
+def test_load_state_dict_reads_torch_zip_without_torch():
+    state_dict = load_state_dict(LAB7_WEIGHTS[0])
+    assert state_dict.names()
+    for name in state_dict.names():
+        array = state_dict.array(name)
+        assert array.shape == state_dict.shape(name)
+        assert array.size == state_dict.numel(name)
+    assert compare_weight_files(LAB7_WEIGHTS[0], LAB7_WEIGHTS[0])['similarity'] == 100
+    assert compare_weight_files(LAB7_WEIGHTS[0], LAB7_WEIGHTS[1])['similarity'] < 90
+
+def test_load_state_dict_rejects_pickled_objects(tmp_path):
+    # 不是state_dict的对象（如直接保存的整个模型）不会被反序列化
+    path = tmp_path / 'model.pth'
+    with zipfile.ZipFile(str(path), 'w') as archive:
+        archive.writestr('archive/data.pkl', pickle.dumps(Counter(a=1), protocol=2))
+    with pytest.raises(ValueError):
+        load_state_dict(str(path))
+
+def test_load_state_dict_rejects_missing_file(tmp_path):
+    with pytest.raises(ValueError):
+        load_state_dict(str(tmp_path / 'missing.pth'))
+
+def test_load_state_dict_is_cached_until_file_changes(tmp_path):
+    path = tmp_path / 'weights.pth'
+    shutil.copyfile(LAB7_WEIGHTS[0], str(path))
+    first = load_state_dict(str(path))
+    assert load_state_dict(str(path)) is first
+    shutil.copyfile(LAB7_WEIGHTS[1], str(path))
+    assert load_state_dict(str(path)) is not first
+    plagiarism._state_dict_cache.clear()
+
+def test_minhash_estimates_jaccard_similarity():
+    hashes = np.arange(1000, dtype=np.uint64)
+    signature = minhash(hashes)
+    assert signature.dtype == np.uint32 and signature.size == MINHASH_PERMUTATIONS
+    # 元素顺序和重复不影响签名
+    assert np.array_equal(minhash(np.concatenate([hashes[::-1], hashes[:10]])), signature)
+    half = minhash(np.arange(500, 1500, dtype=np.uint64))  # Jaccard相似度为 500/1500
+    assert abs(minhash_similarity(signature, half) - 1 / 3) < 0.15
+    assert minhash_similarity(signature, signature) == 1.0
+    assert minhash(np.zeros(0, dtype=np.uint64)) is None
+
+def test_signature_bytes_round_trip():
+    signature = minhash(np.arange(10, dtype=np.uint64))
+    assert np.array_equal(signature_from_bytes(signature_to_bytes(signature)), signature)
+    assert signature_to_bytes(None) is None
+    assert signature_from_bytes(b'') is None
+
+def test_weight_minhash_of_copied_weights_is_identical():
+    original = weight_minhash(ArrayStateDict(make_layers()))
+    renamed = weight_minhash(ArrayStateDict(
+        OrderedDict((f"wrapper.{name}", array) for name, array in make_layers().items())))
+    other = weight_minhash(ArrayStateDict(make_layers(1)))
+    assert np.array_equal(original, renamed)
+    assert minhash_similarity(original, other) < 0.1
+
+def test_tokenize_code_ignores_names_comments_and_constants():
+    source = "def train(model, lr=0.1):\n    # 训练\n    for x in range(10):\n        print(model, 'a')\n"
+    renamed = "def fit(net, rate=0.5):\n\n    for item in range(3):  # 改了名字\n        print(net, 'b')\n"
+    assert [value for value, _ in tokenize_code(source)] == [value for value, _ in tokenize_code(renamed)]
+    assert tokenize_code(source)[0] == ('def', 1)
+    # 有语法错误的代码保留出错位置之前的部分
+    assert tokenize_code("x = (1,\n")[:2] == [('V', 1), ('=', 1)]
+
+def test_lsh_index_pairs_similar_signatures():
+    base = minhash(np.arange(1000, dtype=np.uint64))
+    near = minhash(np.arange(10, 1010, dtype=np.uint64))
+    far = minhash(np.arange(5000, 6000, dtype=np.uint64))
+    index = LSHIndex(WEIGHT_LSH_BANDS)
+    for key, signature in ((3, near), (1, base), (2, far)):
+        index.add(key, signature)
+    assert index.candidate_pairs() == {(1, 3)}
+
+def test_lsh_index_skips_oversized_buckets():
+    signature = minhash(np.arange(100, dtype=np.uint64))
+    index = LSHIndex(WEIGHT_LSH_BANDS, max_bucket_size=3)
+    for key in range(4):
+        index.add(key, signature)
+    assert index.candidate_pairs() == set()
+    index = LSHIndex(WEIGHT_LSH_BANDS, max_bucket_size=None)
+    for key in range(4):
+        index.add(key, signature)
+    assert len(index.candidate_pairs()) == 6
+
+def test_winnow_selects_rightmost_window_minimum():
+    # Schleimer等人论文中的例子，窗口为4时选出 17 17 8 39 17
+    hashes = np.array([77, 74, 42, 17, 98, 50, 17, 98, 8, 88, 67, 39, 77, 74, 42, 17, 98], dtype=np.uint64)
+    positions = winnow(hashes, 4)
+    assert positions.tolist() == [3, 6, 8, 11, 15]
+    assert hashes[positions].tolist() == [17, 17, 8, 39, 17]
+
+def test_winnow_covers_every_window():
+    hashes = np.random.RandomState(0).randint(0, 50, size=200).astype(np.uint64)
+    selected = set(winnow(hashes, 4).tolist())
+    for start in range(hashes.size - 3):
+        assert selected & set(range(start, start + 4))
+    assert winnow(np.array([5, 3, 3], dtype=np.uint64), 4).tolist() == [2]
+    assert winnow(np.zeros(0, dtype=np.uint64)).size == 0
+
+def test_renamed_code_copy_is_found_with_line_ranges():
+    _, original = compute_code_fingerprints([TRAIN_SOURCE])
+    # 第一个文件太短没有指纹，抄袭的代码在提交的第二个文件中
+    _, copied = compute_code_fingerprints(['x = 1\n', COPIED_SOURCE])
+    result = compare_code_fingerprints(original, copied)
+    assert result['similarity'] == 100
+    assert result['overlap1'] == 100
+    assert result['overlap2'] < 100
+    assert len(result['blocks']) == 1
+    block = result['blocks'][0]
+    assert (block['file1'], block['file2']) == (0, 1)
+    assert block['lines2'] == [line + 3 for line in block['lines1']]
+    assert block['fingerprints'] == result['matched_fingerprints']
+
+def test_unrelated_and_ignored_code_is_not_similar():
+    _, original = compute_code_fingerprints([TRAIN_SOURCE])
+    _, copied = compute_code_fingerprints([COPIED_SOURCE])
+    _, other = compute_code_fingerprints([OTHER_SOURCE])
+    assert compare_code_fingerprints(original, other)['similarity'] == 0
+    ignored = set(int(value) for value in original['hash'])
+    assert compare_code_fingerprints(original, copied, ignored_hashes=ignored) == {
+        'similarity': 0.0, 'overlap1': 0.0, 'overlap2': 0.0, 'matched_fingerprints': 0, 'blocks': []
+    }
+
+def test_code_fingerprints_round_trip():
+    signature, fingerprints = compute_code_fingerprints([TRAIN_SOURCE])
+    assert signature is not None
+    assert np.array_equal(code_fingerprints_from_bytes(code_fingerprints_to_bytes(fingerprints)), fingerprints)
+    assert compute_code_fingerprints(['x = 1\n'])[0] is None
+
+def test_find_code_candidates_skips_common_code():
+    fingerprints = {key: compute_code_fingerprints([source])[1]
+                    for key, source in (('a', TRAIN_SOURCE), ('b', COPIED_SOURCE), ('c', OTHER_SOURCE))}
+    candidates, common = find_code_candidates(fingerprints, min_matches=5, common_limit=2)
+    assert list(candidates) == [('a', 'b')]
+    assert common == set()
+    # 三个提交都有的代码视为实验模板，不产生候选对
+    fingerprints['c'] = fingerprints['a']
+    candidates, common = find_code_candidates(fingerprints, min_matches=5, common_limit=2)
+    assert candidates == {}
+    assert common
+
+def test_minhash_similarity_matrix_matches_pairwise_similarity():
+    signatures = [minhash(np.arange(start, start + 200, dtype=np.uint64)) for start in (0, 20, 1000)]
+    items = [signatures[0], None, signatures[1], signatures[2]]
+    matrix = similarity_matrix(items, minhash_similarity_block, block_size=2)
+    assert matrix.dtype == np.float16
+    assert np.isnan(matrix[1]).all() and np.isnan(matrix[:, 1]).all()
+    present = [0, 2, 3]
+    for i, row in zip(present, signatures):
+        for j, column in zip(present, signatures):
+            assert matrix[i, j] == pytest.approx(minhash_similarity(row, column) * 100, abs=0.1)
+    assert np.isnan(similarity_matrix([None, None], minhash_similarity_block)).all()
+
+def test_code_similarity_matrix_matches_compare_code_fingerprints():
+    fingerprints = [compute_code_fingerprints([source])[1] for source in (TRAIN_SOURCE, COPIED_SOURCE, OTHER_SOURCE)]
+    hashes = [np.unique(item['hash']) for item in fingerprints]
+    matrix = similarity_matrix(hashes, code_similarity_block, block_size=2).astype(np.float32)
+    assert np.array_equal(matrix, matrix.T)
+    for i in range(3):
+        for j in range(3):
+            expected = compare_code_fingerprints(fingerprints[i], fingerprints[j])['similarity']
+            assert matrix[i, j] == pytest.approx(expected, abs=0.1)
+
+def test_top_neighbours_skips_self_and_missing():
+    matrix = np.array([
+        [100, 20, np.nan, 80],
+        [20, 100, 10, 5],
+        [np.nan, 10, 100, 40],
+        [80, 5, 40, 100],
+    ], dtype=np.float16)
+    assert top_neighbours(matrix, 0, 5) == [(3, 80.0), (1, 20.0)]
+    assert top_neighbours(matrix, 3, 1) == [(0, 80.0)]
+    assert top_neighbours(np.full((2, 2), np.nan, dtype=np.float16), 0, 3) == []
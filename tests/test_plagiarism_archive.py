@@ -0,0 +1,173 @@
+"""
+查重指纹归档测试：按提交记录和学生文件夹归档、归档接口、查重时与往届提交比对
+"""
+import os
+import shutil
+from datetime import datetime
+
+import pytest
+
+from conftest import REPO_DIR, TEST_EXPERIMENT_ID
+from plagiarism import academic_term
+
+LAB7_WEIGHTS = [
+    os.path.join(REPO_DIR, 'lab7', 'testcode', student, student + '.pth')
+    for student in ('2021064040401', '2022074080114')
+]
+
+ALICE_CODE = """import torch
+
+def train(model, loader, optimizer, epochs=5):
+    model.train()
+    for epoch in range(epochs):
+        for images, labels in loader:
+            optimizer.zero_grad()
+            loss = torch.nn.functional.cross_entropy(model(images), labels)
+            loss.backward()
+            optimizer.step()
+"""
+
+BOB_CODE = """import numpy as np
+
+def evaluate(weights, inputs):
+    hidden = np.maximum(inputs @ weights[0], 0)
+    return np.argmax(hidden @ weights[1], axis=1)
+"""
+
+def read_weights(index):
+    with open(LAB7_WEIGHTS[index], 'rb') as f:
+        return f.read()
+
+def write_student_dir(experiment_dir, student_number, weights, code):
+    """在实验目录 testcode/ 下写出没有提交记录的学生文件夹"""
+    student_dir = os.path.join(experiment_dir, 'testcode', student_number)
+    os.makedirs(student_dir)
+    with open(os.path.join(student_dir, student_number + '.pth'), 'wb') as f:
+        f.write(weights)
+    with open(os.path.join(student_dir, student_number + '.py'), 'w') as f:
+        f.write(code)
+    return student_dir
+
+@pytest.fixture
+def plagiarism_archive(app_module):
+    """归档命令行工具在导入时导入app，必须在app_module设置数据库之后导入"""
+    import plagiarism_archive
+    return plagiarism_archive
+
+def test_academic_term():
+    assert academic_term(datetime(2024, 3, 1)) == '2024春'
+    assert academic_term(datetime(2024, 7, 31)) == '2024春'
+    assert academic_term(datetime(2024, 9, 1)) == '2024秋'
+    assert academic_term(datetime(2025, 1, 10)) == '2024秋'
+    assert academic_term(None) is None
+
+def test_archive_experiment_covers_submissions_and_leftover_directories(app_module, experiment):
+    A = app_module
+    alice = experiment.add_submission('alice', ALICE_CODE, {'alice.pth': read_weights(0)})
+    # 导入的往届学生文件夹没有提交记录，文件夹名视为学号
+    write_student_dir(experiment.lab_dir, '2020000001', read_weights(1), BOB_CODE)
+
+    result = A.archive_experiment(experiment.experiment, '2024秋')
+    assert result == {'archived_submissions': 1, 'archived_directories': 1, 'failed': 0, 'term': '2024秋'}
+
+    submitted = A.PlagiarismFingerprint.query.filter_by(submission_id=alice.submission_id).one()
+    assert (submitted.experiment_id, submitted.term, submitted.student_number) == (TEST_EXPERIMENT_ID, '2024秋', 'alice')
+    assert submitted.weight_file == 'alice.pth' and submitted.weight_error is None
+    assert submitted.weight_minhash is not None and submitted.code_minhash is not None
+    assert A.PlagiarismCodeFingerprint.query.get(submitted.fingerprint_id).get_files() == ['alice.py']
+
+    leftover = A.PlagiarismFingerprint.query.filter_by(submission_id=None).one()
+    assert (leftover.experiment_id, leftover.student_number, leftover.term) == (TEST_EXPERIMENT_ID, '2020000001', '2024秋')
+
+    # 内容不变时再次归档不重新计算签名
+    created_at = submitted.created_at
+    assert A.archive_experiment(experiment.experiment, '2024秋')['archived_submissions'] == 1
+    assert A.PlagiarismFingerprint.query.count() == 2
+    assert A.PlagiarismFingerprint.query.filter_by(submission_id=alice.submission_id).one().created_at == created_at
+
+def test_archive_directory_outside_app_has_no_experiment_id(app_module, plagiarism_archive, tmp_path):
+    A = app_module
+    experiment_dir = str(tmp_path / 'lab11')
+    write_student_dir(experiment_dir, '2019000001', read_weights(0), ALICE_CODE)
+    # 没有pth文件和Python代码的文件夹不归档
+    os.makedirs(os.path.join(experiment_dir, 'testcode', 'empty'))
+
+    assert plagiarism_archive.archive_directory(experiment_dir, term='2019秋', experiment_name='卷积神经网络实验') == 1
+    fingerprint = A.PlagiarismFingerprint.query.one()
+    assert fingerprint.experiment_id is None
+    assert (fingerprint.experiment_name, fingerprint.term) == ('卷积神经网络实验', '2019秋')
+    assert plagiarism_archive.archive_directory(str(tmp_path / 'missing')) == 0
+
+def test_compare_archived_fingerprints_flags_identical_file_and_same_student(app_module, tmp_path):
+    A = app_module
+    experiment_dir = str(tmp_path / 'lab11')
+    write_student_dir(experiment_dir, '2019000001', read_weights(0), ALICE_CODE)
+    write_student_dir(experiment_dir, '2019000002', read_weights(1), BOB_CODE)
+    A.archive_experiment_directory(experiment_dir, term='2019秋')
+    first, second = A.PlagiarismFingerprint.query.order_by(A.PlagiarismFingerprint.student_number).all()
+
+    match = A.compare_archived_fingerprints(first, first)
+    assert match['identical_file'] and match['same_student']
+    assert (match['weight_similarity'], match['code_similarity']) == (100.0, 100.0)
+
+    match = A.compare_archived_fingerprints(first, second)
+    assert not match['identical_file'] and not match['same_student']
+    assert match['weight_similarity'] < 90 and match['code_similarity'] < 50
+    assert (match['student_number'], match['term']) == ('2019000002', '2019秋')
+
+def test_archive_endpoint_archives_and_counts_by_term(app_module, experiment):
+    A = app_module
+    experiment.add_submission('alice', ALICE_CODE, {'alice.pth': read_weights(0)})
+    client = A.app.test_client()
+    headers = {'User-ID': str(experiment.teacher.user_id)}
+
+    response = client.post('/teacher/plagiarism/archive', json={'experiment_id': TEST_EXPERIMENT_ID, 'term': '2024春'},
+                           headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['data']['archived_submissions'] == 1
+
+    data = client.get('/teacher/plagiarism/archive', headers=headers).get_json()['data']
+    assert data['total'] == 1
+    assert data['experiments'] == [
+        {'term': '2024春', 'experiment_id': TEST_EXPERIMENT_ID, 'experiment_name': '测试实验', 'count': 1}
+    ]
+
+    other = A.User(username='other', password='x', user_type=A.UserType.TEACHER, email='o@example.com')
+    A.db.session.add(other)
+    A.db.session.commit()
+    response = client.post('/teacher/plagiarism/archive', json={'experiment_id': TEST_EXPERIMENT_ID},
+                           headers={'User-ID': str(other.user_id)})
+    assert response.status_code == 403
+    assert client.post('/teacher/plagiarism/archive', json={}, headers=headers).status_code == 400
+
+def test_check_plagiarism_matches_previous_term_archive(app_module, plagiarism_archive, experiment, tmp_path):
+    A = app_module
+    alice = experiment.add_submission('alice', ALICE_CODE, {'alice.pth': read_weights(0)})
+    experiment.add_submission('bob', BOB_CODE, {'bob.pth': read_weights(1)})
+    # 往届的同一个权重文件，归档后删除往届目录：比对只使用归档的签名
+    previous_dir = str(tmp_path / 'lab3')
+    write_student_dir(previous_dir, '2019000001', read_weights(0), BOB_CODE)
+    plagiarism_archive.archive_directory(previous_dir, term='2019秋', experiment_name='往届实验')
+    shutil.rmtree(previous_dir)
+
+    response = A.app.test_client().post(
+        '/teacher/experiment/check-plagiarism',
+        json={'experiment_id': TEST_EXPERIMENT_ID, 'include_archive': True},
+        headers={'User-ID': str(experiment.teacher.user_id)}
+    )
+    data = response.get_json()['data']
+    assert data['archived_count'] == 1
+    results = {result['student_id']: result for result in data['results']}
+
+    alice_result = results[alice.student_id]
+    [match] = alice_result['archive_matches']
+    assert match['identical_file'] and match['weight_similarity'] == 100.0
+    assert (match['experiment_id'], match['experiment_name'], match['term'], match['student_number']) == \
+        (None, '往届实验', '2019秋', '2019000001')
+    assert not match['same_student']
+    assert alice_result['archive_risk_level'] == '完全重复'
+
+    # 查重时当前实验的提交也写入归档，不与本实验的指纹比对
+    assert A.PlagiarismFingerprint.query.filter_by(experiment_id=TEST_EXPERIMENT_ID).count() == 2
+    assert all(not match['identical_file'] for result in data['results'] if result['student_id'] != alice.student_id
+               for match in result['archive_matches'])
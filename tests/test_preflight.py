@@ -0,0 +1,111 @@
+"""
+提交预检测试：入口文件定位和AST静态检查
+"""
+import glob
+import os
+
+import pytest
+
+from preflight import check_entry_file, locate_entry_file, format_preflight_errors
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def write_submission(directory, source, name='2021000000001.py', files=()):
+    directory.mkdir(parents=True, exist_ok=True)
+    for file_name in files:
+        (directory / file_name).write_bytes(b'')
+    path = directory / name
+    path.write_text(source, encoding='utf-8')
+    return str(path)
+
+def error_codes(report):
+    return [issue['code'] for issue in report['errors']]
+
+@pytest.mark.parametrize('entry_file', sorted(glob.glob(os.path.join(REPO_DIR, 'lab7', 'testcode', '*', '*.py'))))
+def test_sample_submissions_pass(entry_file):
+    report = check_entry_file(entry_file)
+    assert report['passed'], report['errors']
+    assert report['entry_function'] == 'evaluate_model'
+
+def test_entry_function_follows_evaluation_order(tmp_path):
+    path = write_submission(tmp_path, "def predict():\n    pass\n\ndef build_model():\n    pass\n", files=['model.pth'])
+    report = check_entry_file(path)
+    assert report['passed']
+    assert report['entry_function'] == 'build_model'
+    assert report['warnings'] == []
+
+def test_build_model_without_weights_is_a_warning(tmp_path):
+    report = check_entry_file(write_submission(tmp_path, "def build_model():\n    pass\n"))
+    assert report['passed']
+    assert [issue['code'] for issue in report['warnings']] == ['missing_weights']
+
+def test_legacy_script_writing_predictions_passes(tmp_path):
+    report = check_entry_file(write_submission(tmp_path, "open('all_preds.csv', 'w').write('1')\n"))
+    assert report['passed']
+    assert report['entry_function'] is None
+
+def test_missing_entry_function(tmp_path):
+    report = check_entry_file(write_submission(tmp_path, "x = 1\n"))
+    assert error_codes(report) == ['missing_entry_function']
+
+def test_syntax_error_and_missing_file(tmp_path):
+    report = check_entry_file(write_submission(tmp_path, "def evaluate_model(:\n"))
+    assert error_codes(report) == ['syntax_error']
+    assert '第1行' in report['errors'][0]['message']
+    assert error_codes(check_entry_file(str(tmp_path / 'missing.py'))) == ['missing_entry']
+
+def test_disallowed_imports_and_calls(tmp_path):
+    source = (
+        "import os\n"
+        "import subprocess\n"
+        "from urllib import request\n"
+        "from http.client import HTTPConnection\n"
+        "def evaluate_model():\n"
+        "    os.system('ls')\n"
+    )
+    report = check_entry_file(write_submission(tmp_path, source))
+    assert not report['passed']
+    assert [(issue['code'], issue['line']) for issue in report['errors']] == [
+        ('disallowed_import', 2), ('disallowed_import', 3), ('disallowed_import', 4), ('disallowed_call', 6)
+    ]
+    assert format_preflight_errors(report).startswith('预检未通过: 第2行导入了评测环境禁止使用的模块 subprocess')
+
+def test_missing_weight_file_is_resolved_through_variables(tmp_path):
+    source = (
+        "import torch\n"
+        "MODEL_PATH = 'best.pth'\n"
+        "def evaluate_model():\n"
+        "    torch.load('model.pth')\n"
+        "    torch.load(MODEL_PATH)\n"
+    )
+    report = check_entry_file(write_submission(tmp_path, source, files=['model.pth']))
+    assert [(issue['code'], issue['line']) for issue in report['errors']] == [('missing_weights', 5)]
+    assert 'model.pth' in report['errors'][0]['message']
+
+def test_absolute_paths_outside_docstrings(tmp_path):
+    source = (
+        "def evaluate_model():\n"
+        "    '''C:\\\\data\\\\mnist'''\n"
+        "    a = 'C:\\\\Users\\\\me\\\\data'\n"
+        "    b = '~/datasets/mnist'\n"
+        "    c = '/nonexistent-dir-for-preflight/testdata'\n"
+        "    d = '../../testdata'\n"
+    )
+    report = check_entry_file(write_submission(tmp_path, source))
+    assert [(issue['code'], issue['line']) for issue in report['errors']] == [
+        ('absolute_path', 3), ('absolute_path', 4), ('absolute_path', 5)
+    ]
+
+def test_locate_entry_file(tmp_path):
+    helper = write_submission(tmp_path, "def helper():\n    pass\n", name='utils.py')
+    main = write_submission(tmp_path, "def evaluate_model():\n    pass\n", name='main.py')
+    nested = write_submission(tmp_path / 'src', "def predict():\n    pass\n", name='model.py')
+    named = write_submission(tmp_path, "x = 1\n", name='2021000000001.py')
+    assert locate_entry_file([helper, main, nested, named], '2021000000001') == (named, None)
+    assert locate_entry_file([helper, nested, main]) == (main, None)
+    assert locate_entry_file([helper]) == (helper, None)
+    other = write_submission(tmp_path, "y = 2\n", name='other.py')
+    entry_file, message = locate_entry_file([helper, other])
+    assert entry_file is None
+    assert 'other.py, utils.py' in message
+    assert locate_entry_file([]) == (None, "提交文件夹中没有找到Python文件")
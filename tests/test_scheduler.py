@@ -0,0 +1,116 @@
+"""
+评测调度器测试：槽位分配顺序和队列关闭
+"""
+import threading
+import time
+
+from evaluation import run_student_evaluations
+from scheduler import EvaluationScheduler, PRIORITY_SINGLE, PRIORITY_NORMAL, PRIORITY_BACKGROUND
+
+def add_task(queue, enqueued_at=None):
+    """直接放入等待的评测，不启动槽位线程，用于单独测试_select_queue"""
+    queue.tasks.append((time.time() if enqueued_at is None else enqueued_at, None, None, ()))
+
+def test_select_queue_prefers_priority():
+    scheduler = EvaluationScheduler(4)
+    background = scheduler.open_queue('upload', owner='a', priority=PRIORITY_BACKGROUND)
+    normal = scheduler.open_queue('batch', owner='a', priority=PRIORITY_NORMAL)
+    single = scheduler.open_queue('single', owner='b', priority=PRIORITY_SINGLE)
+    add_task(background, 1.0)
+    add_task(normal, 2.0)
+    assert scheduler._select_queue() is normal
+    add_task(single, 3.0)
+    assert scheduler._select_queue() is single
+
+def test_select_queue_prefers_teacher_with_fewer_running():
+    scheduler = EvaluationScheduler(4)
+    busy = scheduler.open_queue(1, owner='busy')
+    idle = scheduler.open_queue(2, owner='idle')
+    add_task(busy, 1.0)
+    add_task(idle, 2.0)
+    scheduler._owner_running['busy'] = 2
+    assert scheduler._select_queue() is idle
+
+def test_select_queue_rotates_between_teachers_and_experiments():
+    scheduler = EvaluationScheduler(4)
+    first = scheduler.open_queue(1, owner='a')
+    second = scheduler.open_queue(2, owner='b')
+    add_task(first, 1.0)
+    add_task(second, 2.0)
+    assert scheduler._select_queue() is first
+    scheduler._owner_dispatched['a'] = 10.0
+    assert scheduler._select_queue() is second
+
+    # 同一教师的两个实验按上次分到槽位的时间轮转
+    scheduler = EvaluationScheduler(4)
+    first = scheduler.open_queue(1, owner='a')
+    second = scheduler.open_queue(2, owner='a')
+    add_task(first, 1.0)
+    add_task(second, 2.0)
+    first.last_dispatched = 10.0
+    assert scheduler._select_queue() is second
+
+def test_select_queue_respects_max_running():
+    scheduler = EvaluationScheduler(4)
+    limited = scheduler.open_queue(1, owner='a', max_running=1)
+    assert scheduler._select_queue() is None
+    add_task(limited)
+    limited.running = 1
+    assert scheduler._select_queue() is None
+
+def test_slots_alternate_between_teachers():
+    scheduler = EvaluationScheduler(1)
+    order = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    blocker = scheduler.open_queue('blocker', owner='z')
+    blocker_future = blocker.submit(block)
+    assert started.wait(5)
+    first = scheduler.open_queue(1, owner='a')
+    second = scheduler.open_queue(2, owner='b')
+    futures = [first.submit(order.append, f"a{i}") for i in range(3)]
+    futures += [second.submit(order.append, f"b{i}") for i in range(3)]
+    release.set()
+    for future in [blocker_future] + futures:
+        future.result(5)
+    assert order == ['a0', 'b0', 'a1', 'b1', 'a2', 'b2']
+    assert scheduler.stats()['running'] == 0
+
+def test_close_queue_cancels_pending_evaluations():
+    scheduler = EvaluationScheduler(1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+        return 'done'
+
+    queue = scheduler.open_queue(1, owner='a', label='实验1')
+    running = queue.submit(block)
+    assert started.wait(5)
+    pending = queue.submit(lambda: 'never')
+    # 关闭时正在运行的评测继续执行，尚未开始的评测被取消
+    queue.shutdown(wait=False)
+    assert pending.cancelled()
+    assert [item['depth'] for item in scheduler.stats()['queues']] == [0]
+    release.set()
+    assert running.result(5) == 'done'
+    for _ in range(50):
+        if not scheduler.stats()['queues']:
+            break
+        time.sleep(0.1)
+    assert scheduler.stats()['queues'] == []
+
+def test_queue_is_closed_when_every_item_was_cached():
+    # 全部学生命中缓存或预检未通过时没有需要评测的文件，任务的队列也要从调度器中移除
+    scheduler = EvaluationScheduler(2)
+    queue = scheduler.open_queue(1, owner='a', label='实验1')
+    assert run_student_evaluations([], executor=queue) == []
+    assert queue.closed
+    assert scheduler.stats()['queues'] == []
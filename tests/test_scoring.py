@@ -0,0 +1,172 @@
+"""
+评分模块测试：CSV解析、表头识别、真实标签缓存、数量不匹配提示和向量化指标
+"""
+import os
+
+import numpy as np
+import pytest
+
+import scoring
+from scoring import (load_label_file, load_prediction_file, load_cached_labels, invalidate_labels_cache,
+                     describe_count_mismatch, compute_metrics, parse_metrics)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def write_lines(path, lines, encoding='utf-8'):
+    path.write_bytes('\n'.join(lines).encode(encoding))
+    return str(path)
+
+def test_parse_metrics_always_includes_accuracy():
+    assert parse_metrics(None) == ['accuracy']
+    assert parse_metrics('per_class, bogus,top_k') == ['accuracy', 'per_class', 'top_k']
+    assert parse_metrics(['confusion_matrix', 'accuracy']) == ['confusion_matrix', 'accuracy']
+
+def test_load_label_file_detects_text_header(tmp_path):
+    values, has_header = load_label_file(write_lines(tmp_path / 'preds.csv', ['label', '1', '2', '3']))
+    assert has_header
+    assert values.dtype == np.int64
+    assert values.tolist() == [1, 2, 3]
+
+def test_load_label_file_keeps_numeric_first_row(tmp_path):
+    # pandas默认的列名"0"与预测类别0无法区分，自动识别时不视为表头
+    values, has_header = load_label_file(write_lines(tmp_path / 'preds.csv', ['0', '1', '2']))
+    assert not has_header
+    assert values.tolist() == [0, 1, 2]
+
+def test_load_label_file_fixed_header_and_first_column(tmp_path):
+    values, has_header = load_label_file(write_lines(tmp_path / 'labels.csv', ['0,name', '4,a', '5,b']), header=True)
+    assert has_header
+    assert values.tolist() == [4, 5]
+
+def test_load_label_file_decodes_utf16_bom(tmp_path):
+    path = tmp_path / 'preds.csv'
+    path.write_bytes('\ufefflabel\r\n7\r\n8\r\n'.encode('utf-16-le'))
+    values, has_header = load_label_file(str(path))
+    assert has_header
+    assert values.tolist() == [7, 8]
+
+def test_load_label_file_keeps_float_values(tmp_path):
+    values, _ = load_label_file(write_lines(tmp_path / 'preds.csv', ['0.5', '1']))
+    assert values.dtype == np.float64
+
+def test_cached_labels_are_parsed_once_and_read_only(tmp_path, monkeypatch):
+    path = write_lines(tmp_path / 'all_labels.csv', ['label', '1', '2'])
+    first = load_cached_labels(path)
+    monkeypatch.setattr(scoring, 'load_label_file', lambda *args, **kwargs: pytest.fail('标签文件被重复解析'))
+    assert load_cached_labels(path) is first
+    assert first.tolist() == [1, 2]
+    with pytest.raises(ValueError):
+        first[0] = 5
+
+def test_cached_labels_are_reparsed_when_the_file_changes(tmp_path):
+    path = write_lines(tmp_path / 'all_labels.csv', ['label', '1', '2'])
+    first = load_cached_labels(path)
+    write_lines(tmp_path / 'all_labels.csv', ['label', '3', '4'])
+    stat = os.stat(path)
+    # 保证修改时间不同，不依赖文件系统的时间精度
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    second = load_cached_labels(path)
+    assert second is not first
+    assert second.tolist() == [3, 4]
+    invalidate_labels_cache(path)
+    assert load_cached_labels(path) is not second
+
+def test_load_prediction_file_npy_probabilities(tmp_path):
+    probabilities = np.array([[0.1, 0.9], [0.8, 0.2], [0.3, 0.7]], dtype=np.float32)
+    path = tmp_path / 'all_preds.npy'
+    np.save(str(path), probabilities)
+    predictions, has_header, loaded = load_prediction_file(str(path))
+    assert not has_header
+    assert predictions.tolist() == [1, 0, 1]
+    assert loaded.shape == (3, 2)
+
+def test_load_prediction_file_npz(tmp_path):
+    path = tmp_path / 'all_preds.npz'
+    np.savez(str(path), preds=np.array([2, 1]), probs=np.eye(3)[[2, 1]])
+    predictions, _, probabilities = load_prediction_file(str(path))
+    assert predictions.tolist() == [2, 1]
+    assert probabilities.shape == (2, 3)
+
+    empty = tmp_path / 'empty.npz'
+    np.savez(str(empty), other=np.zeros(2))
+    with pytest.raises(ValueError):
+        load_prediction_file(str(empty))
+
+def test_load_prediction_file_csv_always_skips_first_row(tmp_path):
+    # df.to_csv(index=False) 写出的列名"0"与pandas.read_csv一样作为表头跳过
+    predictions, has_header, probabilities = load_prediction_file(
+        write_lines(tmp_path / 'all_preds.csv', ['0', '7', '2']))
+    assert has_header
+    assert predictions.tolist() == [7, 2]
+    assert probabilities is None
+    predictions, _, _ = load_prediction_file(write_lines(tmp_path / 'all_preds.csv', ['label', '1']))
+    assert predictions.tolist() == [1]
+
+@pytest.mark.parametrize('student_dir, accuracy', [
+    ('lab11/testcode/2022224110907', 98.75),
+    ('lab13/testcode/2021064040401', 95.91),
+    ('lab16/testcode/2022074080114', 67.58),
+])
+def test_sample_submission_predictions_are_graded(student_dir, accuracy):
+    # 仓库中的示例提交都用 df.to_csv('all_preds.csv', index=False) 写出预测结果
+    directory = os.path.join(REPO_DIR, *student_dir.split('/'))
+    predictions, has_header, _ = load_prediction_file(os.path.join(directory, 'all_preds.csv'))
+    labels, _ = load_label_file(os.path.join(directory, 'all_labels.csv'), header=True)
+    assert has_header
+    assert len(predictions) == len(labels) == 10000
+    assert compute_metrics(predictions, labels)['accuracy'] == accuracy
+
+def test_describe_count_mismatch_hints_at_missing_header():
+    message = describe_count_mismatch(9, 10, True)
+    assert '预测结果数量(9)与真实标签数量(10)不匹配' in message
+    assert 'to_csv(index=False)' in message
+    # 没有跳过表头或相差不止一行时只报告数量
+    assert describe_count_mismatch(9, 10, False) == '预测结果数量(9)与真实标签数量(10)不匹配'
+    assert describe_count_mismatch(11, 10, True) == '预测结果数量(11)与真实标签数量(10)不匹配'
+
+def test_compute_metrics_accuracy():
+    result = compute_metrics([1, 2, 3, 4], [1, 2, 0, 4])
+    assert result == {'accuracy': 75.0, 'correct': 3, 'total': 4}
+
+def test_compute_metrics_rejects_length_mismatch():
+    with pytest.raises(ValueError):
+        compute_metrics([1, 2, 3], [1, 2])
+
+def test_compute_metrics_per_class_and_confusion_matrix():
+    labels = [0, 0, 1, 1, 2]
+    predictions = [0, 1, 1, 1, 0]
+    result = compute_metrics(predictions, labels, ['per_class', 'confusion_matrix'])
+    assert result['accuracy'] == 60.0
+    assert result['confusion_matrix'] == {
+        'classes': [0, 1, 2],
+        'matrix': [[1, 1, 0], [0, 2, 0], [1, 0, 0]]
+    }
+    per_class = {row['class']: row for row in result['per_class']}
+    assert per_class[0] == {'class': 0, 'precision': 0.5, 'recall': 0.5, 'f1': 0.5, 'support': 2}
+    assert per_class[1]['precision'] == pytest.approx(0.6667, abs=1e-4)
+    assert per_class[1]['recall'] == 1.0
+    assert per_class[2] == {'class': 2, 'precision': 0.0, 'recall': 0.0, 'f1': 0.0, 'support': 1}
+    assert result['macro_f1'] == pytest.approx((0.5 + 0.8 + 0.0) / 3, abs=1e-4)
+
+def test_compute_metrics_counts_predicted_only_classes():
+    # 只出现在预测中的类别没有support，不参与宏平均F1
+    result = compute_metrics([5, 1], [1, 1], ['per_class'])
+    classes = [row['class'] for row in result['per_class']]
+    assert classes == [1, 5]
+    assert result['macro_f1'] == pytest.approx(2 * 0.5 / 1.5, abs=1e-4)
+
+def test_compute_metrics_top_k():
+    probabilities = np.array([
+        [0.5, 0.3, 0.2],
+        [0.6, 0.3, 0.1],
+        [0.1, 0.2, 0.7],
+    ])
+    labels = [0, 2, 1]
+    result = compute_metrics(np.argmax(probabilities, axis=1), labels, ['top_k'], probabilities, top_k=2)
+    assert result['accuracy'] == pytest.approx(33.33)
+    assert result['top_k'] == {'k': 2, 'accuracy': pytest.approx(66.67)}
+
+def test_compute_metrics_skips_top_k_without_matching_probabilities():
+    result = compute_metrics([0, 1], [0, 1], ['top_k'], np.zeros((3, 2)))
+    assert 'top_k' not in result
+    assert 'top_k' not in compute_metrics([0, 1], [0, 1], ['top_k'])
@@ -0,0 +1,88 @@
+"""
+提交清单测试：上传时计算的入口文件、文件哈希和预检结果，以及目录修改时间的快速检查和重新计算
+"""
+import hashlib
+import os
+
+import pytest
+
+from conftest import student_code
+
+def touch_dir(path):
+    """把目录的修改时间推后1秒：文件系统的时间戳精度可能不足以区分测试中紧接着的两次修改"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+@pytest.fixture
+def submission(experiment):
+    return experiment.add_submission('alice', student_code(experiment.labels), files={'alice.pth': b'weights'})
+
+def test_manifest_records_entry_hashes_and_preflight(app_module, submission):
+    student_dir = submission.file_path
+    with open(os.path.join(student_dir, 'all_preds.csv'), 'w') as f:
+        f.write('0\n')
+    manifest = app_module.build_submission_manifest(submission.experiment_id, submission)
+    assert (manifest.entry_file, manifest.entry_function) == ('alice.py', 'evaluate_model')
+    # 评测写出的预测结果不属于学生提交
+    assert [file['path'] for file in manifest.get_files()] == ['alice.pth', 'alice.py']
+    assert manifest.get_files()[0]['sha256'] == hashlib.sha256(b'weights').hexdigest()
+    assert manifest.get_weight_files() == [os.path.join(student_dir, 'alice.pth')]
+
+    data = app_module.app.test_client().get(f'/api/submissions/{submission.submission_id}/manifest').get_json()['data']
+    assert data['preflight']['passed']
+    assert data['weight_files'] == ['alice.pth']
+
+def test_unchanged_submission_is_not_rescanned(app_module, submission, monkeypatch):
+    manifest = app_module.get_submission_manifest(submission.experiment_id, submission)
+    monkeypatch.setattr(app_module, 'list_submission_files', lambda *args: pytest.fail('提交文件夹被重新扫描'))
+    monkeypatch.setattr(app_module, 'hash_file', lambda *args: pytest.fail('提交文件被重新计算哈希'))
+    for _ in range(3):
+        assert app_module.get_submission_manifest(submission.experiment_id, submission) is manifest
+
+def test_untracked_output_only_refreshes_directory_mtimes(app_module, submission):
+    manifest = app_module.get_submission_manifest(submission.experiment_id, submission)
+    created_at = manifest.created_at
+    with open(os.path.join(submission.file_path, 'loss.png'), 'wb') as f:
+        f.write(b'png')
+    touch_dir(submission.file_path)
+    assert not manifest.is_current()
+    assert manifest.files_unchanged()
+
+    refreshed = app_module.get_submission_manifest(submission.experiment_id, submission)
+    assert refreshed.created_at == created_at
+    assert refreshed.is_current()
+
+def test_new_code_rebuilds_the_manifest(app_module, submission):
+    app_module.get_submission_manifest(submission.experiment_id, submission)
+    with open(os.path.join(submission.file_path, 'model.py'), 'w') as f:
+        f.write('LAYERS = 2\n')
+    touch_dir(submission.file_path)
+    manifest = app_module.get_submission_manifest(submission.experiment_id, submission)
+    assert 'model.py' in [file['path'] for file in manifest.get_files()]
+    assert manifest.is_current()
+
+def test_files_unchanged_detects_rewritten_weights(app_module, submission):
+    manifest = app_module.get_submission_manifest(submission.experiment_id, submission)
+    weights = os.path.join(submission.file_path, 'alice.pth')
+    with open(weights, 'wb') as f:
+        f.write(b'retrained')
+    stat = os.stat(weights)
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert not manifest.files_unchanged()
+    # 原地改写文件不改变目录的修改时间，重新上传时由上传接口重新计算清单
+    rebuilt = app_module.build_submission_manifest(submission.experiment_id, submission)
+    assert rebuilt.get_files()[0]['sha256'] == hashlib.sha256(b'retrained').hexdigest()
+
+def test_old_manifest_table_gains_dir_mtimes(app_module, submission):
+    db = app_module.db
+    app_module.build_submission_manifest(submission.experiment_id, submission)
+    db.session.remove()
+    with db.engine.begin() as connection:
+        connection.execute(db.text("ALTER TABLE submission_manifests DROP COLUMN dir_mtimes"))
+
+    app_module.create_tables()
+    # 旧清单没有记录目录修改时间，逐个比较文件后补上，不重新计算
+    manifest = app_module.SubmissionManifest.query.get(submission.submission_id)
+    assert manifest.dir_mtimes is None and not manifest.is_current()
+    assert app_module.get_submission_manifest(submission.experiment_id, submission) is manifest
+    assert manifest.is_current()